@@ -0,0 +1,322 @@
+from abc import ABC, abstractmethod
+from .seed import COLLECTIONS, DESCRIPTION_VALUES
+
+
+class OperationError(Exception):
+    pass
+
+
+LOGIN_MUTATION = '''
+    mutation Login($username: String!, $password: String!) {
+        login(username: $username, password: $password) { token }
+    }
+'''
+
+CREATE_CART_MUTATION = '''
+    mutation CreateCart {
+        createCart(name: "benchmark") { cart { id } }
+    }
+'''
+
+PRODUCTS_QUERY = '''
+    query Products($first: Int, $collection: String, $priceLt: Float, $brand: String,
+                   $orderBy: String, $search: String) {
+        products(first: $first, collection_Title: $collection, price_Lt: $priceLt,
+                 brand: $brand, orderBy: $orderBy, search: $search) {
+            edges {
+                node {
+                    index
+                    title
+                    price
+                    effectivePrice
+                    image
+                    productsCollectionCount
+                    collection { title }
+                    promotions { discount }
+                }
+            }
+            facets { key values { value count } }
+            pageInfo { hasNextPage endCursor }
+        }
+    }
+'''
+
+FULL_PRODUCTS_QUERY = '''
+    query FullProducts($first: Int) {
+        fullProducts(first: $first) {
+            edges {
+                node {
+                    title
+                    price
+                    collection { title }
+                    promotions { discount }
+                    tags { label }
+                }
+            }
+        }
+    }
+'''
+
+PRODUCT_QUERY = '''
+    query Product($id: Int) {
+        product(id: $id) {
+            title
+            description
+            price
+            inventory
+            images
+            collection { title }
+            promotions { description discount }
+        }
+    }
+'''
+
+CART_QUERY = '''
+    query Cart($id: UUID) {
+        cart(id: $id) {
+            totalPrice
+            itemsNumber
+            appliedPromotions { discount }
+            items {
+                index
+                quantity
+                totalPrice
+                product { title price images }
+            }
+        }
+    }
+'''
+
+ADD_TO_CART_MUTATION = '''
+    mutation AddToCart($cartId: UUID!, $productId: Int!, $quantity: Int!) {
+        createCartItem(cartId: $cartId, productId: $productId, quantity: $quantity) {
+            cartItem { index quantity }
+        }
+    }
+'''
+
+UPDATE_CART_ITEM_MUTATION = '''
+    mutation UpdateCartItem($id: ID, $quantity: Int!) {
+        updateCartItem(id: $id, quantity: $quantity) { cartItem { quantity } }
+    }
+'''
+
+CREATE_ORDER_MUTATION = '''
+    mutation CreateOrder($customerId: Int!, $cartId: UUID!) {
+        createOrder(customerId: $customerId, cartId: $cartId) { order { id } }
+    }
+'''
+
+ORDERS_QUERY = '''
+    query Orders {
+        orders {
+            id
+            paymentStatus
+            customer { phone }
+            items { quantity unitPrice product { title } }
+        }
+    }
+'''
+
+CUSTOMERS_QUERY = '''
+    query Customers {
+        customers { phone birthDate userId }
+    }
+'''
+
+SEARCH_TERMS = ('hp i5', 'lenovo 16 go', 'gamer rtx', 'ryzen ssd', 'dell all in one', 'msi gtx')
+
+
+class Session:
+    # State of one simulated client: its token, cart and random generator
+    def __init__(self, transport, rng, username, password, customer_id, product_ids):
+        self.transport = transport
+        self.rng = rng
+        self.username = username
+        self.password = password
+        self.customer_id = customer_id
+        self.product_ids = product_ids
+        self.token = None
+        self.cart_id = None
+        self.cart_item_ids = []
+
+    def execute(self, query, variables=None, authenticated=False):
+        headers = {}
+        if authenticated:
+            if self.token is None:
+                self.login()
+            headers['Authorization'] = f'JWT {self.token}'
+        result = self.transport.execute(query, variables, headers)
+        if result.get('errors'):
+            raise OperationError(result['errors'][0].get('message'))
+        return result['data']
+
+    def login(self):
+        data = self.transport.execute(
+            LOGIN_MUTATION, {'username': self.username, 'password': self.password}, {})
+        if data.get('errors'):
+            raise OperationError(data['errors'][0].get('message'))
+        self.token = data['data']['login']['token']
+
+    def random_product_id(self):
+        return self.rng.choice(self.product_ids)
+
+    def ensure_cart(self, items=0):
+        if self.cart_id is None:
+            data = self.execute(CREATE_CART_MUTATION)
+            self.cart_id = data['createCart']['cart']['id']
+            self.cart_item_ids = []
+        while len(self.cart_item_ids) < items:
+            self.add_to_cart()
+
+    def add_to_cart(self):
+        data = self.execute(ADD_TO_CART_MUTATION, {
+            'cartId': self.cart_id,
+            'productId': self.random_product_id(),
+            'quantity': self.rng.randrange(1, 3),
+        })
+        item_id = data['createCartItem']['cartItem']['index']
+        if item_id not in self.cart_item_ids:
+            self.cart_item_ids.append(item_id)
+
+
+class Operation(ABC):
+    # prepare() is not timed, run() sends exactly one timed request
+    name = None
+    weight = 1
+    admin = False
+
+    def prepare(self, session):
+        pass
+
+    @abstractmethod
+    def run(self, session):
+        pass
+
+
+class ProductListing(Operation):
+    name = 'product_listing'
+    weight = 30
+
+    def run(self, session):
+        rng = session.rng
+        variables = {'first': 20, 'orderBy': rng.choice(('title', 'price', '-price'))}
+        if rng.random() < 0.6:
+            variables['collection'] = rng.choice(COLLECTIONS[:3])
+        if rng.random() < 0.3:
+            variables['brand'] = rng.choice(DESCRIPTION_VALUES['brand'])
+        if rng.random() < 0.3:
+            variables['priceLt'] = rng.randrange(1000, 6000)
+        session.execute(PRODUCTS_QUERY, variables)
+
+
+class ProductSearch(Operation):
+    name = 'product_search'
+    weight = 10
+
+    def run(self, session):
+        session.execute(PRODUCTS_QUERY, {
+            'first': 20,
+            'search': session.rng.choice(SEARCH_TERMS),
+        })
+
+
+class FullProductListing(Operation):
+    name = 'full_product_listing'
+    weight = 10
+
+    def run(self, session):
+        session.execute(FULL_PRODUCTS_QUERY, {'first': 20})
+
+
+class ProductDetail(Operation):
+    name = 'product_detail'
+    weight = 20
+
+    def run(self, session):
+        session.execute(PRODUCT_QUERY, {'id': session.random_product_id()})
+
+
+class CartAdd(Operation):
+    name = 'cart_add'
+    weight = 8
+
+    def prepare(self, session):
+        session.ensure_cart()
+
+    def run(self, session):
+        session.add_to_cart()
+
+
+class CartUpdate(Operation):
+    name = 'cart_update'
+    weight = 4
+
+    def prepare(self, session):
+        session.ensure_cart(items=1)
+
+    def run(self, session):
+        session.execute(UPDATE_CART_ITEM_MUTATION, {
+            'id': session.rng.choice(session.cart_item_ids),
+            'quantity': session.rng.randrange(1, 4),
+        })
+
+
+class CartView(Operation):
+    name = 'cart_view'
+    weight = 12
+
+    def prepare(self, session):
+        session.ensure_cart(items=1)
+
+    def run(self, session):
+        session.execute(CART_QUERY, {'id': session.cart_id})
+
+
+class OrderCreation(Operation):
+    name = 'order_create'
+    weight = 3
+
+    def prepare(self, session):
+        session.ensure_cart(items=3)
+
+    def run(self, session):
+        cart_id = session.cart_id
+        # The cart is gone once ordered, or unusable if ordering failed
+        session.cart_id = None
+        session.execute(CREATE_ORDER_MUTATION, {
+            'customerId': session.customer_id,
+            'cartId': cart_id,
+        }, authenticated=True)
+
+
+class AdminOrders(Operation):
+    name = 'admin_orders'
+    weight = 1
+    admin = True
+
+    def run(self, session):
+        session.execute(ORDERS_QUERY, authenticated=True)
+
+
+class AdminCustomers(Operation):
+    name = 'admin_customers'
+    weight = 1
+    admin = True
+
+    def run(self, session):
+        session.execute(CUSTOMERS_QUERY, authenticated=True)
+
+
+OPERATIONS = [
+    ProductListing(),
+    ProductSearch(),
+    FullProductListing(),
+    ProductDetail(),
+    CartAdd(),
+    CartUpdate(),
+    CartView(),
+    OrderCreation(),
+    AdminOrders(),
+    AdminCustomers(),
+]
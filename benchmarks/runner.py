@@ -0,0 +1,164 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from store.models import Customer, Product
+from .operations import Session
+from .seed import BENCHMARK_PASSWORD
+
+
+class ClientTransport:
+    # In-process requests through the full Django stack, each client thread
+    # gets its own database connection
+    def __init__(self, path='/graphql'):
+        self.path = path
+        self.client = Client()
+
+    def execute(self, query, variables, headers):
+        extra = {'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()}
+        response = self.client.post(
+            self.path, json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json', **extra)
+        return json.loads(response.content)
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    # Requests to a running server, which must use the benchmark database
+    def __init__(self, url):
+        self.url = url
+
+    def execute(self, query, variables, headers):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({'query': query, 'variables': variables}).encode('utf-8'),
+            headers={'Content-Type': 'application/json', **headers},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            return json.loads(error.read())
+
+    def close(self):
+        connection.close()
+
+
+def percentile(values, percent):
+    # Nearest rank on sorted values
+    if not values:
+        return 0
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'throughput_rps': round(count / elapsed, 2) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / count * 1000, 3) if count else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if count else 0,
+    }
+
+
+def run_benchmark(make_transport, operations, clients=8, requests=200, duration=None, seed=0):
+    # Every client runs `requests` operations, or as many as fit in
+    # `duration` seconds, picked at random by weight
+    customers = list(
+        Customer.objects
+        .filter(user__username__startswith='benchmark-', user__is_staff=False)
+        .order_by('id')
+        .values_list('id', 'user__username'))
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    if not customers or not product_ids:
+        raise ValueError('The benchmark database is not seeded')
+
+    latencies = defaultdict(list)
+    errors = Counter()
+    error_samples = defaultdict(set)
+    lock = threading.Lock()
+    started = []
+    barrier = threading.Barrier(clients, action=lambda: started.append(time.perf_counter()))
+    weights = [operation.weight for operation in operations]
+
+    def client(index):
+        rng = random.Random(seed + index)
+        transport = make_transport()
+        customer_id, username = customers[index % len(customers)]
+        session = Session(transport, rng, username, BENCHMARK_PASSWORD, customer_id, product_ids)
+        admin_session = Session(
+            transport, rng, 'benchmark-admin', BENCHMARK_PASSWORD, None, product_ids)
+        local_latencies = defaultdict(list)
+        local_errors = []
+        try:
+            session.login()
+            if any(operation.admin for operation in operations):
+                admin_session.login()
+        finally:
+            barrier.wait()
+
+        deadline = started[0] + duration if duration else None
+        done = 0
+        while (deadline is None and done < requests) or (deadline and time.perf_counter() < deadline):
+            done += 1
+            operation = rng.choices(operations, weights)[0]
+            current = admin_session if operation.admin else session
+            try:
+                operation.prepare(current)
+                start = time.perf_counter()
+                operation.run(current)
+                local_latencies[operation.name].append(time.perf_counter() - start)
+            except Exception as error:
+                local_errors.append((operation.name, f'{type(error).__name__}: {error}'))
+        transport.close()
+
+        with lock:
+            for name, values in local_latencies.items():
+                latencies[name].extend(values)
+            for name, message in local_errors:
+                errors[name] += 1
+                if len(error_samples[name]) < 5:
+                    error_samples[name].add(message)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started[0]
+
+    report = {
+        'meta': {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'products': len(product_ids),
+            'clients': clients,
+            'requests_per_client': None if duration else requests,
+            'duration_s': round(elapsed, 3),
+            'seed': seed,
+        },
+        'operations': {},
+    }
+    for operation in operations:
+        summary = summarize(latencies[operation.name], errors[operation.name], elapsed)
+        if error_samples[operation.name]:
+            summary['error_samples'] = sorted(error_samples[operation.name])
+        report['operations'][operation.name] = summary
+    report['total'] = summarize(
+        [value for values in latencies.values() for value in values],
+        sum(errors.values()), elapsed)
+    return report
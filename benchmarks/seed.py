@@ -0,0 +1,100 @@
+import random
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from store.cache import invalidate_products
+from store.counters import reconcile_product_counters
+from store.facets import sync_product_specs
+from store.listings import refresh_product_listings
+from store.models import Collection, Product, Promotion
+from store.search import mark_index_changed
+from tags.models import Tag, TaggedItem
+
+
+# Same shape and value distribution as sql_scripts/*.sql
+COLLECTIONS = ('PC', 'PcGamer', 'Laptop', 'Monitor', 'CPU', 'GPU', 'RAM', 'HDD', 'SSD')
+TAGS = ('gaming', 'bureautique', 'promo', 'nouveau', 'best-seller', 'reconditionne', 'pro')
+DESCRIPTION_VALUES = {
+    'brand': ('HP', 'LENOVO', 'DELL', 'ASUS', 'MYTEK', 'MSI', 'APPLE'),
+    'type': ('PC de Bureau Gamer', 'PC de Bureau', 'PC de Bureau All In One'),
+    'os': ('FreeDos', 'Windows 11 Famille', 'Windows 10 Pro'),
+    'processor': ('Intel Core i5', 'Intel Core i3', 'AMD Ryzen 5', 'Intel Core i7', 'AMD Ryzen 7'),
+    'processor_type': ('Hexa Core', 'Quad Core', 'Octa Core', '12 cœurs', 'Dual Core'),
+    'gpu_chipset': ('Intel HD', 'Intel UHD', 'GeForce GTX 1660 SUPER', 'GeForce RTX 3060',
+                    'GeForce GTX 1650', 'AMD Radeon RX 6600 XT'),
+    'memory': ('8 Go', '16 Go', '32 Go', '4 Go', '24 Go', '12 Go'),
+    'memory_type': ('DDR4', 'DDR5'),
+    'drive_type': ('SSD', 'HDD', 'SSD + HDD'),
+    'screen_size': ('Sans Ecran', '23.8 Pouces', '21.5 Pouces', '27 Pouces'),
+}
+
+BENCHMARK_PASSWORD = 'benchmark'
+BATCH_SIZE = 1000
+
+
+def make_product(rng, index, collections):
+    description = {key: rng.choice(values) for key, values in DESCRIPTION_VALUES.items()}
+    title = f"{description['type']} {description['brand']} {description['processor']} " \
+        f"{description['memory']} {description['drive_type']} - {index}"
+    image = {'title': title, 'src': f'https://media.pcstore.tn/products/{index}.jpg'}
+    return Product(
+        title=title,
+        description=description,
+        price=Decimal(rng.randrange(400, 9000)) + Decimal(rng.choice((0, 500, 900))) / 1000,
+        inventory=rng.randrange(0, 60),
+        slug=f'benchmark-product-{index}',
+        collection=rng.choice(collections),
+        images={'image1': image, 'image2': image},
+    )
+
+
+@transaction.atomic
+def seed_catalog(scale, customers=50, seed=0):
+    rng = random.Random(seed)
+    collections = [Collection.objects.create(title=title) for title in COLLECTIONS]
+    promotions = [
+        Promotion.objects.create(description=f'Promotion {discount}%', discount=discount)
+        for discount in (5, 10, 15, 20, 25, 30, 40)
+    ]
+    tags = [Tag.objects.create(label=label) for label in TAGS]
+    content_type = ContentType.objects.get_for_model(Product)
+
+    for start in range(0, scale, BATCH_SIZE):
+        products = Product.objects.bulk_create([
+            make_product(rng, index, collections)
+            for index in range(start, min(start + BATCH_SIZE, scale))
+        ])
+        if products and products[0].pk is None:
+            # Backends not returning ids from bulk_create
+            products = list(Product.objects.order_by('-id')[:len(products)])
+        Product.promotions.through.objects.bulk_create([
+            Product.promotions.through(product_id=product.pk, promotion_id=rng.choice(promotions).pk)
+            for product in products
+            if rng.random() < 0.3
+        ])
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag=tag, content_type=content_type, object_id=product.pk)
+            for product in products
+            for tag in rng.sample(tags, rng.randrange(0, 3))
+        ])
+        sync_product_specs(products)
+        refresh_product_listings([product.pk for product in products])
+
+    for collection in collections:
+        collection.featured_product = collection.product_set.order_by('id').first()
+        collection.save()
+
+    # Hashed once, saved one by one so every user gets its customer
+    User = get_user_model()
+    password = make_password(BENCHMARK_PASSWORD)
+    User(username='benchmark-admin', email='benchmark-admin@pcstore.tn',
+         password=password, is_staff=True).save()
+    for index in range(customers):
+        User(username=f'benchmark-{index}', email=f'benchmark-{index}@pcstore.tn',
+             password=password).save()
+
+    transaction.on_commit(reconcile_product_counters)
+    transaction.on_commit(invalidate_products)
+    transaction.on_commit(mark_index_changed)
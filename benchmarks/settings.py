@@ -0,0 +1,32 @@
+# Stand-in settings for the benchmark command: a local SQLite file and an
+# in-process cache instead of MySQL and Redis
+#   python manage.py benchmark --settings=benchmarks.settings --scale 1000
+import os
+import tempfile
+from pcstore.settings import *  # noqa
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware != 'core.middleware.DebugToolbarMiddleware'
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'BENCHMARK_DATABASE', os.path.join(tempfile.gettempdir(), 'pcstore-benchmark.sqlite3')),
+        'OPTIONS': {'timeout': 30},
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': CACHE_TTL,
+    }
+}
+
+BENCHMARK = True
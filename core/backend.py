@@ -0,0 +1,107 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import validate
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+def invalid_result(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+class CachedGraphQLBackend(GraphQLCoreBackend):
+    # Parsed and validated documents keyed on the sha256 of the query text.
+    # Each worker keeps the most used ones in memory, valid documents are
+    # also shared through the cache so the other workers skip parsing and
+    # validation, and persisted queries can be looked up by hash alone
+
+    def __init__(self, executor=None, max_size=None):
+        super().__init__(executor)
+        self.max_size = max_size or settings.GRAPHQL_DOCUMENT_LRU_SIZE
+        self.documents = OrderedDict()
+        self.schema_versions = {}
+        self.lock = threading.Lock()
+
+    def schema_version(self, schema):
+        # A deploy changing the schema must not reuse documents validated
+        # against the previous one
+        version = self.schema_versions.get(id(schema))
+        if version is None:
+            version = query_hash(str(schema))[:16]
+            self.schema_versions[id(schema)] = version
+        return version
+
+    def cache_key(self, schema, sha256_hash):
+        return f'graphql-document:{self.schema_version(schema)}:{sha256_hash}'
+
+    def get_local(self, schema, sha256_hash):
+        key = (id(schema), sha256_hash)
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+            return document
+
+    def set_local(self, schema, sha256_hash, document):
+        with self.lock:
+            self.documents[(id(schema), sha256_hash)] = document
+            while len(self.documents) > self.max_size:
+                self.documents.popitem(last=False)
+
+    def make_document(self, schema, query, document_ast, errors=None):
+        if errors:
+            execute_fn = partial(invalid_result, errors)
+        else:
+            execute_fn = partial(execute, schema, document_ast, **self.execute_params)
+        return GraphQLDocument(
+            schema=schema,
+            document_string=query,
+            document_ast=document_ast,
+            execute=execute_fn,
+        )
+
+    def document_from_hash(self, schema, sha256_hash):
+        document = self.get_local(schema, sha256_hash)
+        if document is not None:
+            return document
+        stored = cache.get(self.cache_key(schema, sha256_hash))
+        if stored is None:
+            return None
+        document = self.make_document(schema, stored['query'], stored['ast'])
+        self.set_local(schema, sha256_hash, document)
+        return document
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+
+        sha256_hash = query_hash(document_string)
+        document = self.document_from_hash(schema, sha256_hash)
+        if document is not None:
+            return document
+
+        # Syntax errors are raised and not cached
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        document = self.make_document(schema, document_string, document_ast, errors)
+        self.set_local(schema, sha256_hash, document)
+        if not errors:
+            cache.set(
+                self.cache_key(schema, sha256_hash),
+                {'query': document_string, 'ast': document_ast},
+                settings.GRAPHQL_DOCUMENT_CACHE_TTL,
+            )
+        return document
+
+
+backend = CachedGraphQLBackend()
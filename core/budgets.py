@@ -0,0 +1,40 @@
+import logging
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+def get_query_budget(operation_name):
+    return settings.GRAPHQL_QUERY_BUDGETS.get(
+        operation_name, settings.GRAPHQL_DEFAULT_QUERY_BUDGET)
+
+
+def check_query_budget(operation_name, count):
+    budget = get_query_budget(operation_name)
+    if budget is None or count <= budget:
+        return True
+    logger.warning(
+        'GraphQL operation %s ran %d SQL queries, its budget is %d',
+        operation_name or 'anonymous', count, budget)
+    return False
@@ -0,0 +1,162 @@
+import threading
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.db import transaction
+
+
+def model_tag(model, pk='*'):
+    # '<model>:<pk>' for entries built from one object, '<model>:*' for
+    # entries depending on any object of the model, lists and counts
+    return f'{model._meta.model_name}:{pk}'
+
+
+def object_tags(model, pk):
+    # Everything a change to the object invalidates
+    return [model_tag(model, pk), model_tag(model)]
+
+
+def tag_key(tag):
+    return f'cache-tag:{tag}'
+
+
+def stamp_key(tag):
+    return f'cache-tag-invalidated:{tag}'
+
+
+GENERATION_KEY = 'cache-tags-generation'
+
+
+class CacheTagIndex:
+    # Tag sets stored as plain cache values, updates are not atomic across
+    # processes. Fine for the local memory cache of development and tests
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def add(self, entries):
+        # entries maps cache keys to their tags
+        with self.lock:
+            for key, tags in entries.items():
+                for tag in tags:
+                    keys = cache.get(tag_key(tag)) or set()
+                    cache.set(tag_key(tag), keys | {key}, settings.CACHE_TAGS_TTL)
+
+    def invalidate(self, tags):
+        with self.lock:
+            tag_keys = [tag_key(tag) for tag in tags]
+            keys = set().union(*cache.get_many(tag_keys).values())
+            cache.delete_many([*keys, *tag_keys])
+        return len(keys)
+
+
+class RedisCacheTagIndex:
+    # Each tag is a Redis set of the cache keys depending on it, purging a
+    # tag costs one round trip for the sets and one for the deletes
+
+    def __init__(self, client=None):
+        if client is None:
+            from django_redis import get_redis_connection
+            client = get_redis_connection(DEFAULT_CACHE_ALIAS)
+        self.client = client
+
+    def add(self, entries):
+        keys_by_tag = {}
+        for key, tags in entries.items():
+            for tag in tags:
+                keys_by_tag.setdefault(cache.make_key(tag_key(tag)), []).append(cache.make_key(key))
+        pipeline = self.client.pipeline(transaction=False)
+        for tag_set, keys in keys_by_tag.items():
+            pipeline.sadd(tag_set, *keys)
+            pipeline.expire(tag_set, settings.CACHE_TAGS_TTL)
+        pipeline.execute()
+
+    def invalidate(self, tags):
+        tag_keys = [cache.make_key(tag_key(tag)) for tag in tags]
+        pipeline = self.client.pipeline(transaction=False)
+        for key in tag_keys:
+            pipeline.smembers(key)
+        keys = set().union(*pipeline.execute())
+        self.client.delete(*keys, *tag_keys)
+        return len(keys)
+
+
+tag_index = None
+
+
+def get_tag_index():
+    global tag_index
+    if tag_index is None:
+        backend = settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND']
+        if backend.startswith('django_redis.'):
+            tag_index = RedisCacheTagIndex()
+        else:
+            tag_index = CacheTagIndex()
+    return tag_index
+
+
+def tag_generation():
+    # Read before computing a value to store with set_tagged
+    return cache.get(GENERATION_KEY, 0)
+
+
+def next_generation():
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 0, timeout=None)
+        return cache.incr(GENERATION_KEY)
+
+
+def invalidated_since(tags, generation):
+    stamps = cache.get_many([stamp_key(tag) for tag in tags])
+    return any(stamp > generation for stamp in stamps.values())
+
+
+def tagged_timeout(timeout):
+    # An entry must not outlive the tag sets it belongs to
+    if timeout is None or timeout > settings.CACHE_TAGS_TTL:
+        return settings.CACHE_TAGS_TTL
+    return timeout
+
+
+def set_tagged(key, value, tags, generation, timeout=None):
+    # generation is tag_generation() read before the value was computed.
+    # Registered, stored, then dropped again if one of its tags was
+    # invalidated since: the value may predate that change, and an
+    # invalidation stamped after the check sees the entry registered
+    set_many_tagged({key: value}, {key: tags}, generation, timeout)
+
+
+def set_many_tagged(values, tags, generation, timeout=None):
+    # values and tags are both keyed on the cache keys
+    if not values:
+        return
+    get_tag_index().add({key: tags[key] for key in values})
+    cache.set_many(values, tagged_timeout(timeout))
+    stale = [key for key in values if invalidated_since(tags[key], generation)]
+    if stale:
+        cache.delete_many(stale)
+
+
+def get_or_set_tagged(key, tags, compute, timeout=None):
+    value = cache.get(key)
+    if value is None:
+        generation = tag_generation()
+        value = compute()
+        set_tagged(key, value, tags, generation, timeout)
+    return value
+
+
+def invalidate_tags(*tags):
+    # Deletes every entry registered under any of the tags. The tags are
+    # stamped first so values being computed meanwhile are not stored
+    if not tags:
+        return 0
+    tags = set(tags)
+    generation = next_generation()
+    cache.set_many({stamp_key(tag): generation for tag in tags}, settings.CACHE_TAGS_TTL)
+    return get_tag_index().invalidate(tags)
+
+
+def invalidate_tags_on_commit(*tags):
+    transaction.on_commit(lambda: invalidate_tags(*tags))
@@ -0,0 +1,56 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.db import close_old_connections
+from promise import Promise
+
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.GRAPHQL_ASYNC_THREADS, thread_name_prefix='graphql-db')
+    return executor
+
+
+def blocking(resolver):
+    # Marks a resolver doing database or cache work so the async view runs
+    # it in the thread pool instead of on the event loop
+    resolver.blocking = True
+    return resolver
+
+
+def call_in_thread(fn, *args, **kwargs):
+    # Pool threads keep their connection between tasks, like request
+    # threads do between requests, and drop it once CONN_MAX_AGE is reached
+    close_old_connections()
+    return fn(*args, **kwargs)
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def run_blocking(fn, *args, **kwargs):
+    # Future of fn run in the thread pool, must be called on the event loop.
+    # Context variables like the database routing state follow fn
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(
+        get_executor(), partial(context.run, call_in_thread, fn, *args, **kwargs))
+
+
+def resolve_blocking(fn, *args, **kwargs):
+    # Promise of fn: run in the thread pool when called from the async view,
+    # inline otherwise
+    if in_event_loop():
+        return Promise.resolve(run_blocking(fn, *args, **kwargs))
+    return Promise.resolve(fn(*args, **kwargs))
@@ -0,0 +1,146 @@
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull
+
+
+class QueryCost:
+    def __init__(self, cost=0, depth=0):
+        self.cost = cost
+        self.depth = depth
+
+
+def get_operation(document_ast, operation_name):
+    operations = [
+        definition for definition in document_ast.definitions
+        if isinstance(definition, ast.OperationDefinition)
+    ]
+    if not operation_name and len(operations) == 1:
+        return operations[0]
+    for operation in operations:
+        if operation.name and operation.name.value == operation_name:
+            return operation
+    return None
+
+
+def unwrap(graphql_type):
+    # Returns the named type and whether a list was found on the way
+    is_list = False
+    while isinstance(graphql_type, (GraphQLList, GraphQLNonNull)):
+        if isinstance(graphql_type, GraphQLList):
+            is_list = True
+        graphql_type = graphql_type.of_type
+    return graphql_type, is_list
+
+
+def is_connection(graphql_type):
+    fields = getattr(graphql_type, 'fields', None) or {}
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+class CostAnalyzer:
+    # Static cost of an operation: every field returning an object costs one
+    # per parent item, lists multiply their children by the requested page
+    # size (first/last) or a default size when unbounded
+
+    def __init__(self, schema, document_ast, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+        self.field_costs = settings.GRAPHQL_FIELD_COSTS
+        self.list_size = settings.GRAPHQL_DEFAULT_LIST_SIZE
+
+    def analyze(self, operation):
+        root_type = {
+            'query': self.schema.get_query_type,
+            'mutation': self.schema.get_mutation_type,
+            'subscription': self.schema.get_subscription_type,
+        }[operation.operation]()
+        result = QueryCost()
+        self.visit(operation.selection_set, root_type, 1, 1, None, result, ())
+        return result
+
+    def argument_value(self, field, name):
+        for argument in field.arguments or []:
+            if argument.name.value != name:
+                continue
+            value = argument.value
+            if isinstance(value, ast.Variable):
+                return self.variables.get(value.name.value)
+            if isinstance(value, ast.IntValue):
+                return int(value.value)
+        return None
+
+    def page_size(self, field):
+        size = self.argument_value(field, 'first') or self.argument_value(field, 'last')
+        if isinstance(size, int) and size > 0:
+            return size
+        return graphene_settings.RELAY_CONNECTION_MAX_LIMIT or self.list_size
+
+    def visit(self, selection_set, parent_type, multiplier, depth,
+              connection_size, result, fragments_path):
+        result.depth = max(result.depth, depth)
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in fragments_path:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                self.visit(fragment.selection_set, fragment_type or parent_type,
+                           multiplier, depth, connection_size, result,
+                           fragments_path + (name,))
+            elif isinstance(selection, ast.InlineFragment):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(
+                        selection.type_condition.name.value) or parent_type
+                self.visit(selection.selection_set, fragment_type, multiplier,
+                           depth, connection_size, result, fragments_path)
+            elif isinstance(selection, ast.Field):
+                self.visit_field(selection, parent_type, multiplier, depth,
+                                 connection_size, result, fragments_path)
+
+    def visit_field(self, field, parent_type, multiplier, depth,
+                    connection_size, result, fragments_path):
+        name = field.name.value
+        fields = getattr(parent_type, 'fields', None) or {}
+        if name.startswith('__') or name not in fields:
+            # Introspection and unknown fields (left to validation)
+            return
+
+        field_type, is_list = unwrap(fields[name].type)
+        default_cost = 1 if field.selection_set else 0
+        result.cost += multiplier * self.field_costs.get(
+            f'{parent_type.name}.{name}', default_cost)
+        if not field.selection_set:
+            return
+
+        child_connection_size = None
+        child_multiplier = multiplier
+        if is_connection(field_type):
+            child_connection_size = self.page_size(field)
+        elif is_list:
+            if name == 'edges' and connection_size:
+                child_multiplier *= connection_size
+            else:
+                child_multiplier *= self.page_size(field) \
+                    if self.argument_value(field, 'first') else self.list_size
+        self.visit(field.selection_set, field_type, child_multiplier, depth + 1,
+                   child_connection_size, result, fragments_path)
+
+
+def get_user_class(user):
+    if user.is_staff:
+        return 'staff'
+    if user.is_authenticated:
+        return 'authenticated'
+    return 'anonymous'
+
+
+def get_query_limits(user):
+    return settings.GRAPHQL_QUERY_LIMITS[get_user_class(user)]
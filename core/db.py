@@ -0,0 +1,189 @@
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from graphql_jwt.utils import get_http_authorization
+from .concurrency import run_blocking
+
+
+class RoutingState:
+    def __init__(self, primary=False):
+        # Reads go to the primary once anything was written
+        self.primary = primary
+        self.wrote = False
+
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def replica_reads(primary=False):
+    # Reads may only go to a replica inside this block, everything outside
+    # requests (commands, workers, shells) stays on the primary
+    token = routing_state.set(RoutingState(primary))
+    try:
+        yield routing_state.get()
+    finally:
+        routing_state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    state = routing_state.get()
+    if state is None or state.primary:
+        yield
+        return
+    state.primary = True
+    try:
+        yield
+    finally:
+        state.primary = False
+
+
+class ReplicaLag:
+    # Seconds each replica is behind, measured at most every
+    # REPLICA_LAG_CHECK_INTERVAL seconds per process
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lags = {}
+
+    def measure(self, alias):
+        connection = connections[alias]
+        if connection.vendor != 'mysql':
+            return 0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW SLAVE STATUS')
+                row = cursor.fetchone()
+                columns = [column[0] for column in cursor.description or []]
+        except DatabaseError:
+            return None
+        if row is None or 'Seconds_Behind_Master' not in columns:
+            return None
+        return row[columns.index('Seconds_Behind_Master')]
+
+    def get(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked_at, lag = self.lags.get(alias, (None, None))
+        if checked_at is None or now - checked_at > settings.REPLICA_LAG_CHECK_INTERVAL:
+            lag = self.measure(alias)
+            with self.lock:
+                self.lags[alias] = (now, lag)
+        return lag
+
+    def reset(self):
+        with self.lock:
+            self.lags.clear()
+
+
+replica_lag = ReplicaLag()
+
+
+def get_replicas():
+    # Replicas not replicating or too far behind are left out
+    replicas = []
+    for alias in settings.DATABASE_REPLICAS:
+        lag = replica_lag.get(alias)
+        if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+            replicas.append(alias)
+    return replicas
+
+
+class ReplicaRouter:
+    # Reads made while handling a request go to a replica, unless the
+    # request wrote, runs a mutation, is in a transaction or follows a write
+    # by the same client within REPLICA_STICKY_SECONDS
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or state.primary or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.primary = True
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+def sticky_key(request):
+    # Token clients have no cookies, they are recognised by their token
+    authorization = get_http_authorization(request)
+    if authorization is None:
+        return None
+    digest = hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+    return f'db-primary-until:{digest}'
+
+
+def is_sticky(request):
+    now = time.time()
+    try:
+        if float(request.COOKIES.get(settings.REPLICA_STICKY_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    key = sticky_key(request)
+    return key is not None and cache.get(key, 0) > now
+
+
+def stick_to_primary(request, response):
+    until = time.time() + settings.REPLICA_STICKY_SECONDS
+    response.set_cookie(
+        settings.REPLICA_STICKY_COOKIE, str(until),
+        max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+    key = sticky_key(request)
+    if key is not None:
+        cache.set(key, until, settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRoutingMiddleware:
+    # Async capable so ASGI requests, the async GraphQL view's, are not
+    # funnelled through the single thread Django runs sync middleware in
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # Tells Django the instance is a coroutine function
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        with replica_reads(primary=is_sticky(request)) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            stick_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        sticky = await run_blocking(is_sticky, request)
+        with replica_reads(primary=sticky) as state:
+            response = await self.get_response(request)
+        if state.wrote:
+            await run_blocking(stick_to_primary, request, response)
+        return response
@@ -0,0 +1,76 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import parse_etags, patch_cache_control, patch_vary_headers
+from .cache_tags import set_tagged, tag_generation
+
+
+class NotModified(Exception):
+    pass
+
+
+def get_cache_policy(operation_name):
+    return settings.GRAPHQL_CACHE_POLICIES.get(operation_name)
+
+
+class TagVariables(dict):
+    # Tags naming a variable that was not sent depend on every object
+    def __missing__(self, key):
+        return '*'
+
+
+class CachedResponse:
+    # ETag of a query response, kept until a change to the data it was built
+    # from invalidates one of the tags of its policy. Tags may name the
+    # operation variables, 'product:{id}'
+
+    def __init__(self, request, parts, policy, variables):
+        user = request.user
+        key = [parts, user.pk if user.is_authenticated else None]
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode('utf-8'))
+        self.key = f'graphql-etag:{digest.hexdigest()}'
+        self.policy = policy
+        values = TagVariables({
+            name: value for name, value in (variables or {}).items() if value is not None})
+        self.tags = [tag.format_map(values) for tag in policy['tags']]
+        # Taken before the operation runs
+        self.generation = tag_generation()
+        self.etag = cache.get(self.key)
+
+    def store(self, content):
+        etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        if etag != self.etag:
+            self.etag = etag
+            set_tagged(self.key, etag, self.tags, self.generation)
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header or etag is None:
+        return False
+    # Weak comparison, proxies compressing the response weaken the ETag
+    etags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(header)]
+    return '*' in etags or etag in etags
+
+
+def patch_cache_headers(request, response):
+    # Anonymous responses are shared, per user ones are stored by the client
+    # only and revalidated on every use
+    if request.method != 'GET' or response.status_code not in (200, 304):
+        return response
+    cached_response = getattr(request, 'cached_response', None)
+    if cached_response is None:
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    if response.status_code == 200:
+        cached_response.store(response.content)
+    response['ETag'] = cached_response.etag
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=cached_response.policy['max_age'])
+        # Shared caches must not hand one client's CSRF token to the others
+        response.cookies.pop(settings.CSRF_COOKIE_NAME, None)
+    patch_vary_headers(response, ['Authorization'])
+    return response
@@ -0,0 +1,76 @@
+import json
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.operations import OPERATIONS
+from benchmarks.runner import ClientTransport, HttpTransport, run_benchmark
+from benchmarks.seed import seed_catalog
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Seed a benchmark database and drive the storefront GraphQL operations ' \
+        'with concurrent clients, run with --settings=benchmarks.settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000, help='Number of products to seed')
+        parser.add_argument('--customers', type=int, default=50, help='Number of customers to seed')
+        parser.add_argument('--reseed', action='store_true', help='Flush and seed the database again')
+        parser.add_argument('--clients', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=200, help='Operations per client')
+        parser.add_argument('--duration', type=float, help='Run for N seconds instead of --requests')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and traffic')
+        parser.add_argument('--operations', help='Comma separated operation names, all by default')
+        parser.add_argument('--url', help='GraphQL endpoint of a running server sharing the '
+                                          'benchmark database, requests are made in process otherwise')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the JSON report')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'BENCHMARK', False):
+            raise CommandError('Refusing to seed a non benchmark database, use --settings=benchmarks.settings')
+
+        operations = OPERATIONS
+        if options['operations']:
+            names = options['operations'].split(',')
+            operations = [operation for operation in OPERATIONS if operation.name in names]
+            unknown = set(names) - {operation.name for operation in operations}
+            if unknown:
+                raise CommandError(f"Unknown operations: {', '.join(sorted(unknown))}")
+
+        call_command('migrate', verbosity=0)
+        if options['reseed']:
+            call_command('flush', interactive=False, verbosity=0)
+        if not Product.objects.exists():
+            self.stdout.write(f"Seeding {options['scale']} products ...")
+            seed_catalog(options['scale'], options['customers'], options['seed'])
+
+        if options['url']:
+            def make_transport():
+                return HttpTransport(options['url'])
+        else:
+            make_transport = ClientTransport
+
+        try:
+            report = run_benchmark(
+                make_transport, operations,
+                clients=options['clients'],
+                requests=options['requests'],
+                duration=options['duration'],
+                seed=options['seed'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+
+        self.stdout.write(
+            f"{'operation':<22} {'requests':>9} {'errors':>7} {'rps':>9} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        rows = list(report['operations'].items()) + [('total', report['total'])]
+        for name, summary in rows:
+            self.stdout.write(
+                f"{name:<22} {summary['requests']:>9} {summary['errors']:>7} "
+                f"{summary['throughput_rps']:>9.1f} {summary['p50_ms']:>9.2f} "
+                f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f}")
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
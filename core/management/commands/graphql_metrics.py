@@ -0,0 +1,34 @@
+import json
+from django.core.management.base import BaseCommand
+from core.metrics import metrics_report, reset_metrics
+
+
+class Command(BaseCommand):
+    help = 'Show resolver latency and SQL histograms aggregated over all workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operation', help='Only show this operation name')
+        parser.add_argument('--limit', type=int, default=30, help='Number of rows to show')
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+        parser.add_argument('--reset', action='store_true', help='Clear the collected metrics')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_metrics()
+            self.stdout.write(self.style.SUCCESS('GraphQL metrics cleared'))
+            return
+
+        report = metrics_report(options['operation'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'operation':<24} {'field':<36} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'max ms':>9} {'queries':>8} {'sql p95':>9}")
+        for row in report[:options['limit']]:
+            time_ms = row['time_ms']
+            self.stdout.write(
+                f"{row['operation'][:24]:<24} {row['field'][:36]:<36} {row['count']:>8} "
+                f"{time_ms['p50']:>9.2f} {time_ms['p95']:>9.2f} {time_ms['p99']:>9.2f} "
+                f"{time_ms['max']:>9.2f} {row['queries']['mean']:>8.1f} {row['sql_ms']['p95']:>9.2f}")
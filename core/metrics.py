@@ -0,0 +1,256 @@
+import os
+import socket
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+METRICS_EPOCH_KEY = 'graphql-metrics:epoch'
+METRICS_WORKERS_KEY = 'graphql-metrics:workers'
+OPERATION_FIELD = '*'
+
+# Log-linear buckets as in HDR histograms: 16 sub-buckets per power of two
+# keep every recorded value within ~6% whatever its magnitude
+SUB_BUCKETS = 16
+
+
+def bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value
+    exponent = value.bit_length() - 5
+    return exponent * SUB_BUCKETS + (value >> exponent)
+
+
+def bucket_value(index):
+    # Highest value falling in the bucket
+    if index < SUB_BUCKETS * 2:
+        return index
+    exponent = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << exponent) - 1
+
+
+class Histogram:
+    def __init__(self, counts=None, total=0, maximum=0):
+        self.counts = counts or {}
+        self.count = sum(self.counts.values())
+        self.total = total
+        self.maximum = maximum
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        threshold = self.count * percent / 100
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(bucket_value(index), self.maximum)
+        return self.maximum
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {'counts': self.counts, 'total': self.total, 'maximum': self.maximum}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(dict(data['counts']), data['total'], data['maximum'])
+
+
+class ResolveFrame:
+    __slots__ = ('field', 'duration', 'queries', 'sql_time')
+
+    def __init__(self, field):
+        self.field = field
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+
+
+class RequestMetrics:
+    # Samples of one GraphQL request. SQL is charged to the last field that
+    # started resolving, loader batches run later are only counted in the
+    # operation totals
+
+    def __init__(self):
+        self.operation_name = None
+        self.frames = []
+        self.current = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.duration = 0.0
+
+    def start_field(self, field):
+        frame = ResolveFrame(field)
+        self.frames.append(frame)
+        self.current = frame
+        return frame
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += duration
+            frame = self.current
+            if frame is not None:
+                frame.queries += 1
+                frame.sql_time += duration
+                frame.duration += duration
+
+    @contextmanager
+    def capture(self):
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.sql_wrapper))
+            try:
+                yield self
+            finally:
+                self.duration = time.perf_counter() - start
+
+
+def worker_key(worker_id):
+    return f'graphql-metrics:worker:{worker_id}'
+
+
+def microseconds(seconds):
+    return int(seconds * 1000000)
+
+
+class MetricsRegistry:
+    # Per worker histograms keyed on (operation, field, metric), pushed to
+    # the cache every GRAPHQL_METRICS_FLUSH_INTERVAL seconds so any process
+    # can read the sum over all workers
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.epoch = None
+        self.last_flush = time.monotonic()
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    def histogram(self, operation, field, metric):
+        key = (operation, field, metric)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def record(self, request_metrics):
+        operation = request_metrics.operation_name or 'anonymous'
+        with self.lock:
+            for frame in request_metrics.frames:
+                self.histogram(operation, frame.field, 'time').record(microseconds(frame.duration))
+                self.histogram(operation, frame.field, 'queries').record(frame.queries)
+                self.histogram(operation, frame.field, 'sql_time').record(microseconds(frame.sql_time))
+            self.histogram(operation, OPERATION_FIELD, 'time').record(
+                microseconds(request_metrics.duration))
+            self.histogram(operation, OPERATION_FIELD, 'queries').record(request_metrics.queries)
+            self.histogram(operation, OPERATION_FIELD, 'sql_time').record(
+                microseconds(request_metrics.sql_time))
+            flush = time.monotonic() - self.last_flush >= settings.GRAPHQL_METRICS_FLUSH_INTERVAL
+        if flush:
+            self.flush()
+
+    def flush(self):
+        epoch = cache.get(METRICS_EPOCH_KEY)
+        with self.lock:
+            if epoch != self.epoch:
+                # Metrics were reset since the last flush, what this worker
+                # recorded in between is dropped with the rest
+                self.histograms = {}
+                self.epoch = epoch
+            snapshot = {key: histogram.to_dict() for key, histogram in self.histograms.items()}
+            self.last_flush = time.monotonic()
+        ttl = settings.GRAPHQL_METRICS_TTL
+        cache.set(worker_key(self.worker_id), snapshot, ttl)
+        workers = cache.get(METRICS_WORKERS_KEY) or set()
+        if self.worker_id not in workers:
+            cache.set(METRICS_WORKERS_KEY, workers | {self.worker_id}, ttl)
+
+
+registry = MetricsRegistry()
+
+
+def collect_histograms():
+    workers = cache.get(METRICS_WORKERS_KEY) or set()
+    keys = [worker_key(worker_id) for worker_id in workers]
+    histograms = {}
+    for snapshot in cache.get_many(keys).values():
+        for key, data in snapshot.items():
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram()
+            histogram.merge(Histogram.from_dict(data))
+    return histograms
+
+
+def reset_metrics():
+    if not cache.add(METRICS_EPOCH_KEY, 1, timeout=None):
+        cache.incr(METRICS_EPOCH_KEY)
+    workers = cache.get(METRICS_WORKERS_KEY) or set()
+    cache.delete_many([worker_key(worker_id) for worker_id in workers])
+    cache.delete(METRICS_WORKERS_KEY)
+
+
+def metrics_report(operation=None):
+    histograms = collect_histograms()
+    rows = {}
+    for (operation_name, field, metric), histogram in histograms.items():
+        if operation is not None and operation_name != operation:
+            continue
+        rows.setdefault((operation_name, field), {})[metric] = histogram
+
+    report = []
+    for (operation_name, field), metrics in rows.items():
+        duration = metrics.get('time', Histogram())
+        queries = metrics.get('queries', Histogram())
+        sql_time = metrics.get('sql_time', Histogram())
+        report.append({
+            'operation': operation_name,
+            'field': field,
+            'count': duration.count,
+            'total_ms': duration.total / 1000,
+            'time_ms': {
+                'mean': duration.mean() / 1000,
+                'p50': duration.percentile(50) / 1000,
+                'p95': duration.percentile(95) / 1000,
+                'p99': duration.percentile(99) / 1000,
+                'max': duration.maximum / 1000,
+            },
+            'queries': {
+                'mean': queries.mean(),
+                'p95': queries.percentile(95),
+                'max': queries.maximum,
+            },
+            'sql_ms': {
+                'mean': sql_time.mean() / 1000,
+                'p95': sql_time.percentile(95) / 1000,
+            },
+        })
+    report.sort(key=lambda row: -row['total_ms'])
+    return report
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from functools import partial
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import QuerySet
+from debug_toolbar.middleware import DebugToolbarMiddleware as BaseDebugToolbarMiddleware
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver
+from graphene_django import DjangoListField
+from promise import Promise
+from .concurrency import run_blocking
+
+
+class DebugToolbarMiddleware(BaseDebugToolbarMiddleware):
+    # The toolbar is sync only, left as is Django would run every ASGI
+    # request through its single sync thread one at a time. ASGI requests,
+    # those of the async GraphQL view, go without the toolbar
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            # Tells Django the instance is a coroutine function
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class ResolverMetricsMiddleware:
+    # Times every field resolved for requests going through core.views.GraphQLView,
+    # which attaches the collector and records it once the operation is done
+
+    def resolve(self, next, root, info, **kwargs):
+        metrics = getattr(info.context, 'metrics', None)
+        if metrics is None:
+            return next(root, info, **kwargs)
+
+        if metrics.operation_name is None and info.operation.name:
+            metrics.operation_name = info.operation.name.value
+        frame = metrics.start_field(f'{info.parent_type.name}.{info.field_name}')
+        start = time.perf_counter()
+        result = next(root, info, **kwargs)
+        if not isinstance(result, Promise) or result.is_fulfilled or result.is_rejected:
+            value = result.value if isinstance(result, Promise) else result
+            if isinstance(value, QuerySet):
+                # Graphene would only evaluate it once other fields have
+                # started, fetch it now so its SQL is charged to this field
+                len(value)
+            frame.duration += time.perf_counter() - start
+            return result
+
+        # Loader results are only known once the batch has run
+        def stop(value):
+            frame.duration += time.perf_counter() - start
+            return value
+
+        return result.then(stop)
+
+
+def evaluate(next, root, info, **kwargs):
+    result = next(root, info, **kwargs)
+    if isinstance(result, QuerySet):
+        # Fetched here, graphene would iterate it on the event loop
+        len(result)
+    return result
+
+
+class ThreadPoolMiddleware:
+    # Used by core.views.AsyncGraphQLView. Root fields, relations read from
+    # model attributes and resolvers marked core.concurrency.blocking run in
+    # the thread pool so sibling fields resolve concurrently and the event
+    # loop never waits on the database. Other resolvers run on the loop,
+    # loader batches dispatch themselves to the pool
+
+    def __init__(self):
+        self.blocking_fields = {}
+
+    def is_blocking(self, info):
+        key = (info.parent_type.name, info.field_name)
+        if key not in self.blocking_fields:
+            self.blocking_fields[key] = len(info.path) == 1 or self.uses_database(info)
+        return self.blocking_fields[key]
+
+    def uses_database(self, info):
+        resolver = info.parent_type.fields[info.field_name].resolver
+        if isinstance(resolver, partial) and resolver.func is DjangoListField.list_resolver:
+            # Lists of related objects, the wrapped resolver decides
+            resolver = resolver.args[1]
+        if isinstance(resolver, partial) and resolver.func in (attr_resolver, dict_or_attr_resolver):
+            return self.is_relation(info, resolver.args[0])
+        return getattr(resolver, 'blocking', False)
+
+    def is_relation(self, info, attname):
+        meta = getattr(getattr(info.parent_type, 'graphene_type', None), '_meta', None)
+        model = getattr(meta, 'model', None)
+        if model is None:
+            return False
+        try:
+            return model._meta.get_field(attname).is_relation
+        except FieldDoesNotExist:
+            return False
+
+    def resolve(self, next, root, info, **kwargs):
+        if self.is_blocking(info):
+            return Promise.resolve(run_blocking(evaluate, next, root, info, **kwargs))
+        result = next(root, info, **kwargs)
+        if asyncio.iscoroutine(result):
+            return Promise.resolve(asyncio.ensure_future(result))
+        return result
@@ -3,27 +3,35 @@ from urllib.request import Request
 from django.db.models import Q
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth.hashers import make_password
-from django_filters import FilterSet, OrderingFilter
 
 from graphql import GraphQLError
 import graphene
 from graphene import relay
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 import graphql_jwt
 from graphql_auth.schema import UserQuery, MeQuery
 from graphql_auth import mutations
-from django.core.cache import cache
 
+from store.counters import ALL_PRODUCTS
+from store.fields import CachedFilterConnectionField
+from store.listings import cached_listing, listed_products, listed_tags
+from store.loaders import get_loader, ProductCountLoader
+from store.search import search_products
+from tags.loaders import TagsLoader
 from store.models import Product, Promotion
-from tags.models import Tag, TaggedItem
+from tags.models import Tag
 from .models import User
-from store.schema import Query as StoreQuery, Mutation as StoreMutation
+from store.schema import Query as StoreQuery, Mutation as StoreMutation, ListedProductFields, \
+    ProductConnection, ProductFilter
 from tags.schema import Query as TagsQuery
 
 from django.contrib.contenttypes.models import ContentType
 
 
+class ProductTagsLoader(TagsLoader):
+    model = Product
+
+
 def checkEmail(email):
     regex = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
 
@@ -34,28 +42,6 @@ def checkEmail(email):
         return False
 
 
-# Filters
-
-
-class ProductFilter(FilterSet):
-    class Meta:
-        model = Product
-        fields = {
-            'collection__title': ['exact'],
-            'price': ['gt', 'lt'],
-            'inventory': ['gt', 'lt']
-        }
-
-    order_by = OrderingFilter(
-        fields=(
-            ('title', 'title'),
-            ('price', 'price'),
-            ('inventory', 'inventory'),
-            ('last_update', 'last_update'),
-        )
-    )
-
-
 # Models
 class UserType(DjangoObjectType):
     class Meta:
@@ -78,14 +64,10 @@ class ProductTagsType(DjangoObjectType):
         fields = ('id', 'title','tags')
 
     def resolve_tags(root, info):
-        queryset = TaggedItem.objects.all().filter(object_id=root.id)
-        product_tags = []
-        for item in queryset:
-            product_tags.append(Tag.objects.get(pk=item.tag_id))
-        return product_tags
+        return get_loader(info, ProductTagsLoader).load(root.id)
 
 
-class FullProductType(DjangoObjectType):
+class FullProductType(ListedProductFields, DjangoObjectType):
     products_count = graphene.Int()
     products_collection_count = graphene.Int()
     index = graphene.Int()
@@ -104,29 +86,31 @@ class FullProductType(DjangoObjectType):
             'last_update',
             'collection',
             'images',
+            'image',
             'promotions',
+            'effective_price',
             'tags',
             'products_count',
             'products_collection_count'
         )
         # filter_fields = ['collection__title', 'inventory']
         interfaces = (relay.Node, )
+        connection_class = ProductConnection
 
     def resolve_products_count(root, info):
-        return len(Product.objects.all())
+        return get_loader(info, ProductCountLoader).load(ALL_PRODUCTS)
 
     def resolve_products_collection_count(root, info):
-        return len(Product.objects.filter(collection__title=root.collection))
+        return get_loader(info, ProductCountLoader).load(root.collection_id)
 
     def resolve_index(self, info):
         return self.pk
 
     def resolve_tags(root, info):
-        queryset = TaggedItem.objects.all().filter(object_id=root.id)
-        product_tags = []
-        for item in queryset:
-            product_tags.append(Tag.objects.get(pk=item.tag_id))
-        return product_tags
+        listing = cached_listing(root)
+        if listing is not None:
+            return listed_tags(listing)
+        return get_loader(info, ProductTagsLoader).load(root.id)
 
 # Queries
 
@@ -138,13 +122,10 @@ class CoreQuery(graphene.ObjectType):
 
     product_tags = graphene.Field(ProductTagsType, id=graphene.Int())
 
-    full_products = DjangoFilterConnectionField(
+    full_products = CachedFilterConnectionField(
         FullProductType,
         filterset_class=ProductFilter,
         search=graphene.String(),
-        first=graphene.Int(),
-        offset=graphene.Int(),
-        limit=graphene.Int()
     )
 
     full_product = graphene.Field(FullProductType, id=graphene.Int())
@@ -177,26 +158,10 @@ class CoreQuery(graphene.ObjectType):
         return Product.objects.get(pk=id)
 
     def resolve_full_products(self, info, search=None, **kwargs):
-        # Check if the result is already cached
-        cache_key = "cached-products"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            print("cached_result lenght: ", len(cached_result))
-            print("cached_result : ",cached_result)
-            return cached_result
-
-        # If the result is not cached, fetch it from the database
+        # Results are cached per arguments by CachedFilterConnectionField
+        result = listed_products()
         if search:
-            # filter = (Q(title__icontains=search) |
-            #           Q(description__icontains=search))
-            filter = Q(title__icontains=search)
-
-            result = Product.objects.prefetch_related('promotions').all().filter(filter)
-
-        result = Product.objects.prefetch_related('promotions').all()
-
-        # Cache the result
-        cache.set(cache_key, result, 60*60*5)
+            result = search_products(result, search)
 
         return result
 
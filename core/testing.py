@@ -0,0 +1,32 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from graphene_django.utils.testing import GraphQLTestCase
+from .budgets import get_query_budget
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GraphQLBudgetTestCase(GraphQLTestCase):
+    GRAPHQL_URL = '/graphql'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def assertOperationWithinBudget(self, query, operation_name, max_queries=None,
+                                    variables=None, headers=None):
+        # Runs a named operation through the GraphQL view and fails if it
+        # issues more SQL queries than max_queries or its configured budget.
+        # Queries are counted like the view does, authentication excluded
+        budget = max_queries if max_queries is not None else get_query_budget(operation_name)
+        with CaptureQueriesContext(connection) as context:
+            response = self.query(
+                query, op_name=operation_name, variables=variables, headers=headers)
+        self.assertResponseNoErrors(response)
+        count = response.wsgi_request.query_count
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(
+            count, budget,
+            f'{operation_name} ran {count} queries, its budget is {budget}:\n{queries}')
+        return response.json()['data']
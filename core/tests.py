@@ -1,3 +1,396 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from unittest import mock, skipUnless
+import graphene
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import path
+from graphql_jwt.shortcuts import get_token
+from pcstore.urls import urlpatterns as project_urlpatterns
+from store.models import Cart, Collection
+from store.tests import create_catalog
+from tags.models import Tag, TaggedItem
+from .budgets import check_query_budget
+from .cache_tags import get_or_set_tagged, invalidate_tags, set_tagged, tag_generation
+from .concurrency import blocking
+from .db import replica_lag
+from .metrics import Histogram, MetricsRegistry, RequestMetrics, metrics_report, reset_metrics
+from .testing import GraphQLBudgetTestCase
+from .views import AsyncGraphQLView
+
+
+class SlowQuery(graphene.ObjectType):
+    wait = graphene.Float(seconds=graphene.Float(required=True))
+
+    @blocking
+    def resolve_wait(root, info, seconds):
+        time.sleep(seconds)
+        return seconds
+
+
+# The project's URLs plus an async endpoint whose fields block, for the
+# tests using ROOT_URLCONF='core.tests'
+urlpatterns = [
+    path('graphql/slow', AsyncGraphQLView.as_async_view(schema=graphene.Schema(query=SlowQuery))),
+    *project_urlpatterns,
+]
+
+
+FULL_PRODUCTS_QUERY = '''
+    query FullProducts($first: Int) {
+        fullProducts(first: $first) {
+            edges {
+                node {
+                    title
+                    collection { title }
+                    promotions { discount }
+                    tags { label }
+                }
+            }
+        }
+    }
+'''
+
+
+class FullProductsTest(GraphQLBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        products = create_catalog(30)
+        tags = [Tag.objects.create(label=label) for label in ('gaming', 'office')]
+        content_type = ContentType.objects.get_for_model(products[0])
+        for index, product in enumerate(products):
+            TaggedItem.objects.create(
+                tag=tags[index % 2], content_type=content_type, object_id=product.id)
+
+    def test_full_products_within_budget(self):
+        data = self.assertOperationWithinBudget(
+            FULL_PRODUCTS_QUERY, 'FullProducts', variables={'first': 30})
+        edges = data['fullProducts']['edges']
+        self.assertEqual(len(edges), 30)
+        self.assertTrue(all(edge['node']['tags'] for edge in edges))
+
+    def test_cached_full_products_within_budget(self):
+        self.query(FULL_PRODUCTS_QUERY, op_name='FullProducts', variables={'first': 30})
+        self.assertOperationWithinBudget(
+            FULL_PRODUCTS_QUERY, 'FullProducts', max_queries=2, variables={'first': 30})
+
+
+class QueryLimitsTest(GraphQLBudgetTestCase):
+    def test_deep_query_rejected(self):
+        query = '{ collections { featuredProduct { collection { featuredProduct { collection { ' \
+            'featuredProduct { collection { featuredProduct { collection { featuredProduct { id ' \
+            '} } } } } } } } } } }'
+        response = self.query(query)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('depth', response.json()['errors'][0]['message'])
+
+    def test_persisted_query(self):
+        create_catalog(3)
+        query = 'query Collections { collections { title } }'
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': hashlib.sha256(
+            query.encode('utf-8')).hexdigest()}}
+
+        response = self.client.post(
+            self.GRAPHQL_URL, {'extensions': extensions}, content_type='application/json')
+        self.assertEqual(response.json()['errors'][0]['message'], 'PersistedQueryNotFound')
+
+        self.client.post(
+            self.GRAPHQL_URL, {'query': query, 'extensions': extensions},
+            content_type='application/json')
+        response = self.client.post(
+            self.GRAPHQL_URL, {'extensions': extensions}, content_type='application/json')
+        self.assertResponseNoErrors(response)
+        self.assertEqual(len(response.json()['data']['collections']), 2)
+
+
+class ConditionalGetTest(GraphQLBudgetTestCase):
+    QUERY = 'query Collections { collections { id title } }'
+
+    def setUp(self):
+        super().setUp()
+        create_catalog(3)
+
+    def get(self, **headers):
+        return self.client.get(self.GRAPHQL_URL, {'query': self.QUERY}, **headers)
+
+    def test_etag_and_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Collection.objects.create(title='New')
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_uncached_operations(self):
+        response = self.client.post(
+            self.GRAPHQL_URL, {'query': self.QUERY}, content_type='application/json')
+        self.assertFalse(response.has_header('ETag'))
+        response = self.client.get(self.GRAPHQL_URL, {'query': '{ collections { id title } }'})
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheTagsTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidation_during_compute_is_not_cached(self):
+        def compute():
+            # A write committing while the value is computed
+            invalidate_tags('product:1')
+            return 'stale'
+
+        self.assertEqual(get_or_set_tagged('entry', ['product:1'], compute), 'stale')
+        self.assertIsNone(cache.get('entry'))
+        self.assertEqual(get_or_set_tagged('entry', ['product:1'], lambda: 'fresh'), 'fresh')
+        self.assertEqual(cache.get('entry'), 'fresh')
+
+    def test_other_invalidations_keep_the_entry(self):
+        generation = tag_generation()
+        invalidate_tags('product:2')
+        set_tagged('entry', 'value', ['product:1', 'collection:*'], generation)
+        self.assertEqual(cache.get('entry'), 'value')
+        invalidate_tags('collection:*')
+        self.assertIsNone(cache.get('entry'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   GRAPHQL_METRICS_FLUSH_INTERVAL=0)
+class MetricsTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_percentiles_within_bucket_error(self):
+        generator = random.Random(13)
+        values = [int(generator.lognormvariate(8, 2)) for _ in range(10000)]
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for percent in (50, 90, 95, 99, 99.9):
+            exact = values[math.ceil(len(values) * percent / 100) - 1]
+            estimate = histogram.percentile(percent)
+            self.assertGreaterEqual(estimate, exact)
+            self.assertLessEqual(estimate, exact * 17 / 16 + 1, percent)
+        self.assertEqual(histogram.percentile(100), values[-1])
+        self.assertEqual(histogram.count, len(values))
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        for value in range(1, 32):
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(50), 16)
+        self.assertEqual(histogram.mean(), 16)
+
+    def test_merge(self):
+        merged, first, second = Histogram(), Histogram(), Histogram()
+        for value in range(1000):
+            merged.record(value)
+            (first if value % 2 else second).record(value)
+        first.merge(Histogram.from_dict(second.to_dict()))
+        self.assertEqual(first.counts, merged.counts)
+        self.assertEqual((first.count, first.total, first.maximum),
+                         (merged.count, merged.total, merged.maximum))
+
+    def request(self, operation, *fields):
+        metrics = RequestMetrics()
+        metrics.operation_name = operation
+        for field, queries in fields:
+            metrics.start_field(field).queries = queries
+            metrics.queries += queries
+        return metrics
+
+    def test_workers_are_summed(self):
+        workers = [MetricsRegistry(), MetricsRegistry()]
+        workers[1].worker_id += ':other'
+        for number, worker in enumerate(workers, start=1):
+            worker.record(self.request('Products', ('Query.products', number)))
+        worker.record(self.request('Cart', ('Query.cart', 1)))
+
+        rows = {row['field']: row for row in metrics_report('Products')}
+        self.assertEqual(set(rows), {'*', 'Query.products'})
+        self.assertEqual(rows['Query.products']['count'], 2)
+        self.assertEqual(rows['Query.products']['queries']['max'], 2)
+        self.assertEqual(len(metrics_report()), 4)
+
+    def test_reset_drops_unflushed_samples(self):
+        worker = MetricsRegistry()
+        worker.record(self.request('Products', ('Query.products', 1)))
+        reset_metrics()
+        self.assertEqual(metrics_report(), [])
+        with self.settings(GRAPHQL_METRICS_FLUSH_INTERVAL=60):
+            worker.record(self.request('Products', ('Query.products', 1)))
+        worker.flush()
+        self.assertEqual(metrics_report(), [])
+
+
+@override_settings(GRAPHQL_METRICS_FLUSH_INTERVAL=0)
+class MetricsViewTest(GraphQLBudgetTestCase):
+    URL = '/internal/graphql-metrics'
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('core.views.registry', MetricsRegistry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_staff_only(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 302)
+        user = get_user_model().objects.create_user('customer', 'customer@pcstore.tn', 'password')
+        self.client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(self.URL).status_code, 302)
+
+    def test_report_of_executed_operations(self):
+        create_catalog(3)
+        user = get_user_model().objects.create_user(
+            'staff', 'staff@pcstore.tn', 'password', is_staff=True)
+        self.client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+        for _ in range(2):
+            response = self.query(
+                'query Collections { collections { id title } }', op_name='Collections')
+            self.assertResponseNoErrors(response)
+
+        response = self.client.get(self.URL, {'operation': 'Collections'})
+        self.assertEqual(response.status_code, 200)
+        rows = {row['field']: row for row in response.json()['operations']}
+        self.assertEqual(
+            set(rows), {'*', 'Query.collections', 'CollectionType.id', 'CollectionType.title'})
+        self.assertEqual(rows['*']['count'], 2)
+        self.assertEqual(rows['Query.collections']['queries']['max'], 1)
+        self.assertEqual(rows['CollectionType.title']['count'], 4)
+        self.assertEqual(self.client.get(self.URL, {'operation': 'Products'}).json(),
+                         {'operations': []})
+
+
+@override_settings(GRAPHQL_QUERY_BUDGETS={'Products': 3}, GRAPHQL_DEFAULT_QUERY_BUDGET=None)
+class QueryBudgetTest(SimpleTestCase):
+    def test_over_budget_is_logged(self):
+        with self.assertLogs('core.budgets', 'WARNING'):
+            self.assertFalse(check_query_budget('Products', 4))
+
+    def test_within_budget(self):
+        self.assertTrue(check_query_budget('Products', 3))
+        self.assertTrue(check_query_budget('Unknown', 1000))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'Run with --settings=pcstore.replica_settings')
+class ReplicaRoutingTest(TransactionTestCase):
+    # Nothing replicates between the two test databases, a row only in the
+    # primary shows where a read went
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        replica_lag.reset()
+        Collection.objects.create(title='Primary only')
+
+    def collections(self):
+        response = self.client.post(
+            '/graphql', json.dumps({'query': '{ collections { title } }'}),
+            content_type='application/json')
+        return [collection['title'] for collection in response.json()['data']['collections']]
+
+    def test_queries_read_from_replica(self):
+        self.assertEqual(self.collections(), [])
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.client.post(
+            '/graphql', json.dumps({'query': 'mutation { createCart(name: "x") { cart { id } } }'}),
+            content_type='application/json')
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.collections(), ['Primary only'])
+
+        self.client.cookies.clear()
+        self.assertEqual(self.collections(), [])
+
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch.object(replica_lag, 'measure', return_value=settings.REPLICA_MAX_LAG + 1):
+            self.assertEqual(self.collections(), ['Primary only'])
+
+    async def test_async_requests_are_routed(self):
+        async def collections():
+            response = await self.async_client.post(
+                '/graphql/async', {'query': '{ collections { title } }'},
+                content_type='application/json')
+            return [collection['title'] for collection in response.json()['data']['collections']]
+
+        self.assertEqual(await collections(), [])
+        response = await self.async_client.post(
+            '/graphql/async', {'query': 'mutation { createCart(name: "x") { cart { id } } }'},
+            content_type='application/json')
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertEqual(await collections(), ['Primary only'])
+
+
+@override_settings(ROOT_URLCONF='core.tests')
+class AsyncMiddlewareTest(TransactionTestCase):
+    async def test_async_requests_run_concurrently(self):
+        # Every middleware of the stack must be async capable, a sync one
+        # runs the requests one at a time on Django's sync thread
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            self.async_client.post(
+                '/graphql/slow', {'query': '{ wait(seconds: 0.5) }'},
+                content_type='application/json')
+            for _ in range(4)
+        ])
+        elapsed = time.perf_counter() - start
+        self.assertEqual([response.json()['data'] for response in responses], [{'wait': 0.5}] * 4)
+        self.assertLess(elapsed, 1.5)
+
+
+@override_settings(ROOT_URLCONF='core.tests', DATABASE_REPLICAS=[])
+class AsyncGraphQLViewTest(TransactionTestCase):
+    async def post(self, url, query, **headers):
+        response = await self.async_client.post(
+            url, {'query': query}, content_type='application/json', **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_query(self):
+        await sync_to_async(create_catalog)(3)
+        result = await self.post('/graphql/async', '{ collections { title featuredProduct { title } } }')
+        self.assertEqual(result['data']['collections'], [
+            {'title': 'Desktop', 'featuredProduct': {'title': 'Laptop 0'}},
+            {'title': 'Laptop', 'featuredProduct': None},
+        ])
+
+    async def test_mutation(self):
+        result = await self.post('/graphql/async', 'mutation { createCart(name: "x") { cart { id } } }')
+        cart_id = result['data']['createCart']['cart']['id']
+        self.assertTrue(await sync_to_async(Cart.objects.filter(pk=cart_id).exists)())
+
+    async def test_jwt_user(self):
+        user = await sync_to_async(get_user_model().objects.create_user)(
+            'buyer', 'buyer@pcstore.tn', 'password')
+        result = await self.post('/graphql/async', '{ me { username } }')
+        self.assertEqual(result['data']['me'], None)
+        result = await self.post(
+            '/graphql/async', '{ me { username } }', authorization=f'JWT {get_token(user)}')
+        self.assertEqual(result['data']['me'], {'username': 'buyer'})
+
+    async def test_sibling_fields_resolve_concurrently(self):
+        start = time.perf_counter()
+        result = await self.post('/graphql/slow', '{ a: wait(seconds: 0.5) b: wait(seconds: 0.5) }')
+        elapsed = time.perf_counter() - start
+        self.assertEqual(result['data'], {'a': 0.5, 'b': 0.5})
+        self.assertLess(elapsed, 0.9)
 
-# Create your tests here.
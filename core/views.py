@@ -1,3 +1,300 @@
-from django.shortcuts import render
+import asyncio
+import json
+from contextlib import ExitStack
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import authenticate
+from django.http import (
+    HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotModified,
+    JsonResponse,
+)
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql import GraphQLError
+from graphql.execution import ExecutionResult
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from graphql.execution.middleware import MiddlewareManager
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+from .backend import query_hash
+from .budgets import check_query_budget, count_queries
+from .concurrency import run_blocking
+from .cost import CostAnalyzer, get_operation, get_query_limits
+from .db import use_primary
+from .http_cache import (
+    CachedResponse, NotModified, etag_matches, get_cache_policy, patch_cache_headers,
+)
+from .metrics import RequestMetrics, metrics_report, registry
+from .middleware import ResolverMetricsMiddleware, ThreadPoolMiddleware
 
-# Create your views here.
+
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+
+
+def get_persisted_query_hash(request, data):
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+    if not isinstance(extensions, dict):
+        return None
+    persisted_query = extensions.get('persistedQuery')
+    if not isinstance(persisted_query, dict):
+        return None
+    return persisted_query.get('sha256Hash')
+
+
+class GraphQLView(BaseGraphQLView):
+    # Rejects operations whose static cost or depth is over the budget of
+    # the user class before anything gets resolved, and supports automatic
+    # persisted queries: clients send extensions.persistedQuery.sha256Hash
+    # alone and only resend the query text when the hash is unknown.
+    # Queries sent over GET with a policy in GRAPHQL_CACHE_POLICIES get an
+    # ETag, kept until their data changes, and a 304 when unchanged
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except NotModified:
+            response = HttpResponseNotModified()
+        return patch_cache_headers(request, response)
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        sha256_hash = get_persisted_query_hash(request, data)
+        request.persisted_query_not_found = False
+        if sha256_hash is None:
+            return query, variables, operation_name, id
+
+        if query:
+            if query_hash(query) != sha256_hash:
+                raise HttpError(HttpResponseBadRequest('provided sha does not match query'))
+            # Registered by the backend once parsed and validated
+            return query, variables, operation_name, id
+
+        document = self.get_backend(request).document_from_hash(self.schema, sha256_hash)
+        if document is None:
+            request.persisted_query_not_found = True
+            return None, variables, operation_name, id
+        return document.document_string, variables, operation_name, id
+
+    def authenticate(self, request):
+        # The JWT middleware only authenticates while resolving, the budget
+        # has to be known before that
+        if request.user.is_authenticated or get_http_authorization(request) is None:
+            return
+        try:
+            user = authenticate(request=request)
+        except JSONWebTokenError:
+            return
+        if user is not None:
+            request.user = user
+
+    def check_cost(self, request, document, operation, variables):
+        self.authenticate(request)
+        limits = get_query_limits(request.user)
+        query_cost = CostAnalyzer(self.schema, document.document_ast, variables) \
+            .analyze(operation)
+        request.query_cost = {
+            'cost': query_cost.cost,
+            'depth': query_cost.depth,
+            'maxCost': limits['max_cost'],
+            'maxDepth': limits['max_depth'],
+        }
+        if query_cost.depth > limits['max_depth']:
+            return GraphQLError(
+                f"Query depth {query_cost.depth} exceeds the maximum of {limits['max_depth']} !")
+        if query_cost.cost > limits['max_cost']:
+            return GraphQLError(
+                f"Query cost {query_cost.cost} exceeds the maximum of {limits['max_cost']} !")
+        return None
+
+    def prepare_operation(self, request, document, variables, operation_name):
+        # Result to send instead of executing the operation if it is over
+        # budget, and the name of the operation to execute
+        operation = get_operation(document.document_ast, operation_name)
+        if operation is None:
+            return None, operation_name
+        error = self.check_cost(request, document, operation, variables)
+        if error is not None:
+            return ExecutionResult(errors=[error], invalid=True), operation_name
+        if operation.name:
+            operation_name = operation.name.value
+        return None, operation_name
+
+    def check_not_modified(self, request, document, variables, operation_name):
+        # Cached ETag of the response, raises NotModified when the client
+        # already has it so nothing gets resolved
+        if request.method.lower() != 'get' or self.batch:
+            return None
+        if document.get_operation_type(operation_name) != 'query':
+            return None
+        policy = get_cache_policy(operation_name)
+        if policy is None:
+            return None
+        cached_response = CachedResponse(
+            request, [query_hash(document.document_string), operation_name, variables],
+            policy, variables)
+        if etag_matches(request, cached_response.etag):
+            request.cached_response = cached_response
+            raise NotModified
+        return cached_response
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        if getattr(request, 'persisted_query_not_found', False):
+            return ExecutionResult(errors=[GraphQLError(PERSISTED_QUERY_NOT_FOUND)])
+        if not query:
+            return super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql)
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            # Syntax errors are reported by the default implementation
+            return super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql)
+
+        result, operation_name = self.prepare_operation(request, document, variables, operation_name)
+        if result is not None:
+            return result
+        cached_response = self.check_not_modified(request, document, variables, operation_name)
+
+        metrics = None
+        with ExitStack() as stack:
+            if document.get_operation_type(operation_name) == 'mutation':
+                stack.enter_context(use_primary())
+            counter = stack.enter_context(count_queries())
+            if self.collects_metrics():
+                metrics = request.metrics = RequestMetrics()
+                metrics.operation_name = operation_name
+                stack.enter_context(metrics.capture())
+            result = super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql)
+        request.query_count = counter.count
+        if cached_response is not None and not result.errors:
+            request.cached_response = cached_response
+        check_query_budget(operation_name, counter.count)
+        if metrics is not None:
+            registry.record(metrics)
+        return result
+
+    def collects_metrics(self):
+        return any(
+            isinstance(middleware, ResolverMetricsMiddleware)
+            for middleware in self.middleware or []
+        )
+
+    def json_encode(self, request, d, pretty=False):
+        query_cost = getattr(request, 'query_cost', None)
+        if query_cost is not None and not self.batch:
+            d['extensions'] = {'cost': query_cost}
+        return super().json_encode(request, d, pretty)
+
+
+class AsyncGraphQLView(GraphQLView):
+    # Served under ASGI. Everything before execution runs in the thread pool
+    # of core.concurrency, the operation itself runs on the event loop with
+    # ThreadPoolMiddleware sending the resolvers that block to the pool, so
+    # independent fields hit the database concurrently. GraphiQL and batches
+    # go through the sync view. SQL budgets and resolver metrics are not
+    # collected here, queries run on the pool threads' connections
+
+    @classmethod
+    def as_async_view(cls, **initkwargs):
+        async def view(request, *args, **kwargs):
+            self = cls(**initkwargs)
+            return await self.dispatch_async(request, *args, **kwargs)
+
+        # csrf_exempt would wrap it in a sync function
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch_async(self, request, *args, **kwargs):
+        if request.method.lower() not in ('get', 'post') or self.batch:
+            return await sync_to_async(self.dispatch)(request, *args, **kwargs)
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(self.dispatch)(request, *args, **kwargs)
+            result, status_code = await self.get_response_async(request, data)
+            response = HttpResponse(
+                status=status_code, content=result, content_type='application/json')
+        except NotModified:
+            response = HttpResponseNotModified()
+        except HttpError as e:
+            response = e.response
+            response['Content-Type'] = 'application/json'
+            response.content = self.json_encode(request, {'errors': [self.format_error(e)]})
+            return response
+        # Stores the ETag of new responses
+        return await run_blocking(patch_cache_headers, request, response)
+
+    async def get_response_async(self, request, data):
+        execution_result = await self.execute_graphql_request_async(request, data)
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response['errors'] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.invalid:
+            status_code = 400
+        else:
+            response['data'] = execution_result.data
+        return self.json_encode(request, response), status_code
+
+    def prepare_request(self, request, data):
+        # Loads the user, the persisted query and the document, all of which
+        # may query the database or the cache
+        self.authenticate(request)
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        if request.persisted_query_not_found:
+            return ExecutionResult(errors=[GraphQLError(PERSISTED_QUERY_NOT_FOUND)])
+        if not query:
+            raise HttpError(HttpResponseBadRequest('Must provide query string.'))
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        result, operation_name = self.prepare_operation(request, document, variables, operation_name)
+        if result is not None:
+            return result
+        cached_response = self.check_not_modified(request, document, variables, operation_name)
+        return document, variables, operation_name, cached_response
+
+    async def execute_graphql_request_async(self, request, data):
+        prepared = await run_blocking(self.prepare_request, request, data)
+        if isinstance(prepared, ExecutionResult):
+            return prepared
+        document, variables, operation_name, cached_response = prepared
+
+        operation_type = document.get_operation_type(operation_name)
+        if request.method.lower() == 'get' and operation_type and operation_type != 'query':
+            raise HttpError(HttpResponseNotAllowed(
+                ['POST'], f'Can only perform a {operation_type} operation from a POST request.'))
+
+        middleware = MiddlewareManager(
+            *self.get_middleware(request), ThreadPoolMiddleware(), wrap_in_promise=False)
+        try:
+            with ExitStack() as stack:
+                if operation_type == 'mutation':
+                    stack.enter_context(use_primary())
+                result = await document.execute(
+                    root_value=self.get_root_value(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    context_value=self.get_context(request),
+                    middleware=middleware,
+                    executor=AsyncioExecutor(loop=asyncio.get_running_loop()),
+                    return_promise=True,
+                )
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        if cached_response is not None and not result.errors:
+            request.cached_response = cached_response
+        return result
+
+
+@staff_member_required
+def graphql_metrics(request):
+    return JsonResponse({'operations': metrics_report(request.GET.get('operation'))})
@@ -0,0 +1,32 @@
+# Two local SQLite databases standing in for the MySQL primary and a
+# replica, to exercise core.db.ReplicaRouter:
+#   python manage.py test core --settings=pcstore.replica_settings
+import os
+import tempfile
+from .settings import *  # noqa
+
+DEBUG = False
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware != 'core.middleware.DebugToolbarMiddleware'
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'pcstore-primary.sqlite3'),
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(tempfile.gettempdir(), 'pcstore-replica.sqlite3'),
+    },
+}
+DATABASE_REPLICAS = ['replica']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': CACHE_TTL,
+    }
+}
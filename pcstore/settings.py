@@ -47,9 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.middleware.DebugToolbarMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.db.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,10 +95,31 @@ DATABASES = {
         'HOST': '',
         'USER': 'root',
         'PASSWORD': 'root',
-        'PORT': '3307'
-    }
+        'PORT': '3307',
+        # Kept open by the async view's pool threads between requests
+        'CONN_MAX_AGE': 60,
+    },
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.mysql',
+    #     'NAME': 'pcstore',
+    #     'HOST': 'mysql-replica',
+    #     'USER': 'root',
+    #     'PASSWORD': 'root',
+    #     'PORT': '3306',
+    #     'CONN_MAX_AGE': 60,
+    # },
 }
 
+# Aliases in DATABASES serving request reads, see core.db.ReplicaRouter.
+# Clients read from the primary for REPLICA_STICKY_SECONDS after writing,
+# replicas more than REPLICA_MAX_LAG seconds behind are not used
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 5
+REPLICA_STICKY_COOKIE = 'db-primary-until'
+REPLICA_MAX_LAG = 2
+REPLICA_LAG_CHECK_INTERVAL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -151,7 +173,10 @@ GRAPHENE = {
     'SCHEMA': 'core.schema.schema',  # this file doesn't exist yet
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'core.middleware.ResolverMetricsMiddleware',
     ],
+    # Largest page a connection will return
+    'RELAY_CONNECTION_MAX_LIMIT': 100,
 }
 
 AUTHENTICATION_BACKENDS = [
@@ -202,4 +227,109 @@ CACHES = {
 
 # Use Redis as the default cache backend
 CACHE_TTL = 60 * 5  # cache for 5 minutes
-CACHES["default"]["TIMEOUT"] = CACHE_TTL
\ No newline at end of file
+CACHES["default"]["TIMEOUT"] = CACHE_TTL
+
+# Cache entries registered under dependency tags ('product:42',
+# 'promotion:*') by core.cache_tags are deleted when a change to the tagged
+# objects commits, so they can be kept for long. Tag sets are kept that long,
+# longer entries are cut to it
+CACHE_TAGS_TTL = 60 * 60 * 24 * 2
+
+# Cached product listings, invalidated whenever the catalog changes
+PRODUCTS_CACHE_TTL = 60 * 60 * 24
+
+# Maximum number of ranked hits returned by the product search index
+PRODUCT_SEARCH_MAX_RESULTS = 500
+
+# Seconds the search index re-reads before the newest last_update it has
+# seen when catching up, covers saves that committed after later ones
+PRODUCT_SEARCH_REFRESH_OVERLAP = 300
+
+# Cart totals, invalidated by cart item changes and updates to their products
+# or promotions
+CART_SUMMARY_CACHE_TTL = 60 * 60 * 24
+
+# How the discounts of a product's promotions combine: 'best' applies the
+# largest, 'compound' applies them one after the other and 'additive' sums
+# them. The total discount is capped at PROMOTION_MAX_DISCOUNT percent.
+# Stored listings keep the old prices until manage.py rebuild_product_listings
+PROMOTION_STACKING = 'best'
+PROMOTION_MAX_DISCOUNT = 100
+
+# Effective prices per product, invalidated by updates to the product, its
+# promotions or their links
+EFFECTIVE_PRICE_CACHE_TTL = 60 * 60 * 24
+
+# Where carts live: 'database', or 'redis' to keep active carts in Redis and
+# write them to the database at checkout and with manage.py persist_carts.
+# Carts left alone that long expire from Redis, in seconds
+CART_STORE = 'database'
+CART_STORE_REDIS_ALIAS = 'default'
+CART_STORE_TTL = 60 * 60 * 24 * 7
+CART_STORE_FLUSH_BATCH_SIZE = 100
+
+# Carts older than that many days are deleted by manage.py sweep_carts, a
+# chunk of carts is deleted per transaction
+CART_MAX_AGE_DAYS = 30
+CART_SWEEP_CHUNK_SIZE = 500
+
+# Checkouts are queued and placed by manage.py run_order_workers instead of
+# during the request. Claimed orders are retried after the timeout, in seconds,
+# and marked failed once claimed ORDER_QUEUE_MAX_ATTEMPTS times
+ORDER_QUEUE_ENABLED = False
+ORDER_QUEUE_BATCH_SIZE = 20
+ORDER_QUEUE_CLAIM_TIMEOUT = 60 * 5
+ORDER_QUEUE_MAX_ATTEMPTS = 3
+
+# Per object tag lists, 0 disables the cache
+TAGS_CACHE_TTL = 60 * 60
+
+# Static GraphQL query budgets, operations over them are rejected before
+# execution. Fields returning objects cost 1 per parent item, lists multiply
+# their selections by first/last or GRAPHQL_DEFAULT_LIST_SIZE
+GRAPHQL_QUERY_LIMITS = {
+    'anonymous': {'max_depth': 10, 'max_cost': 5000},
+    'authenticated': {'max_depth': 12, 'max_cost': 10000},
+    'staff': {'max_depth': 15, 'max_cost': 50000},
+}
+GRAPHQL_DEFAULT_LIST_SIZE = 20
+# Overrides keyed on 'TypeName.fieldName'
+GRAPHQL_FIELD_COSTS = {}
+
+# Parsed and validated GraphQL documents, also used to resolve automatic
+# persisted queries by hash. The LRU size is per worker
+GRAPHQL_DOCUMENT_LRU_SIZE = 500
+GRAPHQL_DOCUMENT_CACHE_TTL = 60 * 60 * 24 * 7
+
+# Resolver latency histograms, each worker pushes its own to the cache
+GRAPHQL_METRICS_FLUSH_INTERVAL = 10
+GRAPHQL_METRICS_TTL = 60 * 60 * 24
+
+# SQL queries allowed per GraphQL operation name, going over logs a warning.
+# core.testing.GraphQLBudgetTestCase asserts the same budgets in tests
+GRAPHQL_DEFAULT_QUERY_BUDGET = 30
+GRAPHQL_QUERY_BUDGETS = {
+    'Products': 6,
+    'FullProducts': 2,
+    'Collections': 2,
+    'Cart': 6,
+    'Orders': 4,
+}
+
+# HTTP caching of GraphQL queries sent over GET, keyed on operation name.
+# Responses get an ETag, cached until one of the policy's tags is invalidated,
+# and a 304 when the client sends it back. Tags may name variables. Anonymous
+# responses may be stored by shared caches for max_age seconds
+GRAPHQL_CACHE_POLICIES = {
+    'Products': {'max_age': 60, 'tags': ['product:*', 'collection:*', 'promotion:*']},
+    'FullProducts': {
+        'max_age': 60,
+        'tags': ['product:*', 'collection:*', 'promotion:*', 'tag:*'],
+    },
+    'Product': {'max_age': 60, 'tags': ['product:{id}', 'collection:*', 'promotion:*']},
+    'Collections': {'max_age': 60 * 5, 'tags': ['collection:*', 'product:*']},
+}
+
+# Threads running blocking resolvers for the async GraphQL view, each keeps
+# its own database connection
+GRAPHQL_ASYNC_THREADS = 16
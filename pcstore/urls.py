@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 from core.schema import schema
+from core.backend import backend
+from core.views import AsyncGraphQLView, GraphQLView, graphql_metrics
 
 import debug_toolbar
 
@@ -13,6 +14,8 @@ admin.site.index_title = 'Admin'
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('store/', include('store.urls')),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),
+    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema, backend=backend))),
+    path("graphql/async", AsyncGraphQLView.as_async_view(schema=schema, backend=backend)),
+    path('internal/graphql-metrics', graphql_metrics),
     path('__debug__/', include(debug_toolbar.urls)),
 ]
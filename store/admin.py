@@ -5,6 +5,9 @@ from django.db.models.query import QuerySet
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
 from . import models
+from .cache import invalidate_products
+from .listings import refresh_product_listings
+from .pricing import effective_price
 
 
 # Register your models here.
@@ -30,7 +33,7 @@ class ProductAdmin(admin.ModelAdmin):
         'slug': ['title']
     }
     actions = ['clear_inventory']
-    list_display = ['title', 'price',
+    list_display = ['title', 'price', 'product_effective_price',
                     'inventory_status', 'collection_title', 'product_promotions']
     list_editable = ['price']
     list_filter = ['collection', 'last_update', InventoryFilter]
@@ -38,14 +41,19 @@ class ProductAdmin(admin.ModelAdmin):
     list_select_related = ['collection']
     search_fields = ['title']
 
+    def get_queryset(self, request):
+        # Promotions of the whole page in one query instead of one per row
+        return super().get_queryset(request).prefetch_related('promotions')
+
+    @admin.display(description='effective price')
+    def product_effective_price(self, product: models.Product):
+        return effective_price(
+            product.price, [promotion.discount for promotion in product.promotions.all()])
+
     def product_promotions(self, product: models.Product):
-        # product_promotion = [
-        #     promotion for promotion in product.promotions.values('discount')]
-        product_promotion = [
-            promotion for promotion in product.promotions.values('discount')]
         promotion_list = []
-        for promotion in product_promotion:
-            promotion_list.append(f"{promotion['discount']} " + '%')
+        for promotion in product.promotions.all():
+            promotion_list.append(f"{promotion.discount} " + '%')
 
         if len(promotion_list) == 0:
             return 'No discount for this Product'
@@ -62,7 +70,11 @@ class ProductAdmin(admin.ModelAdmin):
 
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
+        product_ids = list(queryset.values_list('pk', flat=True))
         updated_count = queryset.update(inventory=0)
+        # Bulk updates skip the model signals
+        refresh_product_listings(product_ids)
+        invalidate_products(product_ids)
         self.message_user(
             request,
             f'{updated_count} products were successfully updated.',
@@ -136,6 +148,14 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'placed_at', 'customer']
 
 
+@admin.register(models.QueuedOrder)
+class QueuedOrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at', 'status', 'customer', 'order', 'error']
+    list_filter = ['status', 'created_at']
+    list_select_related = ['customer__user']
+    raw_id_fields = ['customer', 'order']
+
+
 class CartItemInline(admin.TabularInline):
     autocomplete_fields = ['product']
     min_num = 1
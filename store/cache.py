@@ -0,0 +1,20 @@
+import hashlib
+import json
+from core.cache_tags import invalidate_tags, model_tag, object_tags
+from .models import Collection, Product, Promotion
+
+
+# Entries built from the whole catalog: listings, facets and counts
+CATALOG_TAGS = [model_tag(Product), model_tag(Collection), model_tag(Promotion)]
+
+
+def invalidate_products(product_ids):
+    # For writes that skip the model signals, with the ids they touched
+    invalidate_tags(*CATALOG_TAGS, *[
+        tag for product_id in product_ids for tag in object_tags(Product, product_id)])
+
+
+def make_cache_key(prefix, *parts):
+    normalized = json.dumps(parts, sort_keys=True, default=str)
+    digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    return f'{prefix}:{digest}'
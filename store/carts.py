@@ -0,0 +1,454 @@
+import logging
+from datetime import datetime
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from core.cache_tags import model_tag, set_tagged, tag_generation
+from .models import Cart, CartItem, Product, Promotion, QueuedOrder
+from .pricing import cache_effective_prices, get_effective_prices, price_rows
+
+
+logger = logging.getLogger(__name__)
+
+
+def cart_summary_key(cart_id):
+    return f'cart-summary:{cart_id}'
+
+
+def summarize(quantities, prices):
+    # quantities maps a cart item id to its product id and quantity, prices
+    # are pricing.get_effective_prices entries. Items whose product is gone
+    # are left out
+    items = {
+        item_id: (quantity, prices[product_id]['effective_price'])
+        for item_id, (product_id, quantity) in quantities.items()
+        if product_id in prices
+    }
+    return {
+        'product_ids': sorted(prices),
+        'items_count': len(items),
+        'items_number': sum(quantity for quantity, _ in items.values()),
+        'total_price': sum(
+            (quantity * price for quantity, price in items.values()), Decimal(0)),
+        'promotion_ids': sorted({
+            promotion_id for price in prices.values() for promotion_id in price['promotion_ids']}),
+    }
+
+
+def compute_cart_summary(cart_id):
+    # Items joined with their product price and promotions in one query, the
+    # prices also serve the cart item totals
+    generation = tag_generation()
+    rows = CartItem.objects \
+        .filter(cart_id=cart_id) \
+        .order_by() \
+        .values_list('id', 'quantity', 'product_id', 'product__price',
+                     'product__promotions__id', 'product__promotions__discount')
+
+    quantities = {row[0]: (row[2], row[1]) for row in rows}
+    prices = price_rows(row[2:] for row in rows)
+    cache_effective_prices(prices, generation)
+    return summarize(quantities, prices)
+
+
+def compute_items_summary(cart_items):
+    # Same summary for items that are not in the database
+    quantities = {item.id: (item.product_id, item.quantity) for item in cart_items}
+    return summarize(quantities, get_effective_prices(
+        product_id for product_id, _ in quantities.values()))
+
+
+def get_cart_summary(info, cart_id):
+    # Memoized for the request and cached until the cart, one of its
+    # products or their promotions change
+    summaries = getattr(info.context, 'cart_summaries', None)
+    if summaries is None:
+        summaries = {}
+        if info.context is not None:
+            info.context.cart_summaries = summaries
+    if cart_id in summaries:
+        return summaries[cart_id]
+
+    key = cart_summary_key(cart_id)
+    summary = cache.get(key)
+    if summary is None:
+        generation = tag_generation()
+        summary = get_cart_store().compute_summary(cart_id)
+        set_tagged(key, summary, [
+            *[model_tag(Product, product_id) for product_id in summary['product_ids']],
+            *[model_tag(Promotion, promotion_id) for promotion_id in summary['promotion_ids']],
+        ], generation, settings.CART_SUMMARY_CACHE_TTL)
+    summaries[cart_id] = summary
+    return summary
+
+
+def invalidate_cart_summary(cart_id):
+    cache.delete(cart_summary_key(cart_id))
+
+
+class DatabaseCartStore:
+    # Every cart change is a database write
+
+    def create_cart(self):
+        return Cart.objects.create()
+
+    def get_cart(self, cart_id):
+        return Cart.objects.get(pk=cart_id)
+
+    def delete_cart(self, cart_id):
+        Cart.objects.filter(pk=cart_id).delete()
+
+    def get_items(self, cart_id):
+        return CartItem.objects.filter(cart_id=cart_id)
+
+    def get_item(self, item_id):
+        return CartItem.objects.get(pk=item_id)
+
+    def add_item(self, cart_id, product_id, quantity):
+        try:
+            cart_item = CartItem.objects.get(cart_id=cart_id, product_id=product_id)
+            cart_item.quantity += quantity
+        except CartItem.DoesNotExist:
+            cart_item = CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+        cart_item.save()
+        return cart_item
+
+    def update_item(self, item_id, quantity):
+        cart_item = CartItem.objects.get(pk=item_id)
+        cart_item.quantity = quantity
+        cart_item.save()
+        return cart_item
+
+    def delete_item(self, item_id):
+        CartItem.objects.filter(pk=item_id).delete()
+
+    def compute_summary(self, cart_id):
+        return compute_cart_summary(cart_id)
+
+    def persist(self, cart_id):
+        pass
+
+    def flush(self, batch_size=None):
+        return 0
+
+
+class RedisCartStore:
+    # Active carts live in Redis hashes and are written to the database in
+    # batches by persist_carts, or right away at checkout. A cart hash holds
+    # created_at, q:<product id> quantities and i:<product id> item ids,
+    # cart-item:<item id> points back to '<cart id>:<product id>'. Item ids
+    # come from a counter started above the database ones so they are kept
+    # when written. Carts only in the database are loaded on their first
+    # change, carts left alone expire after CART_STORE_TTL
+    ITEM_IDS_KEY = 'cart-item-ids'
+    DIRTY_KEY = 'carts-dirty'
+
+    def __init__(self, client=None):
+        if client is None:
+            from django_redis import get_redis_connection
+            client = get_redis_connection(settings.CART_STORE_REDIS_ALIAS)
+        self.client = client
+
+    def cart_key(self, cart_id):
+        return f'cart:{cart_id}'
+
+    def item_key(self, item_id):
+        return f'cart-item:{item_id}'
+
+    def read(self, cart_id):
+        values = self.client.hgetall(self.cart_key(cart_id))
+        if not values:
+            return None
+        values = {key.decode(): value.decode() for key, value in values.items()}
+        # Fields orphaned by writes that raced are skipped, a missing
+        # created_at reads as now
+        created_at = values.get('created_at')
+        created_at = datetime.fromisoformat(created_at) if created_at else timezone.now()
+        items = []
+        for key, value in values.items():
+            if not key.startswith('q:') or f'i:{key[2:]}' not in values:
+                continue
+            items.append(CartItem(
+                id=int(values[f'i:{key[2:]}']),
+                cart_id=cart_id,
+                product_id=int(key[2:]),
+                quantity=int(value),
+            ))
+        items.sort(key=lambda item: item.id)
+        return Cart(id=cart_id, created_at=created_at), items
+
+    def write(self, cart_id, created_at, items=()):
+        pipeline = self.client.pipeline()
+        key = self.cart_key(cart_id)
+        mapping = {'created_at': created_at.isoformat()}
+        for item in items:
+            mapping[f'q:{item.product_id}'] = item.quantity
+            mapping[f'i:{item.product_id}'] = item.id
+            pipeline.set(self.item_key(item.id), f'{cart_id}:{item.product_id}',
+                         ex=settings.CART_STORE_TTL)
+        pipeline.hset(key, mapping=mapping)
+        pipeline.expire(key, settings.CART_STORE_TTL)
+        pipeline.execute()
+
+    def touch(self, cart_id, *item_ids):
+        # Marks the cart for the next flush and pushes its expiry back
+        pipeline = self.client.pipeline()
+        pipeline.sadd(self.DIRTY_KEY, str(cart_id))
+        pipeline.expire(self.cart_key(cart_id), settings.CART_STORE_TTL)
+        for item_id in item_ids:
+            pipeline.expire(self.item_key(item_id), settings.CART_STORE_TTL)
+        pipeline.execute()
+        invalidate_cart_summary(cart_id)
+
+    def load(self, cart_id):
+        # Makes sure a cart is in Redis before changing it
+        if self.client.exists(self.cart_key(cart_id)):
+            return True
+        cart = Cart.objects.filter(pk=cart_id).first()
+        if cart is None:
+            return False
+        self.write(cart_id, cart.created_at, list(cart.items.all()))
+        return True
+
+    def next_item_id(self):
+        if not self.client.exists(self.ITEM_IDS_KEY):
+            # The counter was lost, it restarts above the ids issued so far,
+            # the ones only in Redis included
+            last = CartItem.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            for key in self.client.scan_iter(match=self.item_key('*'), count=1000):
+                last = max(last, int(key.decode().rsplit(':', 1)[1]))
+            self.client.set(self.ITEM_IDS_KEY, last, nx=True)
+        return self.client.incr(self.ITEM_IDS_KEY)
+
+    def find_item(self, item_id):
+        value = self.client.get(self.item_key(item_id))
+        if value is not None:
+            cart_id, product_id = value.decode().split(':')
+            return cart_id, int(product_id)
+        # Not changed for a while, the database knows its cart
+        cart_id = CartItem.objects.filter(pk=item_id).values_list('cart_id', flat=True).first()
+        if cart_id is not None and self.load(cart_id):
+            for item in self.read(cart_id)[1]:
+                if item.id == int(item_id):
+                    self.client.set(self.item_key(item.id), f'{cart_id}:{item.product_id}',
+                                    ex=settings.CART_STORE_TTL)
+                    return str(cart_id), item.product_id
+        raise CartItem.DoesNotExist('CartItem matching query does not exist.')
+
+    def create_cart(self):
+        cart = Cart(created_at=timezone.now())
+        self.write(cart.id, cart.created_at)
+        self.touch(cart.id)
+        return cart
+
+    def get_cart(self, cart_id):
+        stored = self.read(cart_id)
+        if stored is None:
+            return Cart.objects.get(pk=cart_id)
+        return stored[0]
+
+    def delete_cart(self, cart_id):
+        stored = self.read(cart_id)
+        pipeline = self.client.pipeline()
+        pipeline.delete(self.cart_key(cart_id))
+        pipeline.srem(self.DIRTY_KEY, str(cart_id))
+        for item in stored[1] if stored else []:
+            pipeline.delete(self.item_key(item.id))
+        pipeline.execute()
+        Cart.objects.filter(pk=cart_id).delete()
+        invalidate_cart_summary(cart_id)
+
+    def get_items(self, cart_id):
+        stored = self.read(cart_id)
+        if stored is None:
+            return list(CartItem.objects.filter(cart_id=cart_id))
+        return stored[1]
+
+    def get_item(self, item_id):
+        cart_id, product_id = self.find_item(item_id)
+        quantity = self.client.hget(self.cart_key(cart_id), f'q:{product_id}')
+        if quantity is None:
+            raise CartItem.DoesNotExist('CartItem matching query does not exist.')
+        return CartItem(id=int(item_id), cart_id=cart_id, product_id=product_id,
+                        quantity=int(quantity))
+
+    def add_item(self, cart_id, product_id, quantity):
+        if not self.load(cart_id):
+            raise Cart.DoesNotExist('No cart with the given ID was found !!!')
+        if not Product.objects.filter(pk=product_id).exists():
+            raise Product.DoesNotExist('No product with the given ID was found !!')
+        # The item id and quantity are written together, a concurrent change
+        # of the cart makes it start over
+        from redis.exceptions import WatchError
+        key = self.cart_key(cart_id)
+        with self.client.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(key)
+                    if not pipeline.exists(key):
+                        # Expired since it was loaded
+                        pipeline.unwatch()
+                        if not self.load(cart_id):
+                            raise Cart.DoesNotExist('No cart with the given ID was found !!!')
+                        continue
+                    item_id, total = pipeline.hmget(key, f'i:{product_id}', f'q:{product_id}')
+                    item_id = int(item_id) if item_id is not None else self.next_item_id()
+                    total = int(total or 0) + quantity
+                    pipeline.multi()
+                    pipeline.hset(key, mapping={f'i:{product_id}': item_id, f'q:{product_id}': total})
+                    pipeline.set(self.item_key(item_id), f'{cart_id}:{product_id}',
+                                 ex=settings.CART_STORE_TTL)
+                    pipeline.execute()
+                    break
+                except WatchError:
+                    continue
+        self.touch(cart_id, item_id)
+        return CartItem(id=item_id, cart_id=cart_id, product_id=product_id, quantity=total)
+
+    def update_item(self, item_id, quantity):
+        # Only while the item is still in the cart, a concurrent delete wins
+        from redis.exceptions import WatchError
+        cart_id, product_id = self.find_item(item_id)
+        key = self.cart_key(cart_id)
+        with self.client.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(key)
+                    if not pipeline.exists(key):
+                        pipeline.unwatch()
+                        if not self.load(cart_id):
+                            raise CartItem.DoesNotExist('CartItem matching query does not exist.')
+                        continue
+                    if pipeline.hget(key, f'i:{product_id}') is None:
+                        raise CartItem.DoesNotExist('CartItem matching query does not exist.')
+                    pipeline.multi()
+                    pipeline.hset(key, f'q:{product_id}', quantity)
+                    pipeline.execute()
+                    break
+                except WatchError:
+                    continue
+        self.touch(cart_id, item_id)
+        return CartItem(id=int(item_id), cart_id=cart_id, product_id=product_id,
+                        quantity=quantity)
+
+    def delete_item(self, item_id):
+        try:
+            cart_id, product_id = self.find_item(item_id)
+        except CartItem.DoesNotExist:
+            return
+        self.client.hdel(self.cart_key(cart_id), f'q:{product_id}', f'i:{product_id}')
+        self.client.delete(self.item_key(item_id))
+        self.touch(cart_id)
+
+    def compute_summary(self, cart_id):
+        stored = self.read(cart_id)
+        if stored is None:
+            return compute_cart_summary(cart_id)
+        return compute_items_summary(stored[1])
+
+    @transaction.atomic
+    def save(self, cart, items):
+        # Makes the database copy of the cart match the Redis one
+        if not Cart.objects.filter(pk=cart.id).exists():
+            Cart.objects.create(id=cart.id)
+            # auto_now_add ignores the given value
+            Cart.objects.filter(pk=cart.id).update(created_at=cart.created_at)
+        product_ids = set(Product.objects
+                          .filter(pk__in={item.product_id for item in items})
+                          .values_list('id', flat=True))
+        items = [item for item in items if item.product_id in product_ids]
+        CartItem.objects.filter(cart_id=cart.id).exclude(pk__in=[item.id for item in items]).delete()
+        existing = set(CartItem.objects.filter(cart_id=cart.id).values_list('id', flat=True))
+        CartItem.objects.bulk_update(
+            [item for item in items if item.id in existing], ['quantity'])
+        CartItem.objects.bulk_create(
+            [item for item in items if item.id not in existing])
+
+    def persist(self, cart_id):
+        # Before checkout: the cart moves to the database and leaves Redis,
+        # it is loaded back if changed again. It only leaves Redis once
+        # saved, and only if it didn't change meanwhile, otherwise the new
+        # version is saved
+        from redis.exceptions import WatchError
+        key = self.cart_key(cart_id)
+        with self.client.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(key)
+                    stored = self.read(cart_id)
+                    if stored is None:
+                        return
+                    self.save(*stored)
+                    pipeline.multi()
+                    pipeline.delete(key)
+                    pipeline.srem(self.DIRTY_KEY, str(cart_id))
+                    for item in stored[1]:
+                        pipeline.delete(self.item_key(item.id))
+                    pipeline.execute()
+                    return
+                except WatchError:
+                    continue
+
+    def flush(self, batch_size=None):
+        # Write behind: saves the carts changed since the last flush. Carts
+        # that fail to save stay dirty for the next flush
+        flushed = 0
+        failed = []
+        while True:
+            cart_ids = self.client.spop(self.DIRTY_KEY, batch_size or settings.CART_STORE_FLUSH_BATCH_SIZE)
+            if not cart_ids:
+                break
+            for cart_id in cart_ids:
+                try:
+                    stored = self.read(cart_id.decode())
+                    if stored is not None:
+                        self.save(*stored)
+                        flushed += 1
+                except Exception:
+                    logger.exception('Persisting cart %s failed', cart_id.decode())
+                    failed.append(cart_id)
+        if failed:
+            self.client.sadd(self.DIRTY_KEY, *failed)
+        return flushed
+
+
+CART_STORES = {
+    'database': DatabaseCartStore,
+    'redis': RedisCartStore,
+}
+
+cart_store = None
+
+
+def get_cart_store():
+    global cart_store
+    if cart_store is None or not isinstance(cart_store, CART_STORES[settings.CART_STORE]):
+        cart_store = CART_STORES[settings.CART_STORE]()
+    return cart_store
+
+
+def expired_carts(cutoff):
+    # Carts waiting for an order worker are kept whatever their age
+    pending = QueuedOrder.objects \
+        .filter(status__in=[QueuedOrder.STATUS_QUEUED, QueuedOrder.STATUS_PROCESSING]) \
+        .values('cart_id')
+    return Cart.objects.filter(created_at__lt=cutoff).exclude(pk__in=pending)
+
+
+def delete_expired_carts(cutoff, chunk_size):
+    # Deletes the oldest chunk_size expired carts and their items in one
+    # short transaction. Carts locked by a checkout are skipped, they are
+    # deleted by it or by a later sweep. A regular delete, so the cart
+    # signals still drop whatever the cache holds for them
+    with transaction.atomic():
+        cart_ids = list(
+            expired_carts(cutoff)
+            .select_for_update(skip_locked=True)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:chunk_size])
+        if not cart_ids:
+            return 0, 0
+        _, deleted = Cart.objects.filter(pk__in=cart_ids).delete()
+    return deleted.get(Cart._meta.label, 0), deleted.get(CartItem._meta.label, 0)
@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from django.db.models import Count
+from .models import Collection, Product
+
+
+# Counter key for the whole catalog, other keys are collection ids
+ALL_PRODUCTS = 'all'
+
+
+def counter_key(key):
+    if key == ALL_PRODUCTS:
+        return 'products-count'
+    return f'products-count:collection:{key}'
+
+
+def count_products(keys):
+    # Fallback used when a counter is missing from the cache
+    counts = {}
+    if ALL_PRODUCTS in keys:
+        counts[ALL_PRODUCTS] = Product.objects.count()
+    collection_ids = [key for key in keys if key != ALL_PRODUCTS]
+    if collection_ids:
+        counts.update({collection_id: 0 for collection_id in collection_ids})
+        counts.update(
+            Product.objects.filter(collection_id__in=collection_ids)
+            .order_by()
+            .values('collection_id')
+            .annotate(count=Count('id'))
+            .values_list('collection_id', 'count'))
+    return counts
+
+
+def get_product_counts(keys):
+    cache_keys = {counter_key(key): key for key in keys}
+    cached = cache.get_many(list(cache_keys))
+    counts = {cache_keys[cache_key]: value for cache_key, value in cached.items()}
+
+    missing = [key for key in keys if key not in counts]
+    if missing:
+        for key, value in count_products(missing).items():
+            cache.add(counter_key(key), value, timeout=None)
+            counts[key] = value
+    return counts
+
+
+def get_products_count():
+    return get_product_counts([ALL_PRODUCTS])[ALL_PRODUCTS]
+
+
+def get_collection_products_count(collection_id):
+    return get_product_counts([collection_id])[collection_id]
+
+
+def increment_counter(key, delta):
+    try:
+        cache.incr(counter_key(key), delta)
+    except ValueError:
+        # Not initialised yet, it will be counted on the next read
+        pass
+
+
+def reconcile_product_counters():
+    counts = count_products(
+        [ALL_PRODUCTS] + list(Collection.objects.values_list('id', flat=True)))
+    cache.set_many(
+        {counter_key(key): value for key, value in counts.items()}, timeout=None)
+    return counts
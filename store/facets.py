@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from django.db import transaction
+from django.db.models import Count
+from django_filters import CharFilter, FilterSet
+from .models import ProductSpec
+
+
+# Keys of Product.description exposed as facets
+FACET_KEYS = ('brand', 'processor_type', 'memory', 'drive_type', 'gpu_chipset')
+
+
+def extract_specs(description):
+    if not isinstance(description, dict):
+        return {}
+    specs = {}
+    for key in FACET_KEYS:
+        value = str(description.get(key) or '').strip()
+        if value:
+            specs[key] = value[:255]
+    return specs
+
+
+def sync_product_specs(products):
+    products = list(products)
+    with transaction.atomic():
+        ProductSpec.objects.filter(product__in=products).delete()
+        ProductSpec.objects.bulk_create([
+            ProductSpec(product=product, key=key, value=value)
+            for product in products
+            for key, value in extract_specs(product.description).items()
+        ])
+
+
+def facet_counts(queryset):
+    # Value counts of every facet for the whole result set in one query
+    rows = ProductSpec.objects \
+        .filter(product_id__in=queryset.order_by().values('pk')) \
+        .values('key', 'value') \
+        .annotate(count=Count('id')) \
+        .order_by('key', '-count', 'value')
+
+    facets = OrderedDict((key, []) for key in FACET_KEYS)
+    for row in rows:
+        facets.setdefault(row['key'], []).append(
+            {'value': row['value'], 'count': row['count']})
+    return [{'key': key, 'values': values} for key, values in facets.items()]
+
+
+class SpecFilterSet(FilterSet):
+    # Comma separated values are OR-ed, different facets are AND-ed
+    brand = CharFilter(method='filter_spec')
+    processor_type = CharFilter(method='filter_spec')
+    memory = CharFilter(method='filter_spec')
+    drive_type = CharFilter(method='filter_spec')
+    gpu_chipset = CharFilter(method='filter_spec')
+
+    def spec_values(self, value):
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    def filter_spec(self, queryset, name, value):
+        values = self.spec_values(value)
+        return queryset.filter(pk__in=ProductSpec.objects
+                               .filter(key=name, value__in=values)
+                               .values('product_id'))
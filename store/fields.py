@@ -0,0 +1,184 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+from core.cache_tags import set_tagged, tag_generation
+from .cache import CATALOG_TAGS, make_cache_key
+
+
+def json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=json_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise GraphQLError('Invalid cursor !')
+    if not isinstance(values, list) or len(values) != size:
+        raise GraphQLError('Invalid cursor !')
+    return values
+
+
+def is_ordering_column(query, name):
+    if name in query.annotations:
+        return True
+    try:
+        field = query.get_meta().get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return field.concrete and not field.is_relation
+
+
+def keyset_ordering(queryset):
+    # Columns of the active ordering followed by the primary key, which
+    # makes every position in the result set unique. Cursors hold the values
+    # read back from each row, so orderings that are not a column of the row
+    # (related fields, expressions, random) are rejected instead of dropped
+    query = queryset.query
+    ordering = []
+    for field in query.order_by or query.get_meta().ordering:
+        name = field.lstrip('-') if isinstance(field, str) else None
+        if name in ('pk', 'id'):
+            return ordering + [('pk', field.startswith('-'))]
+        if not name or '__' in name or not is_ordering_column(query, name):
+            raise ValueError(f'Keyset pagination cannot order by {field!r}')
+        ordering.append((name, field.startswith('-')))
+    return ordering + [('pk', False)]
+
+
+def keyset_filter(ordering, values, forward):
+    # (a, b, id) > (x, y, z) spelled out so it works on every backend:
+    # a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+    condition = Q()
+    equal = Q()
+    for (name, descending), value in zip(ordering, values):
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class KeysetFilterConnectionField(DjangoFilterConnectionField):
+    # Pages are fetched with a WHERE clause on the ordering columns instead
+    # of OFFSET, so deep pages cost the same as the first one. Cursors are
+    # opaque encodings of the ordering values of an edge.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # DjangoConnectionField always adds an offset argument
+        self._base_args.pop('offset', None)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return super().resolve_connection(connection, args, iterable, max_limit)
+
+        ordering = keyset_ordering(iterable)
+        queryset = iterable.order_by(
+            *[('-' if descending else '') + name for name, descending in ordering])
+
+        after = args.get('after')
+        before = args.get('before')
+        if after:
+            values = decode_cursor(after, len(ordering))
+            queryset = queryset.filter(keyset_filter(ordering, values, forward=True))
+        if before:
+            values = decode_cursor(before, len(ordering))
+            queryset = queryset.filter(keyset_filter(ordering, values, forward=False))
+
+        first = args.get('first')
+        last = args.get('last')
+        if last and not first:
+            rows = list(queryset.reverse()[:last + 1])
+            has_previous_page = len(rows) > last
+            rows = rows[:last][::-1]
+            has_next_page = bool(before)
+        else:
+            size = first or max_limit
+            rows = list(queryset[:size + 1] if size else queryset)
+            has_next_page = bool(size) and len(rows) > size
+            rows = rows[:size]
+            has_previous_page = bool(after)
+
+        edges = [
+            connection.Edge(
+                node=row,
+                cursor=encode_cursor([getattr(row, name) for name, _ in ordering]))
+            for row in rows
+        ]
+        result = connection(edges=edges, page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page,
+        ))
+        result.iterable = iterable
+        return result
+
+
+class CachedFilterConnectionField(KeysetFilterConnectionField):
+    # Caches the materialized page of a filtered connection. The key covers
+    # the field arguments and the SQL built by the filterset, so search,
+    # filters, ordering and pagination each get their own entry. Entries
+    # are dropped by any catalog change through their CATALOG_TAGS
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet):
+            return super().resolve_connection(connection, args, iterable, max_limit)
+
+        try:
+            sql = str(iterable.query)
+        except EmptyResultSet:
+            sql = None
+        arguments = {key: value for key, value in args.items() if value is not None}
+        key = make_cache_key(connection._meta.name, arguments, sql)
+
+        cached = cache.get(key)
+        if cached is not None:
+            return cls.connection_from_cache(connection, iterable, cached)
+
+        generation = tag_generation()
+        result = super().resolve_connection(connection, args, iterable, max_limit)
+        set_tagged(key, {
+            'edges': [(edge.cursor, edge.node) for edge in result.edges],
+            'page_info': {
+                'start_cursor': result.page_info.start_cursor,
+                'end_cursor': result.page_info.end_cursor,
+                'has_previous_page': result.page_info.has_previous_page,
+                'has_next_page': result.page_info.has_next_page,
+            },
+        }, CATALOG_TAGS, generation, settings.PRODUCTS_CACHE_TTL)
+        return result
+
+    @classmethod
+    def connection_from_cache(cls, connection, iterable, cached):
+        edges = [
+            connection.Edge(node=node, cursor=cursor)
+            for cursor, node in cached['edges']
+        ]
+        result = connection(edges=edges, page_info=PageInfo(**cached['page_info']))
+        result.iterable = iterable
+        return result
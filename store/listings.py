@@ -0,0 +1,169 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.db.models.query import ModelIterable
+from tags.models import Tag, TaggedItem
+from .facets import FACET_KEYS, extract_specs
+from .models import Collection, Product, ProductListing, Promotion
+from .pricing import effective_price
+
+
+# Product columns copied to the listing, in Product field order
+PRODUCT_COLUMNS = ('id', 'title', 'price', 'inventory', 'slug', 'last_update', 'collection_id')
+
+bulk_refresh = ContextVar('bulk_refresh', default=False)
+
+
+@contextmanager
+def listings_refreshed_in_bulk():
+    # Within it the tag signals leave the listings alone, the caller
+    # refreshes every product it wrote in one go
+    token = bulk_refresh.set(True)
+    try:
+        yield
+    finally:
+        bulk_refresh.reset(token)
+
+
+def primary_image(images):
+    # images holds {'image1': {'title', 'src'}, ...} or a list of the same
+    if isinstance(images, dict):
+        images = list(images.values())
+    if not isinstance(images, list) or not images:
+        return ''
+    image = images[0]
+    if isinstance(image, dict):
+        image = image.get('src') or ''
+    return str(image)
+
+
+def build_listing(product, tags):
+    promotions = sorted(product.promotions.all(), key=lambda promotion: promotion.id)
+    specs = extract_specs(product.description)
+    return ProductListing(
+        product_id=product.id,
+        title=product.title,
+        slug=product.slug,
+        price=product.price,
+        effective_price=effective_price(
+            product.price, [promotion.discount for promotion in promotions]),
+        inventory=product.inventory,
+        last_update=product.last_update,
+        collection_id=product.collection_id,
+        collection_title=product.collection.title,
+        image=primary_image(product.images),
+        promotions=[
+            [promotion.id, promotion.description, promotion.discount]
+            for promotion in promotions
+        ],
+        tags=[[tag.id, tag.label] for tag in sorted(tags, key=lambda tag: tag.id)],
+        **{key: specs.get(key, '') for key in FACET_KEYS},
+    )
+
+
+def refresh_listings_batch(product_ids):
+    products = Product.objects \
+        .filter(pk__in=product_ids) \
+        .select_related('collection') \
+        .prefetch_related('promotions')
+    tags = defaultdict(list)
+    for item in TaggedItem.objects.get_tags_for_many(Product, product_ids):
+        tags[item.object_id].append(item.tag)
+    with transaction.atomic():
+        ProductListing.objects.filter(pk__in=product_ids).delete()
+        ProductListing.objects.bulk_create([
+            build_listing(product, tags[product.id]) for product in products])
+
+
+def refresh_product_listings(product_ids=None, batch_size=500):
+    # Rewrites the listing rows of the products, without ids every product
+    # is listed again. Returns the number of products handled
+    if product_ids is not None:
+        product_ids = sorted(set(product_ids))
+        for start in range(0, len(product_ids), batch_size):
+            refresh_listings_batch(product_ids[start:start + batch_size])
+        return len(product_ids)
+
+    count = last_id = 0
+    while True:
+        batch = list(Product.objects
+                     .filter(pk__gt=last_id)
+                     .order_by('id')
+                     .values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return count
+        refresh_listings_batch(batch)
+        count += len(batch)
+        last_id = batch[-1]
+
+
+def rename_listed_collection(collection):
+    ProductListing.objects \
+        .filter(collection_id=collection.pk) \
+        .exclude(collection_title=collection.title) \
+        .update(collection_title=collection.title)
+
+
+def decrement_listed_inventory(quantities):
+    # Mirrors store.orders.decrement_inventory
+    ProductListing.objects.filter(pk__in=quantities).update(inventory=Case(
+        *[When(pk=product_id, then=F('inventory') - quantity)
+          for product_id, quantity in quantities.items()],
+        default=F('inventory'),
+    ))
+
+
+def listed_product(listing):
+    # Product holding the listing columns, description and images are
+    # deferred. The row itself stays reachable as product.listing
+    product = Product.from_db(
+        listing._state.db, PRODUCT_COLUMNS,
+        [listing.pk if column == 'id' else getattr(listing, column) for column in PRODUCT_COLUMNS])
+    product.listing = listing
+    return product
+
+
+def cached_listing(product):
+    # The row a product was built from, None for products read from their table
+    if Product.listing.is_cached(product):
+        return product.listing
+    return None
+
+
+def listed_collection(listing):
+    # The featured product is deferred
+    return Collection.from_db(
+        listing._state.db, ('id', 'title'), [listing.collection_id, listing.collection_title])
+
+
+def listed_promotions(listing):
+    return [
+        Promotion(id=promotion_id, description=description, discount=discount)
+        for promotion_id, description, discount in listing.promotions
+    ]
+
+
+def listed_tags(listing):
+    return [Tag(id=tag_id, label=label) for tag_id, label in listing.tags]
+
+
+class ListedProductIterable(ModelIterable):
+    def __iter__(self):
+        annotations = list(self.queryset.query.annotation_select)
+        for listing in super().__iter__():
+            product = listed_product(listing)
+            for name in annotations:
+                setattr(product, name, getattr(listing, name))
+            yield product
+
+
+def listed_products(queryset=None):
+    # Listing rows read as products, lists of products never touch the
+    # product table. Filters and ordering apply to the listing columns
+    if queryset is None:
+        queryset = ProductListing.objects.all()
+    queryset = queryset.all()
+    queryset._iterable_class = ListedProductIterable
+    return queryset
@@ -0,0 +1,88 @@
+from collections import defaultdict
+from promise.dataloader import DataLoader
+from core.concurrency import resolve_blocking
+from .counters import get_product_counts
+from .models import Collection, Customer, OrderItem, Product
+from .pricing import get_effective_prices
+
+
+def get_loader(info, loader_class):
+    # One loader instance per request so every id requested while resolving
+    # the same operation is collected and fetched with a single IN query
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = {}
+        if context is not None:
+            context.loaders = loaders
+    if loader_class not in loaders:
+        loaders[loader_class] = loader_class()
+    return loaders[loader_class]
+
+
+class BatchLoader(DataLoader):
+    # Subclasses must define load_batch(keys) returning one value per key,
+    # it runs in the thread pool when resolving through the async view.
+    # There is no abstract base method: DataLoader is a thread local, whose
+    # constructor skips the abstract method check of ABCMeta
+    def batch_load_fn(self, keys):
+        return resolve_blocking(self.load_batch, keys)
+
+
+class ModelLoader(BatchLoader):
+    model = None
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def load_batch(self, keys):
+        objects = self.get_queryset().in_bulk(set(keys))
+        return [objects.get(key) for key in keys]
+
+
+class ProductLoader(ModelLoader):
+    model = Product
+
+
+class CustomerLoader(ModelLoader):
+    model = Customer
+
+
+class CollectionLoader(ModelLoader):
+    model = Collection
+
+
+class OrderItemsLoader(BatchLoader):
+    # Keys are order ids, values the list of their items
+    def load_batch(self, keys):
+        items = defaultdict(list)
+        for item in OrderItem.objects.filter(order_id__in=set(keys)).order_by('id'):
+            items[item.order_id].append(item)
+        return [items[key] for key in keys]
+
+
+class ProductPromotionsLoader(BatchLoader):
+    # Keys are product ids, values the list of their promotions
+    def load_batch(self, keys):
+        promotions = defaultdict(list)
+        links = Product.promotions.through.objects \
+            .filter(product_id__in=set(keys)) \
+            .select_related('promotion') \
+            .order_by('promotion_id')
+        for link in links:
+            promotions[link.product_id].append(link.promotion)
+        return [promotions[key] for key in keys]
+
+
+class EffectivePriceLoader(BatchLoader):
+    # Keys are product ids, values their pricing.get_effective_prices entry
+    def load_batch(self, keys):
+        prices = get_effective_prices(keys)
+        return [prices.get(key) for key in keys]
+
+
+class ProductCountLoader(BatchLoader):
+    # Keys are collection ids or counters.ALL_PRODUCTS
+    def load_batch(self, keys):
+        counts = get_product_counts(list(set(keys)))
+        return [counts[key] for key in keys]
@@ -0,0 +1,276 @@
+import csv
+import json
+import time
+from pathlib import Path
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from core.cache_tags import invalidate_tags
+from store.cache import CATALOG_TAGS, invalidate_products
+from store.counters import reconcile_product_counters
+from store.facets import sync_product_specs
+from store.listings import listings_refreshed_in_bulk, refresh_product_listings
+from store.models import Collection, Product, Promotion
+from store.pricing import parse_price
+from store.search import mark_index_changed
+from tags.loaders import tags_cache_key
+from tags.models import Tag, TaggedItem
+
+
+PRODUCT_FIELDS = ['title', 'description', 'price', 'inventory', 'slug',
+                  'collection', 'images', 'last_update']
+
+
+def read_jsonl(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_json(file, chunk_size=1 << 16):
+    # Streams the items of a top level JSON array without loading the
+    # whole document
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise CommandError('A JSON feed must be an array of products')
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] in (',', ']'):
+                if buffer[0] == ']':
+                    return
+                buffer = buffer[1:]
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                break
+            yield item
+            buffer = buffer[end:]
+        if not chunk:
+            if buffer.strip():
+                raise CommandError('Unexpected end of JSON feed')
+            return
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        for key in ('description', 'images', 'promotions'):
+            if row.get(key):
+                row[key] = json.loads(row[key])
+        if row.get('tags'):
+            row['tags'] = [label for label in row['tags'].split(';') if label]
+        yield row
+
+
+def describe_error(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(
+            f'{field}: {message}'
+            for field, messages in error.message_dict.items()
+            for message in messages)
+    if isinstance(error, KeyError):
+        return f'missing {error}'
+    return '; '.join(getattr(error, 'messages', [str(error)]))
+
+
+READERS = {
+    'json': read_json,
+    'jsonl': read_jsonl,
+    'csv': read_csv,
+}
+
+
+class Command(BaseCommand):
+    help = 'Stream a JSON, JSONL or CSV product feed into the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=READERS.keys())
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        feed_format = options['format'] or path.suffix.lstrip('.').lower()
+        if feed_format not in READERS:
+            raise CommandError(f'Unknown feed format {feed_format!r}')
+
+        self.collections = {
+            collection.title: collection for collection in Collection.objects.all()}
+        self.promotions = {
+            (promotion.description, promotion.discount): promotion
+            for promotion in Promotion.objects.all()}
+        self.tags = {tag.label: tag for tag in Tag.objects.all()}
+        self.product_type = ContentType.objects.get_for_model(Product)
+        self.stats = {'created': 0, 'updated': 0, 'invalid': 0}
+
+        started = time.monotonic()
+        batch = []
+        with path.open(newline='', encoding='utf-8') as file:
+            for number, row in enumerate(READERS[feed_format](file), start=1):
+                batch.append((number, row))
+                if len(batch) >= options['batch_size']:
+                    self.import_batch(batch, started)
+                    batch = []
+        if batch:
+            self.import_batch(batch, started)
+
+        # Bulk writes skip the model signals, the products of each batch
+        # were invalidated with it
+        reconcile_product_counters()
+        invalidate_tags(*CATALOG_TAGS)
+        mark_index_changed()
+
+        elapsed = time.monotonic() - started
+        total = self.stats['created'] + self.stats['updated']
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.stats['created']} created, {self.stats['updated']} updated, "
+            f"{self.stats['invalid']} invalid in {elapsed:.1f}s "
+            f"({total / elapsed if elapsed else total:.0f} products/s)"))
+
+    def import_batch(self, batch, started):
+        # Keyed on slug, a later row of the feed wins over an earlier one
+        products = {}
+        for number, row in batch:
+            try:
+                product = self.build_product(row)
+            except (ValidationError, ValueError, TypeError, KeyError) as error:
+                self.stats['invalid'] += 1
+                self.stderr.write(f'Row {number}: {describe_error(error)}')
+                continue
+            products[product.slug] = (product, row)
+        rows = list(products.values())
+
+        with transaction.atomic():
+            existing = {}
+            for product in Product.objects.filter(
+                    slug__in=[product.slug for product, _ in rows]).order_by('id'):
+                existing.setdefault(product.slug, product)
+
+            to_create, to_update = [], []
+            for product, _ in rows:
+                current = existing.get(product.slug)
+                if current is None:
+                    to_create.append(product)
+                else:
+                    product.pk = current.pk
+                    to_update.append(product)
+
+            Product.objects.bulk_create(to_create)
+            if to_create and to_create[0].pk is None:
+                # Backends that don't return ids from bulk inserts
+                ids = dict(Product.objects
+                           .filter(slug__in=[product.slug for product in to_create])
+                           .values_list('slug', 'id'))
+                for product in to_create:
+                    product.pk = ids[product.slug]
+            Product.objects.bulk_update(to_update, PRODUCT_FIELDS)
+
+            self.import_promotions(rows)
+            with listings_refreshed_in_bulk():
+                self.import_tags(rows)
+            sync_product_specs([product for product, _ in rows])
+            refresh_product_listings([product.pk for product, _ in rows])
+        invalidate_products([product.pk for product, _ in rows])
+
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        elapsed = time.monotonic() - started
+        done = self.stats['created'] + self.stats['updated']
+        self.stdout.write(f'{done} products imported ({done / elapsed:.0f} products/s)')
+
+    def build_product(self, row):
+        collection_title = str(row['collection']).strip()
+        collection = self.collections.get(collection_title)
+        if collection is None:
+            collection = Collection(title=collection_title)
+            collection.full_clean()
+            collection.save()
+            self.collections[collection_title] = collection
+
+        description = row.get('description') or {}
+        if isinstance(description, str):
+            description = json.loads(description)
+        images = row.get('images') or {}
+        if isinstance(images, str):
+            images = json.loads(images)
+
+        product = Product(
+            title=row['title'],
+            description=description,
+            price=parse_price(row['price']),
+            inventory=row.get('inventory') or 0,
+            slug=row.get('slug') or slugify(row['title']),
+            collection=collection,
+            images=images,
+            last_update=timezone.now(),
+        )
+        # Same validation as a model form, without a query per row for the
+        # collection foreign key
+        product.clean_fields(exclude=['collection'])
+        product.clean()
+        return product
+
+    def import_promotions(self, rows):
+        rows = [(product, row['promotions']) for product, row in rows
+                if row.get('promotions') is not None]
+        if not rows:
+            return
+
+        Through = Product.promotions.through
+        links = []
+        for product, promotions in rows:
+            for item in promotions:
+                key = (item['description'], float(item['discount']))
+                if key not in self.promotions:
+                    promotion = Promotion(description=key[0], discount=key[1])
+                    promotion.full_clean()
+                    promotion.save()
+                    self.promotions[key] = promotion
+                links.append(Through(
+                    product_id=product.pk, promotion_id=self.promotions[key].pk))
+
+        Through.objects.filter(product_id__in=[product.pk for product, _ in rows]).delete()
+        Through.objects.bulk_create(links, ignore_conflicts=True)
+
+    def import_tags(self, rows):
+        rows = [(product, row['tags']) for product, row in rows
+                if row.get('tags') is not None]
+        if not rows:
+            return
+
+        missing = {label for _, labels in rows for label in labels} - set(self.tags)
+        for label in missing:
+            tag = Tag(label=label)
+            tag.full_clean()
+            tag.save()
+            self.tags[label] = tag
+
+        TaggedItem.objects.filter(
+            content_type=self.product_type,
+            object_id__in=[product.pk for product, _ in rows]).delete()
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag=self.tags[label], content_type=self.product_type,
+                       object_id=product.pk)
+            for product, labels in rows
+            for label in set(labels)
+        ])
+        # bulk_create sends no post_save, so the cached tags of the products
+        # are dropped here
+        keys = [tags_cache_key(self.product_type.id, product.pk) for product, _ in rows]
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from store.carts import get_cart_store
+
+
+class Command(BaseCommand):
+    help = 'Write the carts changed in the Redis cart store to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, default=0,
+            help='Keep running and persist every N seconds')
+        parser.add_argument('--batch-size', type=int, help='Carts read from Redis at once')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = get_cart_store().flush(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{flushed} carts persisted'))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from store.listings import refresh_product_listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product listing table the product lists are read from'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products rewritten per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = refresh_product_listings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{count} products listed in {time.monotonic() - started:.1f}s'))
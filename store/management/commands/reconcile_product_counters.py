@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from store.counters import ALL_PRODUCTS, reconcile_product_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the cached total and per-collection product counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=int, default=0,
+            help='Keep running and reconcile every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = reconcile_product_counters()
+            self.stdout.write(self.style.SUCCESS(
+                f'{counts.pop(ALL_PRODUCTS)} products in {len(counts)} collections'))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
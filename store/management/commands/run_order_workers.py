@@ -0,0 +1,66 @@
+import logging
+import multiprocessing
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from store.models import QueuedOrder
+from store.orders import process_order_queue
+
+
+logger = logging.getLogger('store.orders')
+
+
+def run_worker(batch_size, poll_interval, once):
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    placed = failed = 0
+    try:
+        while True:
+            try:
+                queued_orders = process_order_queue(batch_size)
+            except Exception:
+                # Orders left claimed are retried after ORDER_QUEUE_CLAIM_TIMEOUT
+                logger.exception('Placing queued orders failed')
+                connections.close_all()
+                time.sleep(poll_interval)
+                continue
+            placed += sum(order.status == QueuedOrder.STATUS_PLACED for order in queued_orders)
+            failed += sum(order.status == QueuedOrder.STATUS_FAILED for order in queued_orders)
+            if not queued_orders:
+                if once:
+                    break
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connections.close_all()
+    return placed, failed
+
+
+class Command(BaseCommand):
+    help = 'Place the orders queued by createOrder when ORDER_QUEUE_ENABLED is set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_QUEUE_BATCH_SIZE,
+                            help='Orders claimed by a worker at once')
+        parser.add_argument('--poll-interval', type=float, default=1,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+
+    def handle(self, *args, **options):
+        worker_args = (options['batch_size'], options['poll_interval'], options['once'])
+        if options['workers'] == 1:
+            results = [run_worker(*worker_args)]
+        else:
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+                try:
+                    results = pool.starmap(run_worker, [worker_args] * options['workers'])
+                except KeyboardInterrupt:
+                    pool.terminate()
+                    return
+        placed = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        self.stdout.write(self.style.SUCCESS(f'{placed} orders placed, {failed} failed'))
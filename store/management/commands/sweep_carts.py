@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from store.carts import delete_expired_carts, expired_carts
+from store.models import CartItem
+
+
+class Command(BaseCommand):
+    help = 'Delete carts older than CART_MAX_AGE_DAYS in small transactions, ' \
+        'safe to run alongside live traffic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=settings.CART_MAX_AGE_DAYS,
+                            help='Age in days after which a cart is deleted')
+        parser.add_argument('--chunk-size', type=int, default=settings.CART_SWEEP_CHUNK_SIZE,
+                            help='Carts deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to wait between chunks')
+        parser.add_argument('--every', type=int, default=0,
+                            help='Keep running and sweep every N seconds')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the carts and items that would be deleted')
+
+    def handle(self, *args, **options):
+        while True:
+            cutoff = timezone.now() - timedelta(days=options['max_age'])
+            if options['dry_run']:
+                self.count(cutoff)
+            else:
+                self.sweep(cutoff, options['chunk_size'], options['pause'])
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def count(self, cutoff):
+        carts = expired_carts(cutoff)
+        items = CartItem.objects.filter(cart__in=carts.values('pk')).count()
+        self.stdout.write(
+            f'{carts.count()} carts created before {cutoff:%Y-%m-%d %H:%M} '
+            f'with {items} items would be deleted')
+
+    def sweep(self, cutoff, chunk_size, pause):
+        start = time.perf_counter()
+        total_carts = total_items = chunks = 0
+        while True:
+            chunk_start = time.perf_counter()
+            carts, items = delete_expired_carts(cutoff, chunk_size)
+            if not carts:
+                break
+            chunks += 1
+            total_carts += carts
+            total_items += items
+            self.stdout.write(
+                f'chunk {chunks}: {carts} carts, {items} items in '
+                f'{(time.perf_counter() - chunk_start) * 1000:.1f} ms, '
+                f'{total_carts} carts so far')
+            if carts < chunk_size:
+                break
+            time.sleep(pause)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_carts} carts and {total_items} items deleted in {chunks} chunks, '
+            f'{elapsed:.1f} s ({total_carts / elapsed if elapsed else 0:.0f} carts/s)'))
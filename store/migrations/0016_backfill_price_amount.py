@@ -0,0 +1,68 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:31
+
+import re
+from decimal import Decimal, InvalidOperation
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 1000
+
+
+def parse_price(value):
+    # Legacy prices are stored as text like '1145,000 TND'
+    amount = re.sub(r'[^0-9,.\-]', '', value or '')
+    if ',' in amount:
+        amount = amount.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(amount)
+    except InvalidOperation:
+        return None
+
+
+def backfill(model, source, target, using):
+    # Small committed batches keyed on the primary key so the table is
+    # never locked for the whole backfill. Prices that don't parse stay NULL
+    # and stop the migration before 0017 makes the column required, it can
+    # be run again once they are fixed
+    last_pk = 0
+    invalid = []
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(
+                model.objects
+                .using(using)
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', source, target)[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            for row in rows:
+                amount = parse_price(getattr(row, source))
+                if amount is None:
+                    invalid.append(row.pk)
+                setattr(row, target, amount)
+            model.objects.using(using).bulk_update(rows, [target])
+        last_pk = rows[-1].pk
+    if invalid:
+        raise ValueError(
+            f'{model.__name__}: could not parse {source} of ids {invalid}, fix them and migrate again')
+
+
+def backfill_prices(apps, schema_editor):
+    using = schema_editor.connection.alias
+    backfill(apps.get_model('store', 'Product'), 'price', 'price_amount', using)
+    backfill(apps.get_model('store', 'OrderItem'), 'unit_price', 'unit_price_amount', using)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('store', '0015_product_price_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
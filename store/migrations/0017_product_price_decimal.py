@@ -0,0 +1,50 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:32
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_backfill_price_amount'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='product',
+            name='price',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='price_amount',
+            new_name='price',
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.DecimalField(decimal_places=3, max_digits=12, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.RemoveField(
+            model_name='orderitem',
+            name='unit_price',
+        ),
+        migrations.RenameField(
+            model_name='orderitem',
+            old_name='unit_price_amount',
+            new_name='unit_price',
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=3, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['collection', 'price'], name='store_produ_collect_c955f3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='store_produ_price_2d55a6_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_price_decimal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSpec',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=255)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='specs', to='store.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productspec',
+            index=models.Index(fields=['key', 'value'], name='store_produ_key_625e31_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productspec',
+            unique_together={('product', 'key')},
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:32
+
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 1000
+FACET_KEYS = ('brand', 'processor_type', 'memory', 'drive_type', 'gpu_chipset')
+
+
+def backfill_specs(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductSpec = apps.get_model('store', 'ProductSpec')
+    using = schema_editor.connection.alias
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(
+                Product.objects
+                .using(using)
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'description')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            specs = []
+            for product_id, description in rows:
+                if not isinstance(description, dict):
+                    continue
+                for key in FACET_KEYS:
+                    value = str(description.get(key) or '').strip()
+                    if value:
+                        specs.append(ProductSpec(
+                            product_id=product_id, key=key, value=value[:255]))
+            ProductSpec.objects.using(using).bulk_create(specs, ignore_conflicts=True)
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('store', '0018_productspec'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_specs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_backfill_productspec'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedOrder',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('cart_id', models.UUIDField()),
+                ('status', models.CharField(choices=[('Q', 'Queued'), ('R', 'Processing'), ('P', 'Placed'), ('F', 'Failed')], default='Q', max_length=1)),
+                ('error', models.TextField(blank=True)),
+                ('error_details', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.customer')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.order')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='queuedorder',
+            index=models.Index(fields=['status', 'created_at'], name='store_queue_status_9000fb_idx'),
+        ),
+    ]
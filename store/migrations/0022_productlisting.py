@@ -0,0 +1,79 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_cart_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='store.product')),
+                ('title', models.CharField(max_length=255)),
+                ('slug', models.SlugField(max_length=255)),
+                ('price', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('effective_price', models.DecimalField(decimal_places=3, max_digits=12)),
+                ('inventory', models.IntegerField()),
+                ('last_update', models.DateTimeField()),
+                ('collection_title', models.CharField(max_length=255)),
+                ('image', models.TextField(blank=True)),
+                ('promotions', models.JSONField(default=list)),
+                ('tags', models.JSONField(default=list)),
+                ('brand', models.CharField(blank=True, max_length=255)),
+                ('processor_type', models.CharField(blank=True, max_length=255)),
+                ('memory', models.CharField(blank=True, max_length=255)),
+                ('drive_type', models.CharField(blank=True, max_length=255)),
+                ('gpu_chipset', models.CharField(blank=True, max_length=255)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.collection')),
+            ],
+            options={
+                'ordering': ['title'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['title'], name='store_produ_title_aad5d5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['collection_title', 'price'], name='store_produ_collect_d0e7eb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['price'], name='store_produ_price_231f94_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['effective_price'], name='store_produ_effecti_3de81e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['last_update'], name='store_produ_last_up_9d777c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['brand'], name='store_produ_brand_6a4c1b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['processor_type'], name='store_produ_process_642527_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['memory'], name='store_produ_memory_31aeb4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['drive_type'], name='store_produ_drive_t_c36351_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['gpu_chipset'], name='store_produ_gpu_chi_d046bc_idx'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:05
+
+from collections import defaultdict
+from django.db import migrations, transaction
+from store.pricing import effective_price
+
+
+BATCH_SIZE = 500
+FACET_KEYS = ('brand', 'processor_type', 'memory', 'drive_type', 'gpu_chipset')
+
+
+def primary_image(images):
+    if isinstance(images, dict):
+        images = list(images.values())
+    if not isinstance(images, list) or not images:
+        return ''
+    image = images[0]
+    if isinstance(image, dict):
+        image = image.get('src') or ''
+    return str(image)
+
+
+def extract_specs(description):
+    if not isinstance(description, dict):
+        return {}
+    specs = {}
+    for key in FACET_KEYS:
+        value = str(description.get(key) or '').strip()
+        if value:
+            specs[key] = value[:255]
+    return specs
+
+
+def backfill_listings(apps, schema_editor):
+    # Same rows as store.listings.refresh_product_listings, rewritten batch
+    # by batch so running it again is harmless
+    Product = apps.get_model('store', 'Product')
+    ProductListing = apps.get_model('store', 'ProductListing')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('tags', 'TaggedItem')
+    using = schema_editor.connection.alias
+    content_type = ContentType.objects.using(using) \
+        .filter(app_label='store', model='product') \
+        .first()
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=using):
+            products = list(
+                Product.objects
+                .using(using)
+                .filter(pk__gt=last_pk)
+                .order_by('pk')
+                .select_related('collection')
+                .prefetch_related('promotions')[:BATCH_SIZE]
+            )
+            if not products:
+                break
+            product_ids = [product.pk for product in products]
+            tags = defaultdict(list)
+            if content_type is not None:
+                items = TaggedItem.objects \
+                    .using(using) \
+                    .filter(content_type=content_type, object_id__in=product_ids) \
+                    .select_related('tag')
+                for item in items:
+                    tags[item.object_id].append(item.tag)
+
+            listings = []
+            for product in products:
+                promotions = sorted(product.promotions.all(), key=lambda promotion: promotion.id)
+                specs = extract_specs(product.description)
+                listings.append(ProductListing(
+                    product_id=product.pk,
+                    title=product.title,
+                    slug=product.slug,
+                    price=product.price,
+                    effective_price=effective_price(
+                        product.price, [promotion.discount for promotion in promotions]),
+                    inventory=product.inventory,
+                    last_update=product.last_update,
+                    collection_id=product.collection_id,
+                    collection_title=product.collection.title,
+                    image=primary_image(product.images),
+                    promotions=[
+                        [promotion.id, promotion.description, promotion.discount]
+                        for promotion in promotions
+                    ],
+                    tags=[[tag.id, tag.label] for tag in sorted(tags[product.pk], key=lambda tag: tag.id)],
+                    **{key: specs.get(key, '') for key in FACET_KEYS},
+                ))
+            ProductListing.objects.using(using).filter(pk__in=product_ids).delete()
+            ProductListing.objects.using(using).bulk_create(listings)
+        last_pk = product_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tags', '0004_taggeditem_content_object_index'),
+        ('store', '0022_productlisting'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_listings, migrations.RunPython.noop),
+    ]
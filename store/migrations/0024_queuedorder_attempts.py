@@ -0,0 +1,42 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+def fail_duplicate_orders(apps, schema_editor):
+    # Only the oldest active order of a cart is kept, as enqueue_order
+    # meant to, so the constraint can be created
+    QueuedOrder = apps.get_model('store', 'QueuedOrder')
+    using = schema_editor.connection.alias
+    seen = set()
+    duplicates = []
+    for order_id, cart_id in QueuedOrder.objects \
+            .using(using) \
+            .filter(status__in=['Q', 'R']) \
+            .order_by('created_at') \
+            .values_list('id', 'cart_id'):
+        if cart_id in seen:
+            duplicates.append(order_id)
+        seen.add(cart_id)
+    QueuedOrder.objects.using(using).filter(pk__in=duplicates).update(
+        status='F', error='This cart is already being ordered !!!')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_backfill_productlisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedorder',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(fail_duplicate_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='queuedorder',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['Q', 'R'])), fields=('cart_id',), name='unique_active_queued_order_cart'),
+        ),
+    ]
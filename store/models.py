@@ -49,7 +49,8 @@ class Collection(models.Model):
 class Product(models.Model):
     title = models.CharField(max_length=255)
     description = models.JSONField(default=defaultJsonField)
-    price = models.CharField(max_length=255)
+    price = models.DecimalField(
+        max_digits=12, decimal_places=3, validators=[MinValueValidator(0)])
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
     slug = models.SlugField(max_length=255)
     last_update = models.DateTimeField(auto_now=True)
@@ -63,6 +64,63 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['collection', 'price']),
+            models.Index(fields=['price']),
+        ]
+
+
+class ProductSpec(models.Model):
+    # Facet values extracted from Product.description
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='specs')
+    key = models.CharField(max_length=50)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = [['product', 'key']]
+        indexes = [
+            models.Index(fields=['key', 'value']),
+        ]
+
+
+class ProductListing(models.Model):
+    # Read model of the product lists, one row per product kept in sync by
+    # store.listings so listing a page scans this table alone
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='listing')
+    title = models.CharField(max_length=255)
+    slug = models.SlugField(max_length=255)
+    price = models.DecimalField(max_digits=12, decimal_places=3)
+    effective_price = models.DecimalField(max_digits=12, decimal_places=3)
+    inventory = models.IntegerField()
+    last_update = models.DateTimeField()
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+    collection_title = models.CharField(max_length=255)
+    image = models.TextField(blank=True)
+    # [id, description, discount] and [id, label] lists
+    promotions = models.JSONField(default=list)
+    tags = models.JSONField(default=list)
+    brand = models.CharField(max_length=255, blank=True)
+    processor_type = models.CharField(max_length=255, blank=True)
+    memory = models.CharField(max_length=255, blank=True)
+    drive_type = models.CharField(max_length=255, blank=True)
+    gpu_chipset = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ['title']
+        indexes = [
+            models.Index(fields=['title']),
+            models.Index(fields=['collection_title', 'price']),
+            models.Index(fields=['price']),
+            models.Index(fields=['effective_price']),
+            models.Index(fields=['last_update']),
+            models.Index(fields=['brand']),
+            models.Index(fields=['processor_type']),
+            models.Index(fields=['memory']),
+            models.Index(fields=['drive_type']),
+            models.Index(fields=['gpu_chipset']),
+        ]
 
 
 class Order(models.Model):
@@ -89,13 +147,58 @@ class OrderItem(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.PROTECT, related_name="orderitems")
     quantity = models.PositiveSmallIntegerField()
-    unit_price = models.CharField(max_length=255)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=3)
+
+
+class QueuedOrder(models.Model):
+    # A checkout waiting for run_order_workers, the cart is only turned into
+    # an order by the worker
+    STATUS_QUEUED = 'Q'
+    STATUS_PROCESSING = 'R'
+    STATUS_PLACED = 'P'
+    STATUS_FAILED = 'F'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_PLACED, 'Placed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    cart_id = models.UUIDField()
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    order = models.OneToOneField(
+        Order, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    error_details = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            # A cart is ordered once at a time
+            models.UniqueConstraint(
+                fields=['cart_id'], condition=models.Q(status__in=['Q', 'R']),
+                name='unique_active_queued_order_cart'),
+        ]
 
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(
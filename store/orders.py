@@ -0,0 +1,185 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from core.cache_tags import invalidate_tags_on_commit, object_tags
+from .listings import decrement_listed_inventory
+from .models import Cart, CartItem, Order, OrderItem, Product, QueuedOrder
+from .pricing import compute_effective_prices
+
+
+logger = logging.getLogger(__name__)
+
+
+class OrderError(Exception):
+    pass
+
+
+class OutOfStockError(OrderError):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('Not enough stock for ' + ', '.join(
+            f"{shortage['title']} ({shortage['available']} left, {shortage['requested']} requested)"
+            for shortage in shortages))
+
+
+def get_shortages(products, quantities):
+    return [
+        {
+            'productId': product.id,
+            'title': product.title,
+            'requested': quantities[product.id],
+            'available': product.inventory,
+        }
+        for product in products
+        if product.inventory < quantities[product.id]
+    ]
+
+
+def decrement_inventory(quantities):
+    # One statement for the whole cart, a row is only updated when it still
+    # has enough stock so inventory can never go negative
+    enough_stock = Q()
+    for product_id, quantity in quantities.items():
+        enough_stock |= Q(pk=product_id, inventory__gte=quantity)
+    return Product.objects.filter(enough_stock).update(inventory=Case(
+        *[When(pk=product_id, then=F('inventory') - quantity)
+          for product_id, quantity in quantities.items()],
+        default=F('inventory'),
+    ))
+
+
+@transaction.atomic
+def place_order(customer_id, cart_id):
+    # Locks the cart, then its products in id order so concurrent checkouts
+    # sharing products queue up instead of deadlocking, and holds the locks
+    # only for a handful of statements
+    if not Cart.objects.select_for_update().filter(pk=cart_id).exists():
+        raise OrderError('No cart with the given ID was found !!!')
+    quantities = dict(
+        CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity'))
+    if not quantities:
+        raise OrderError('The cart is empty !!!')
+
+    products = list(
+        Product.objects
+        .select_for_update()
+        .filter(pk__in=quantities)
+        .order_by('id')
+        .only('id', 'title', 'price', 'inventory'))
+    shortages = get_shortages(products, quantities)
+    if shortages:
+        raise OutOfStockError(shortages)
+    if decrement_inventory(quantities) != len(quantities):
+        # Only reachable where select_for_update is a no-op
+        products = Product.objects.filter(pk__in=quantities).order_by('id')
+        raise OutOfStockError(get_shortages(products, quantities))
+    decrement_listed_inventory(quantities)
+
+    # Charged at the effective price, read past the cache while the
+    # products are locked
+    prices = compute_effective_prices(quantities)
+    order = Order.objects.create(customer_id=customer_id)
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=product,
+            unit_price=prices[product.id]['effective_price'],
+            quantity=quantities[product.id],
+        ) for product in products
+    ])
+    Cart.objects.filter(pk=cart_id).delete()
+    # Listings and product pages show the inventory
+    invalidate_tags_on_commit(*[
+        tag for product_id in quantities for tag in object_tags(Product, product_id)])
+    return order
+
+
+def enqueue_order(customer_id, cart_id):
+    # Cheap checks only, stock is checked by the worker. A second checkout
+    # of the same cart is refused by the unique constraint on active rows
+    if not CartItem.objects.filter(cart_id=cart_id).exists():
+        if not Cart.objects.filter(pk=cart_id).exists():
+            raise OrderError('No cart with the given ID was found !!!')
+        raise OrderError('The cart is empty !!!')
+    try:
+        with transaction.atomic():
+            return QueuedOrder.objects.create(customer_id=customer_id, cart_id=cart_id)
+    except IntegrityError:
+        raise OrderError('This cart is already being ordered !!!')
+
+
+def claim_queued_orders(batch_size):
+    # Oldest first. Concurrent workers skip each other's locked rows, and
+    # orders claimed by a worker that died are claimed again once stale.
+    # Every claim is an attempt, orders out of attempts are failed instead
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.ORDER_QUEUE_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        ids = list(
+            QueuedOrder.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status=QueuedOrder.STATUS_QUEUED) |
+                    Q(status=QueuedOrder.STATUS_PROCESSING, claimed_at__lt=stale))
+            .order_by('created_at')
+            .values_list('id', flat=True)[:batch_size])
+        QueuedOrder.objects \
+            .filter(pk__in=ids, attempts__gte=settings.ORDER_QUEUE_MAX_ATTEMPTS) \
+            .update(status=QueuedOrder.STATUS_FAILED, processed_at=now,
+                    error=f'Gave up after {settings.ORDER_QUEUE_MAX_ATTEMPTS} attempts')
+        QueuedOrder.objects \
+            .filter(pk__in=ids, attempts__lt=settings.ORDER_QUEUE_MAX_ATTEMPTS) \
+            .update(status=QueuedOrder.STATUS_PROCESSING, claimed_at=now,
+                    attempts=F('attempts') + 1)
+    return list(QueuedOrder.objects.filter(pk__in=ids).order_by('created_at'))
+
+
+def process_queued_order(queued_order):
+    # The order and the new status are committed together, the row lock
+    # keeps a worker that claimed a stale order from placing it twice
+    if queued_order.status != QueuedOrder.STATUS_PROCESSING:
+        return queued_order
+    try:
+        with transaction.atomic():
+            queued_order = QueuedOrder.objects.select_for_update().get(pk=queued_order.pk)
+            if queued_order.status != QueuedOrder.STATUS_PROCESSING:
+                return queued_order
+            try:
+                queued_order.order = place_order(queued_order.customer_id, queued_order.cart_id)
+                queued_order.status = QueuedOrder.STATUS_PLACED
+            except OrderError as error:
+                queued_order.status = QueuedOrder.STATUS_FAILED
+                queued_order.error = str(error)
+                queued_order.error_details = getattr(error, 'shortages', None)
+            queued_order.processed_at = timezone.now()
+            queued_order.save()
+    except Exception as error:
+        logger.exception('Placing queued order %s failed', queued_order.pk)
+        return record_failed_attempt(queued_order, error)
+    return queued_order
+
+
+def record_failed_attempt(queued_order, error):
+    # Unexpected errors are retried by the next claim until the order is
+    # out of attempts
+    with transaction.atomic():
+        queued_order = QueuedOrder.objects.select_for_update().get(pk=queued_order.pk)
+        if queued_order.status != QueuedOrder.STATUS_PROCESSING:
+            return queued_order
+        queued_order.error = f'{type(error).__name__}: {error}'
+        if queued_order.attempts >= settings.ORDER_QUEUE_MAX_ATTEMPTS:
+            queued_order.status = QueuedOrder.STATUS_FAILED
+            queued_order.processed_at = timezone.now()
+        else:
+            queued_order.status = QueuedOrder.STATUS_QUEUED
+        queued_order.save()
+    return queued_order
+
+
+def process_order_queue(batch_size=None):
+    return [
+        process_queued_order(queued_order)
+        for queued_order in claim_queued_orders(batch_size or settings.ORDER_QUEUE_BATCH_SIZE)
+    ]
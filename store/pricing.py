@@ -0,0 +1,105 @@
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import cache
+from core.cache_tags import model_tag, set_many_tagged, tag_generation
+from .models import Product, Promotion
+
+
+PRICE_PRECISION = Decimal('0.001')
+
+
+def parse_price(value):
+    # Accepts numbers as well as legacy text prices like '1145,000 TND'
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    amount = re.sub(r'[^0-9,.\-]', '', value or '')
+    if ',' in amount:
+        amount = amount.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(amount)
+    except InvalidOperation:
+        return None
+
+
+def effective_price(price, discounts):
+    # The one place prices get discounted. Discounts are percentages combined
+    # as PROMOTION_STACKING says, the total is capped at
+    # PROMOTION_MAX_DISCOUNT and the result rounded half up to the precision
+    # of the price columns
+    discounts = [min(max(Decimal(str(discount)), Decimal(0)), Decimal(100)) for discount in discounts]
+    if settings.PROMOTION_STACKING == 'compound':
+        remaining = Decimal(1)
+        for discount in discounts:
+            remaining *= (100 - discount) / 100
+        discount = (1 - remaining) * 100
+    elif settings.PROMOTION_STACKING == 'additive':
+        discount = sum(discounts, Decimal(0))
+    else:
+        discount = max(discounts, default=Decimal(0))
+    discount = min(discount, Decimal(settings.PROMOTION_MAX_DISCOUNT))
+    return (price * (100 - discount) / 100).quantize(PRICE_PRECISION, rounding=ROUND_HALF_UP)
+
+
+def effective_price_key(product_id):
+    return f'effective-price:{product_id}'
+
+
+def price_rows(rows):
+    # rows are (product id, price, promotion id, discount) tuples, one per
+    # promotion of each product, keyed on product id
+    promotions = {}
+    prices = {}
+    for product_id, price, promotion_id, discount in rows:
+        prices[product_id] = price
+        promotions.setdefault(product_id, {})
+        if promotion_id is not None:
+            promotions[product_id][promotion_id] = discount
+    return {
+        product_id: {
+            'price': price,
+            'effective_price': effective_price(price, promotions[product_id].values()),
+            'promotion_ids': sorted(promotions[product_id]),
+        }
+        for product_id, price in prices.items()
+    }
+
+
+def compute_effective_prices(product_ids):
+    # The whole batch in one query, products that don't exist are left out
+    return price_rows(Product.objects
+                      .filter(pk__in=set(product_ids))
+                      .order_by()
+                      .values_list('id', 'price', 'promotions__id', 'promotions__discount'))
+
+
+def cache_effective_prices(prices, generation):
+    # Cached per product until the product, its promotion links or one of
+    # its promotions change. generation is tag_generation() read before the
+    # prices were
+    set_many_tagged(
+        {effective_price_key(product_id): value for product_id, value in prices.items()},
+        {
+            effective_price_key(product_id): [
+                model_tag(Product, product_id),
+                *[model_tag(Promotion, promotion_id) for promotion_id in value['promotion_ids']],
+            ]
+            for product_id, value in prices.items()
+        },
+        generation, settings.EFFECTIVE_PRICE_CACHE_TTL)
+
+
+def get_effective_prices(product_ids):
+    product_ids = set(product_ids)
+    keys = {effective_price_key(product_id): product_id for product_id in product_ids}
+    cached = cache.get_many(list(keys))
+    prices = {keys[key]: value for key, value in cached.items()}
+    missing = product_ids - prices.keys()
+    if missing:
+        generation = tag_generation()
+        computed = compute_effective_prices(missing)
+        cache_effective_prices(computed, generation)
+        prices.update(computed)
+    return prices
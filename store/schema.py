@@ -1,22 +1,33 @@
-from uuid import uuid4
-from django.db.models import Q
-from django.db import transaction
+from django.conf import settings
 import graphene
 from graphene import relay
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
-from django_filters import FilterSet, OrderingFilter
+from django_filters import CharFilter, OrderingFilter
 from graphql import GraphQLError
-from .models import Cart, CartItem, Customer, Order, OrderItem, Product, Collection, Promotion
+from core.concurrency import blocking
+from .models import Cart, CartItem, Customer, Order, OrderItem, Product, Collection, Promotion, \
+    ProductListing, QueuedOrder
+from .carts import get_cart_store, get_cart_summary
+from .counters import ALL_PRODUCTS
+from .facets import SpecFilterSet, facet_counts
+from .fields import KeysetFilterConnectionField
+from .listings import cached_listing, listed_collection, listed_products, listed_promotions, \
+    primary_image
+from .search import search_products
+from .orders import OrderError, OutOfStockError, enqueue_order, place_order
+from .loaders import get_loader, CollectionLoader, CustomerLoader, EffectivePriceLoader, \
+    OrderItemsLoader, ProductCountLoader, ProductLoader, ProductPromotionsLoader
 
 # Filters
 
 
-class ProductFilter(FilterSet):
+class ProductFilter(SpecFilterSet):
+    # Filters the listing rows, every filter is a column of store_productlisting
+    collection__title = CharFilter(field_name='collection_title')
+
     class Meta:
-        model = Product
+        model = ProductListing
         fields = {
-            'collection__title': ['exact'],
             'price': ['gt', 'lt'],
             'inventory': ['gt', 'lt']
         }
@@ -25,11 +36,15 @@ class ProductFilter(FilterSet):
         fields=(
             ('title', 'title'),
             ('price', 'price'),
+            ('effective_price', 'effective_price'),
             ('inventory', 'inventory'),
             ('last_update', 'last_update'),
         )
     )
 
+    def filter_spec(self, queryset, name, value):
+        return queryset.filter(**{f'{name}__in': self.spec_values(value)})
+
 
 # Types Models
 
@@ -44,8 +59,80 @@ class CollectionType(DjangoObjectType):
         model = Collection
         fields = ('id', 'title', 'featured_product')
 
+    def resolve_featured_product(root, info):
+        if root.featured_product_id is None:
+            return None
+        return get_loader(info, ProductLoader).load(root.featured_product_id)
+
+
+class FacetValueType(graphene.ObjectType):
+    value = graphene.String()
+    count = graphene.Int()
+
+
+class FacetType(graphene.ObjectType):
+    key = graphene.String()
+    values = graphene.List(FacetValueType)
 
-class ProductType(DjangoObjectType):
+
+class ProductConnection(relay.Connection):
+    facets = graphene.List(FacetType)
+
+    class Meta:
+        abstract = True
+
+    @blocking
+    def resolve_facets(root, info):
+        # root.iterable is the filtered queryset behind the whole connection
+        return facet_counts(root.iterable)
+
+
+class ListedProductFields:
+    # Resolvers shared by the product types. Products of lists are built from
+    # their listing row and answer from it, their deferred description and
+    # images are loaded for the whole page at once when selected
+    effective_price = graphene.Decimal()
+    image = graphene.String()
+
+    def resolve_description(root, info):
+        if 'description' not in root.get_deferred_fields():
+            return root.description
+        return get_loader(info, ProductLoader).load(root.id).then(
+            lambda product: product.description)
+
+    def resolve_images(root, info):
+        if 'images' not in root.get_deferred_fields():
+            return root.images
+        return get_loader(info, ProductLoader).load(root.id).then(
+            lambda product: product.images)
+
+    def resolve_image(root, info):
+        listing = cached_listing(root)
+        if listing is not None:
+            return listing.image
+        return primary_image(root.images)
+
+    def resolve_effective_price(root, info):
+        listing = cached_listing(root)
+        if listing is not None:
+            return listing.effective_price
+        return get_loader(info, EffectivePriceLoader).load(root.id).then(
+            lambda price: price and price['effective_price'])
+
+    def resolve_collection(root, info):
+        listing = cached_listing(root)
+        if listing is not None:
+            return listed_collection(listing)
+        return get_loader(info, CollectionLoader).load(root.collection_id)
+
+    def resolve_promotions(root, info):
+        listing = cached_listing(root)
+        if listing is not None:
+            return listed_promotions(listing)
+        return get_loader(info, ProductPromotionsLoader).load(root.id)
+
+
+class ProductType(ListedProductFields, DjangoObjectType):
     products_count = graphene.Int()
     products_collection_count = graphene.Int()
     index = graphene.Int()
@@ -63,21 +150,24 @@ class ProductType(DjangoObjectType):
             'last_update',
             'collection',
             'images',
+            'image',
             'promotions',
+            'effective_price',
             'products_count',
             'products_collection_count'
         )
         # filter_fields = ['collection__title', 'inventory']
         interfaces = (relay.Node, )
+        connection_class = ProductConnection
 
     def resolve_index(self, info):
         return self.pk
 
     def resolve_products_count(root, info):
-        return len(Product.objects.all())
+        return get_loader(info, ProductCountLoader).load(ALL_PRODUCTS)
 
     def resolve_products_collection_count(root, info):
-        return len(Product.objects.filter(collection__title=root.collection))
+        return get_loader(info, ProductCountLoader).load(root.collection_id)
 
 
 class CustomerType(DjangoObjectType):
@@ -105,19 +195,22 @@ class CartItemType(DjangoObjectType):
         interfaces = (relay.Node, )
 
     def resolve_product(root, info):
-        return Product.objects.get(pk=root.product_id)
+        return get_loader(info, ProductLoader).load(root.product_id)
 
     def resolve_total_price(root, info):
-        return root.quantity * Product.objects.get(pk=root.product_id).price
+        return get_loader(info, EffectivePriceLoader).load(root.product_id).then(
+            lambda price: price and root.quantity * price['effective_price'])
 
     def resolve_index(self, info):
         return self.pk
 
     def resolve_product_id(root, info):
-        if not Product.objects.filter(pk=root.product_id).exists():
-            raise GraphQLError("No product with the given ID was found !!")
+        def check_product(product):
+            if product is None:
+                raise GraphQLError("No product with the given ID was found !!")
+            return root.product_id
 
-        return root.product_id
+        return get_loader(info, ProductLoader).load(root.product_id).then(check_product)
 
 
 class AddCartItemType(DjangoObjectType):
@@ -139,31 +232,30 @@ class CartType(DjangoObjectType):
     items = graphene.List(CartItemType)
     total_price = graphene.Decimal()
     items_number = graphene.Int()
+    applied_promotions = graphene.List(PromotionType)
 
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total_price']
+        fields = ['id', 'items', 'total_price', 'applied_promotions']
 
+    @blocking
     def resolve_items(root, info):
-        return CartItem.objects.all().filter(cart_id=root.id)
+        return get_cart_store().get_items(root.id)
 
+    @blocking
     def resolve_total_price(root, info):
-        items = CartItem.objects.all().filter(cart_id=root.id)
-        if len(items) == 0:
-            return "0"
-        else:
-            total_price = 0
-            for item in items:
-                total_price += item.quantity * item.product.price
-            return total_price
+        return get_cart_summary(info, root.id)['total_price']
 
-    def resolve_items_number(root,info):
-        items = CartItem.objects.all().filter(cart_id=root.id)
-        items_number = 0
-        for item in items:
-            items_number += item.quantity
-        return items_number
+    @blocking
+    def resolve_items_number(root, info):
+        return get_cart_summary(info, root.id)['items_number']
 
+    @blocking
+    def resolve_applied_promotions(root, info):
+        promotion_ids = get_cart_summary(info, root.id)['promotion_ids']
+        if not promotion_ids:
+            return []
+        return Promotion.objects.filter(pk__in=promotion_ids)
 
 
 class OrderItemType(DjangoObjectType):
@@ -176,6 +268,9 @@ class OrderItemType(DjangoObjectType):
         fields = ['id', 'order_id', 'product',
                   'product_id', 'unit_price', 'quantity']
 
+    def resolve_product(root, info):
+        return get_loader(info, ProductLoader).load(root.product_id)
+
 
 class OrderType(DjangoObjectType):
     customer_id = graphene.Int()
@@ -186,8 +281,20 @@ class OrderType(DjangoObjectType):
         model = Order
         fields = ['id', 'customer', 'placed_at', 'payment_status', 'items']
 
+    def resolve_customer(root, info):
+        return get_loader(info, CustomerLoader).load(root.customer_id)
+
     def resolve_items(root, info):
-        return OrderItem.objects.filter(order_id=root.id)
+        return get_loader(info, OrderItemsLoader).load(root.id)
+
+
+class QueuedOrderType(DjangoObjectType):
+    order = graphene.Field(OrderType)
+
+    class Meta:
+        model = QueuedOrder
+        fields = ['id', 'status', 'order', 'error', 'error_details',
+                  'created_at', 'processed_at']
 
 
 class AddOrderType(DjangoObjectType):
@@ -209,13 +316,10 @@ class Query(graphene.ObjectType):
     collections = graphene.List(CollectionType)
     collection = graphene.Field(CollectionType, id=graphene.Int())
 
-    products = DjangoFilterConnectionField(
+    products = KeysetFilterConnectionField(
         ProductType,
         filterset_class=ProductFilter,
         search=graphene.String(),
-        first=graphene.Int(),
-        offset=graphene.Int(),
-        limit=graphene.Int()
     )
     all_products = graphene.List(ProductType)
     product = graphene.Field(ProductType, id=graphene.Int())
@@ -234,6 +338,7 @@ class Query(graphene.ObjectType):
     order = graphene.Field(OrderType, id=graphene.Int())
     order_items = graphene.List(OrderItemType)
     order_item = graphene.Field(OrderItemType, id=graphene.Int())
+    queued_order = graphene.Field(QueuedOrderType, id=graphene.UUID(required=True))
 
     def resolve_promotions(root, info, **kwargs):
         return Promotion.objects.all()
@@ -255,13 +360,9 @@ class Query(graphene.ObjectType):
 
     def resolve_products(self, info, search=None, **kwargs):
         if search:
-            # filter = (Q(title__icontains=search) |
-            #           Q(description__icontains=search))
-            filter = Q(title__icontains=search)
+            return search_products(listed_products(), search)
 
-            return Product.objects.all().filter(filter)
-
-        return Product.objects.all()
+        return listed_products()
 
     def resolve_customers(root, info):
         user = info.context.user
@@ -280,16 +381,15 @@ class Query(graphene.ObjectType):
         return Customer.objects.get(pk=id)
 
     def resolve_cart(root, info, id):
-        return Cart.objects.get(pk=id)
+        return get_cart_store().get_cart(id)
 
     def resolve_cart_items(root, info, cartId=None, **kwargs):
         if cartId:
-            filter = Q(cart_id__exact=cartId)
-            return CartItem.objects.all().filter(filter)
+            return get_cart_store().get_items(cartId)
         return CartItem.objects.all()
 
     def resolve_cart_item(root, info, id):
-        return CartItem.objects.get(pk=id)
+        return get_cart_store().get_item(id)
 
     def resolve_orders(root, info):
         user = info.context.user
@@ -309,6 +409,15 @@ class Query(graphene.ObjectType):
 
         return Order.objects.get(pk=id)
 
+    def resolve_queued_order(root, info, id):
+        user = info.context.user
+        if not user.is_authenticated:
+            raise Exception("Authentication credentials were not provided !")
+        queued_orders = QueuedOrder.objects.select_related('order')
+        if not user.is_staff:
+            queued_orders = queued_orders.filter(customer__user=user)
+        return queued_orders.filter(pk=id).first()
+
     def resolve_order_items(root, info):
         user = info.context.user
         if not user.is_authenticated:
@@ -466,7 +575,7 @@ class DeleteCollection(graphene.Mutation):
 class ProductInput(graphene.InputObjectType):
     title = graphene.String()
     description = graphene.JSONString()
-    price = graphene.String()
+    price = graphene.Decimal()
     inventory = graphene.Int()
     slug = graphene.String()
     last_update = graphene.DateTime()
@@ -556,9 +665,7 @@ class CreateCart(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info,name):
-        cart = Cart()
-        cart.id = uuid4()
-        cart.save()
+        cart = get_cart_store().create_cart()
 
         return CreateCart(cart=cart)
 
@@ -571,8 +678,7 @@ class DeleteCart(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, id):
-        cart = Cart(pk=id)
-        cart.delete()
+        get_cart_store().delete_cart(id)
 
 
 class CreateCartItem(graphene.Mutation):
@@ -586,17 +692,7 @@ class CreateCartItem(graphene.Mutation):
     @classmethod
     def mutate(cls, root, info, cart_id,
                product_id, quantity):
-        try:
-            cart_item = CartItem.objects.get(
-                cart_id=cart_id, product_id=product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-        except CartItem.DoesNotExist:
-            cart_item = CartItem()
-            cart_item.cart_id = cart_id
-            cart_item.product_id = product_id
-            cart_item.quantity = quantity
-            cart_item.save()
+        cart_item = get_cart_store().add_item(cart_id, product_id, quantity)
 
         return CreateCartItem(cart_item=cart_item)
 
@@ -610,9 +706,7 @@ class UpdateCartItem(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, quantity, id):
-        cart_item = CartItem.objects.get(pk=id)
-        cart_item.quantity = quantity
-        cart_item.save()
+        cart_item = get_cart_store().update_item(id, quantity)
 
         return UpdateCartItem(cart_item=cart_item)
 
@@ -625,8 +719,7 @@ class DeleteCartItem(graphene.Mutation):
 
     @classmethod
     def mutate(cls, root, info, id):
-        cart_item = CartItem(pk=id)
-        cart_item.delete()
+        get_cart_store().delete_item(id)
 
 
 class CreateOrder(graphene.Mutation):
@@ -635,6 +728,8 @@ class CreateOrder(graphene.Mutation):
         cart_id = graphene.UUID(required=True)
 
     order = graphene.Field(OrderType)
+    # Set instead of order when ORDER_QUEUE_ENABLED, poll it with queuedOrder
+    queued_order = graphene.Field(QueuedOrderType)
 
     @classmethod
     def mutate(cls, root, info, cart_id,
@@ -644,32 +739,18 @@ class CreateOrder(graphene.Mutation):
         if not user.is_authenticated:
             raise Exception("Authentication credentials were not provided !")
 
-        with transaction.atomic():
-            # Validate cart_id
-            if not Cart.objects.filter(pk=cart_id).exists():
-                raise GraphQLError('No cart with the given ID was found !!!')
-            if CartItem.objects.filter(calendar=cart_id).count() == 0:
-                raise GraphQLError('The cart is empty !!!')
-            # Create Order
-            order = Order()
-            order.customer_id = customer_id
-            order.save()
-            # Create Order Items
-            cart_items = CartItem.objects.select_related(
-                'product').filter(cart_id=cart_id)
-            order_items = [
-                OrderItem(
-                    order=order,
-                    product=item.product,
-                    unit_price=item.product.price,
-                    quantity=item.quantity
-                ) for item in cart_items
-            ]
-            OrderItem.objects.bulk_create(order_items)
-            # Delete cart item
-            Cart.objects.filter(pk=cart_id).delete()
-
-            return CreateOrder(order=order)
+        # Carts kept in Redis are written to the database first
+        get_cart_store().persist(cart_id)
+        try:
+            if settings.ORDER_QUEUE_ENABLED:
+                return CreateOrder(queued_order=enqueue_order(customer_id, cart_id))
+            order = place_order(customer_id, cart_id)
+        except OutOfStockError as error:
+            raise GraphQLError(str(error), extensions={
+                'code': 'OUT_OF_STOCK', 'items': error.shortages})
+        except OrderError as error:
+            raise GraphQLError(str(error))
+        return CreateOrder(order=order)
 
 
 class UpdateOrder(graphene.Mutation):
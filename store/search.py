@@ -0,0 +1,218 @@
+import bisect
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Value, When
+from .models import Product
+
+
+SEARCH_VERSION_KEY = 'product-search-version'
+
+# Specs from Product.description that are worth matching on
+SEARCH_DESCRIPTION_KEYS = (
+    'brand', 'model', 'type', 'os', 'processor', 'processor_type',
+    'processor_reference', 'gpu', 'gpu_chipset', 'memory', 'memory_type',
+    'drive', 'drive_type', 'screen_size',
+)
+
+TITLE_WEIGHT = 2
+MAX_PREFIX_EXPANSIONS = 50
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    # Accent folding: 'Intégrée' and 'integree' give the same token
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r'[a-z0-9]+', text.lower())
+
+
+def document_tokens(title, description):
+    tokens = tokenize(title) * TITLE_WEIGHT
+    if isinstance(description, dict):
+        for key in SEARCH_DESCRIPTION_KEYS:
+            value = description.get(key)
+            if value:
+                tokens += tokenize(value)
+    return Counter(tokens)
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.lengths = {}
+        self.total_length = 0
+        self.terms = []
+        self.terms_dirty = False
+        self.version = None
+        self.updated_until = None
+
+    def add(self, product_id, title, description):
+        with self.lock:
+            self.remove(product_id)
+            tokens = document_tokens(title, description)
+            for token, frequency in tokens.items():
+                if token not in self.postings:
+                    self.terms_dirty = True
+                self.postings[token][product_id] = frequency
+            self.documents[product_id] = tokens
+            self.lengths[product_id] = sum(tokens.values())
+            self.total_length += self.lengths[product_id]
+
+    def remove(self, product_id):
+        with self.lock:
+            tokens = self.documents.pop(product_id, None)
+            if tokens is None:
+                return
+            for token in tokens:
+                postings = self.postings[token]
+                postings.pop(product_id, None)
+                if not postings:
+                    del self.postings[token]
+                    self.terms_dirty = True
+            self.total_length -= self.lengths.pop(product_id)
+
+    def load(self, queryset):
+        for product_id, title, description, last_update in queryset \
+                .order_by() \
+                .values_list('id', 'title', 'description', 'last_update') \
+                .iterator():
+            self.add(product_id, title, description)
+            if self.updated_until is None or last_update > self.updated_until:
+                self.updated_until = last_update
+
+    def build(self, version):
+        with self.lock:
+            self.reset()
+            self.load(Product.objects.all())
+            self.version = version
+
+    def refresh(self, version):
+        # Catch up with products saved by other processes since the last
+        # build, only the changed rows are re-read. last_update is set before
+        # commit, the window overlaps the previous one so a transaction that
+        # committed after a later one is still picked up
+        with self.lock:
+            queryset = Product.objects.all()
+            if self.updated_until is not None:
+                since = self.updated_until - timedelta(seconds=settings.PRODUCT_SEARCH_REFRESH_OVERLAP)
+                queryset = queryset.filter(last_update__gte=since)
+            self.load(queryset)
+            existing = set(Product.objects.values_list('id', flat=True))
+            for product_id in set(self.documents) - existing:
+                self.remove(product_id)
+            self.version = version
+
+    def expand(self, token, prefix):
+        if not prefix:
+            return [token] if token in self.postings else []
+        if self.terms_dirty:
+            self.terms = sorted(self.postings)
+            self.terms_dirty = False
+        start = bisect.bisect_left(self.terms, token)
+        expansions = []
+        for term in self.terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            expansions.append(term)
+        return expansions
+
+    def search(self, query, limit=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # The last word is still being typed unless followed by a space
+        last_is_prefix = not query[-1:].isspace()
+
+        with self.lock:
+            count = len(self.documents)
+            if count == 0:
+                return []
+            average_length = self.total_length / count
+            scores = defaultdict(float)
+            for position, token in enumerate(tokens):
+                prefix = last_is_prefix and position == len(tokens) - 1
+                for term in self.expand(token, prefix):
+                    postings = self.postings[term]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for product_id, frequency in postings.items():
+                        length = self.lengths[product_id]
+                        scores[product_id] += idf * frequency * (K1 + 1) / (
+                            frequency + K1 * (1 - B + B * length / average_length))
+
+        ranked = sorted(scores, key=lambda product_id: (-scores[product_id], product_id))
+        return ranked[:limit] if limit else ranked
+
+
+index = ProductSearchIndex()
+
+
+def get_search_version():
+    version = cache.get(SEARCH_VERSION_KEY)
+    if version is None:
+        cache.add(SEARCH_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(SEARCH_VERSION_KEY)
+    return version
+
+
+def get_index():
+    version = get_search_version()
+    if index.version is None:
+        index.build(version)
+    elif index.version != version:
+        index.refresh(version)
+    return index
+
+
+def mark_index_changed():
+    try:
+        version = cache.incr(SEARCH_VERSION_KEY)
+    except ValueError:
+        return
+    # Our own change is already applied, skip the refresh if nothing else
+    # happened in between
+    if index.version == version - 1:
+        index.version = version
+
+
+def index_product(product):
+    if index.version is not None:
+        index.add(product.pk, product.title, product.description)
+    mark_index_changed()
+
+
+def unindex_product(product_id):
+    if index.version is not None:
+        index.remove(product_id)
+    mark_index_changed()
+
+
+def search_products(queryset, query):
+    if not tokenize(query):
+        return queryset
+    product_ids = get_index().search(query, limit=settings.PRODUCT_SEARCH_MAX_RESULTS)
+    if not product_ids:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=product_id, then=Value(position))
+          for position, product_id in enumerate(product_ids)],
+        output_field=IntegerField(),
+    )
+    return queryset \
+        .filter(pk__in=product_ids) \
+        .annotate(search_rank=rank) \
+        .order_by('search_rank')
@@ -1,10 +1,194 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from store.models import Customer
+from core.cache_tags import invalidate_tags_on_commit, model_tag, object_tags
+from store.carts import invalidate_cart_summary
+from store.counters import ALL_PRODUCTS, increment_counter
+from store.facets import sync_product_specs
+from store.listings import bulk_refresh, refresh_product_listings, rename_listed_collection
+from store.models import Cart, CartItem, Collection, Customer, Product, Promotion, Review
+from store.search import index_product, unindex_product
+from tags.models import Tag, TaggedItem
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, **kwargs):
  if kwargs['created']:
   Customer.objects.create(user=kwargs['instance'])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_cached_object(sender, instance, **kwargs):
+    invalidate_tags_on_commit(*object_tags(sender, instance.pk))
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def update_products_promotions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # The products of a cleared promotion are only known before
+        instance._cleared_product_ids = list(
+            sender.objects.filter(promotion=instance).values_list('product_id', flat=True))
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = instance._cleared_product_ids
+    else:
+        product_ids = pk_set
+    refresh_product_listings(product_ids)
+    invalidate_tags_on_commit(*[
+        tag for product_id in product_ids for tag in object_tags(Product, product_id)])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_product(sender, instance, **kwargs):
+    invalidate_tags_on_commit(*object_tags(Review, instance.pk), model_tag(Product, instance.product_id))
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_collection(sender, instance, **kwargs):
+    instance._previous_collection_id = None
+    if instance.pk is not None:
+        instance._previous_collection_id = Product.objects \
+            .filter(pk=instance.pk) \
+            .values_list('collection_id', flat=True) \
+            .first()
+
+
+@receiver(post_save, sender=Product)
+def update_product_counters(sender, instance, created, **kwargs):
+    previous = instance._previous_collection_id
+    current = instance.collection_id
+
+    def update():
+        if previous is None:
+            increment_counter(ALL_PRODUCTS, 1)
+            increment_counter(current, 1)
+        elif previous != current:
+            increment_counter(previous, -1)
+            increment_counter(current, 1)
+
+    transaction.on_commit(update)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_product_collection(sender, instance, **kwargs):
+    # DeleteProduct deletes Product(pk=id), its collection is only in the row
+    if instance.collection_id is None:
+        instance.collection_id = Product.objects \
+            .filter(pk=instance.pk) \
+            .values_list('collection_id', flat=True) \
+            .first()
+
+
+@receiver(post_delete, sender=Product)
+def decrement_product_counters(sender, instance, **kwargs):
+    collection_id = instance.collection_id
+    if collection_id is None:
+        # No such product, nothing was deleted
+        return
+
+    def update():
+        increment_counter(ALL_PRODUCTS, -1)
+        increment_counter(collection_id, -1)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, **kwargs):
+    transaction.on_commit(lambda: index_product(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: unindex_product(product_id))
+
+
+@receiver(post_save, sender=Product)
+def update_product_specs(sender, instance, **kwargs):
+    sync_product_specs([instance])
+
+
+@receiver(post_save, sender=Product)
+def update_product_listing(sender, instance, **kwargs):
+    refresh_product_listings([instance.pk])
+
+
+@receiver(post_save, sender=Collection)
+def update_listed_collection(sender, instance, created, **kwargs):
+    if not created:
+        rename_listed_collection(instance)
+
+
+@receiver(pre_delete, sender=Promotion)
+def remember_promotion_products(sender, instance, **kwargs):
+    # The links are gone by post_delete
+    instance._product_ids = list(
+        Product.promotions.through.objects
+        .filter(promotion=instance)
+        .values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def update_promotion_listings(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    product_ids = getattr(instance, '_product_ids', None)
+    if product_ids is None:
+        product_ids = Product.promotions.through.objects \
+            .filter(promotion=instance) \
+            .values_list('product_id', flat=True)
+    refresh_product_listings(product_ids)
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def update_tagged_product_listing(sender, instance, **kwargs):
+    if bulk_refresh.get():
+        return
+    if instance.content_type_id == ContentType.objects.get_for_model(Product).id:
+        refresh_product_listings([instance.object_id])
+
+
+@receiver(post_save, sender=Tag)
+def update_tag_listings(sender, instance, created, **kwargs):
+    if created:
+        return
+    refresh_product_listings(TaggedItem.objects
+                             .filter(tag=instance, content_type=ContentType.objects.get_for_model(Product))
+                             .values_list('object_id', flat=True))
+
+
+@receiver(pre_delete, sender=CartItem)
+def remember_deleted_item_cart(sender, instance, **kwargs):
+    # Items deleted as CartItem(pk=id) don't know their cart
+    if instance.cart_id is None:
+        instance.cart_id = CartItem.objects \
+            .filter(pk=instance.pk) \
+            .values_list('cart_id', flat=True) \
+            .first()
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart(sender, instance, **kwargs):
+    cart_id = instance.cart_id
+    transaction.on_commit(lambda: invalidate_cart_summary(cart_id))
+
+
+@receiver(post_delete, sender=Cart)
+def invalidate_deleted_cart(sender, instance, **kwargs):
+    cart_id = instance.pk
+    transaction.on_commit(lambda: invalidate_cart_summary(cart_id))
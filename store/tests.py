@@ -1,3 +1,919 @@
-from django.test import TestCase
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import WatchError
+from core.testing import GraphQLBudgetTestCase
+from .carts import RedisCartStore, cart_summary_key
+from .facets import SpecFilterSet, extract_specs
+from .fields import keyset_ordering
+from .listings import refresh_product_listings
+from .models import Cart, CartItem, Collection, Order, OrderItem, Product, ProductListing, \
+    ProductSpec, Promotion, QueuedOrder
+from .orders import enqueue_order, place_order, process_order_queue
+from .pricing import effective_price, effective_price_key, get_effective_prices
+from .search import SEARCH_VERSION_KEY, index as search_index, search_products
+from tags.loaders import tags_cache_key
+
+
+def create_catalog(size):
+    collections = [Collection.objects.create(title=title) for title in ('Desktop', 'Laptop')]
+    promotions = [
+        Promotion.objects.create(description=f'Promotion {index}', discount=5 * index)
+        for index in range(1, 3)
+    ]
+    products = []
+    for index in range(size):
+        product = Product.objects.create(
+            title=f'Laptop {index}',
+            description={'brand': 'HP' if index % 2 else 'LENOVO', 'memory': '8 Go'},
+            price=1000 + index,
+            inventory=10,
+            slug=f'laptop-{index}',
+            collection=collections[index % 2],
+        )
+        if index % 3 == 0:
+            product.promotions.add(promotions[index % 2])
+        products.append(product)
+    collections[0].featured_product = products[0]
+    collections[0].save()
+    return products
+
+
+PRODUCTS_QUERY = '''
+    query Products($first: Int) {
+        products(first: $first) {
+            edges {
+                node {
+                    title
+                    price
+                    productsCount
+                    productsCollectionCount
+                    collection { title }
+                    promotions { discount }
+                }
+            }
+            pageInfo { hasNextPage endCursor }
+        }
+    }
+'''
+
+COLLECTIONS_QUERY = '''
+    query Collections {
+        collections {
+            title
+            featuredProduct { title }
+        }
+    }
+'''
+
+CART_QUERY = '''
+    query Cart($id: UUID) {
+        cart(id: $id) {
+            totalPrice
+            itemsNumber
+            appliedPromotions { discount }
+            items {
+                quantity
+                totalPrice
+                product { title collection { title } }
+            }
+        }
+    }
+'''
+
+ADD_TO_CART_MUTATION = '''
+    mutation AddToCart($cartId: UUID!, $productId: Int!) {
+        createCartItem(cartId: $cartId, productId: $productId, quantity: 1) {
+            cartItem { quantity }
+        }
+    }
+'''
+
+ORDERS_QUERY = '''
+    query Orders {
+        orders {
+            paymentStatus
+            customer { phone }
+            items {
+                quantity
+                unitPrice
+                product { title }
+            }
+        }
+    }
+'''
+
+CREATE_ORDER_MUTATION = '''
+    mutation CreateOrder($customerId: Int!, $cartId: UUID!) {
+        createOrder(customerId: $customerId, cartId: $cartId) {
+            order { items { quantity unitPrice } }
+            queuedOrder { id status }
+        }
+    }
+'''
+
+
+class ProductQueriesTest(GraphQLBudgetTestCase):
+    def test_products_within_budget(self):
+        create_catalog(10)
+        data = self.assertOperationWithinBudget(
+            PRODUCTS_QUERY, 'Products', variables={'first': 10})
+        self.assertEqual(len(data['products']['edges']), 10)
+
+    def test_products_queries_do_not_grow_with_page_size(self):
+        create_catalog(40)
+        data = self.assertOperationWithinBudget(
+            PRODUCTS_QUERY, 'Products', variables={'first': 40})
+        self.assertEqual(len(data['products']['edges']), 40)
+
+    def test_collections_within_budget(self):
+        create_catalog(10)
+        data = self.assertOperationWithinBudget(COLLECTIONS_QUERY, 'Collections')
+        self.assertEqual(data['collections'][0]['featuredProduct']['title'], 'Laptop 0')
+
+    def test_delete_product_updates_counts(self):
+        products = create_catalog(4)
+        user = get_user_model().objects.create_user(
+            'staff', 'staff@pcstore.tn', 'password', is_staff=True)
+        self.client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+        counts = self.query(PRODUCTS_QUERY, op_name='Products', variables={'first': 4})
+        self.assertEqual(
+            [edge['node']['productsCollectionCount']
+             for edge in counts.json()['data']['products']['edges']], [2, 2, 2, 2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.query(
+                'mutation DeleteProduct($id: ID) { deleteProduct(id: $id) { product { id } } }',
+                op_name='DeleteProduct', variables={'id': products[2].id})
+        self.assertResponseNoErrors(response)
+        counts = self.query(PRODUCTS_QUERY, op_name='Products', variables={'first': 4})
+        self.assertEqual(
+            [(edge['node']['title'], edge['node']['productsCount'],
+              edge['node']['productsCollectionCount'])
+             for edge in counts.json()['data']['products']['edges']],
+            [('Laptop 0', 3, 1), ('Laptop 1', 3, 2), ('Laptop 3', 3, 2)])
+
+
+class KeysetPaginationTest(GraphQLBudgetTestCase):
+    QUERY = '''
+        query Page($first: Int, $last: Int, $after: String, $before: String, $orderBy: String) {
+            products(first: $first, last: $last, after: $after, before: $before, orderBy: $orderBy) {
+                edges { node { title } }
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+            }
+        }
+    '''
+
+    def page(self, **variables):
+        response = self.query(self.QUERY, op_name='Page', variables=variables)
+        self.assertResponseNoErrors(response)
+        products = response.json()['data']['products']
+        return [edge['node']['title'] for edge in products['edges']], products['pageInfo']
+
+    def expected(self, ordering):
+        return list(ProductListing.objects.order_by(ordering, 'pk').values_list('title', flat=True))
+
+    def test_forward_pages(self):
+        create_catalog(7)
+        # inventory is the same for every product, ties are broken by pk
+        for ordering in ('price', '-price', 'inventory', '-inventory', 'title'):
+            titles, after = [], None
+            while True:
+                page, info = self.page(first=3, after=after, orderBy=ordering)
+                titles += page
+                self.assertEqual(info['hasPreviousPage'], after is not None)
+                if not info['hasNextPage']:
+                    break
+                after = info['endCursor']
+            self.assertEqual(titles, self.expected(ordering), ordering)
+
+    def test_backward_pages(self):
+        create_catalog(7)
+        for ordering in ('-price', 'inventory'):
+            titles, before = [], None
+            while True:
+                page, info = self.page(last=3, before=before, orderBy=ordering)
+                titles = page + titles
+                self.assertEqual(info['hasNextPage'], before is not None)
+                if not info['hasPreviousPage']:
+                    break
+                before = info['startCursor']
+            self.assertEqual(titles, self.expected(ordering), ordering)
+
+    def test_after_and_before(self):
+        create_catalog(7)
+        expected = self.expected('-inventory')
+        first, info = self.page(first=2, orderBy='-inventory')
+        _, end = self.page(first=5, orderBy='-inventory')
+        page, _ = self.page(first=10, after=info['endCursor'], before=end['endCursor'],
+                            orderBy='-inventory')
+        self.assertEqual(first + page, expected[:4])
+
+    def test_unsupported_orderings_are_rejected(self):
+        for ordering in ('collection_title', 'price'):
+            keyset_ordering(ProductListing.objects.order_by(ordering))
+        for ordering in ('collection', 'product__collection__title', '?'):
+            with self.assertRaises(ValueError):
+                keyset_ordering(ProductListing.objects.order_by(ordering))
+
+
+class ProductListingTest(GraphQLBudgetTestCase):
+    QUERY = '''
+        query Products($collection: String) {
+            products(first: 10, collection_Title: $collection, orderBy: "price") {
+                edges { node { title effectivePrice collection { title } } }
+            }
+        }
+    '''
+
+    def test_listing_follows_catalog_changes(self):
+        product = create_catalog(3)[0]
+        self.assertEqual(ProductListing.objects.get(pk=product.pk).effective_price,
+                         Decimal('950.000'))
+
+        promotion = product.promotions.get()
+        promotion.discount = 10
+        promotion.save()
+        product.collection.title = 'Portables'
+        product.collection.save()
+        product.price = 2000
+        product.save()
+
+        with self.assertNumQueries(1):
+            response = self.query(self.QUERY, op_name='Products', variables={'collection': 'Portables'})
+        self.assertResponseNoErrors(response)
+        nodes = [edge['node'] for edge in response.json()['data']['products']['edges']]
+        self.assertEqual(nodes, [
+            {'title': 'Laptop 2', 'effectivePrice': '1002.000', 'collection': {'title': 'Portables'}},
+            {'title': 'Laptop 0', 'effectivePrice': '1800.000', 'collection': {'title': 'Portables'}},
+        ])
+
+    def test_rebuild_command(self):
+        create_catalog(3)
+        ProductListing.objects.all().delete()
+        call_command('rebuild_product_listings', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(ProductListing.objects.count(), 3)
+
+
+class CartQueriesTest(GraphQLBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(20)
+        self.cart = Cart.objects.create()
+
+    def test_cart_within_budget(self):
+        for product in self.products:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        data = self.assertOperationWithinBudget(
+            CART_QUERY, 'Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(len(data['cart']['items']), 20)
+        self.assertEqual(data['cart']['itemsNumber'], 40)
+
+    def test_add_to_cart_within_budget(self):
+        self.assertOperationWithinBudget(
+            ADD_TO_CART_MUTATION, 'AddToCart', max_queries=8,
+            variables={'cartId': str(self.cart.id), 'productId': self.products[0].id})
+        self.assertEqual(self.cart.items.get().quantity, 1)
+
+    def test_summary_invalidated_by_its_products_only(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['totalPrice'], '950.000')
+
+        other = self.products[1]
+        other.price = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            other.save()
+        self.assertIsNotNone(cache.get(cart_summary_key(self.cart.id)))
+
+        product = self.products[0]
+        product.price = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['totalPrice'], '9.500')
+
+    def test_summary_invalidated_by_deleted_items(self):
+        items = [
+            CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+            for product in self.products[1:4]
+        ]
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['itemsNumber'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.query(
+                'mutation DeleteCartItem($id: ID) { deleteCartItem(id: $id) { cartItem { id } } }',
+                op_name='DeleteCartItem', variables={'id': items[0].id})
+        self.assertResponseNoErrors(response)
+        self.assertIsNone(cache.get(cart_summary_key(self.cart.id)))
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['itemsNumber'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem(pk=items[1].pk).delete()
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['itemsNumber'], 1)
+
+    def test_summary_invalidated_by_its_promotions(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=2)
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['totalPrice'], '2002.000')
+
+        promotion = Promotion.objects.get(discount=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[1].promotions.add(promotion)
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['totalPrice'], '1901.900')
+
+        promotion.discount = 50
+        with self.captureOnCommitCallbacks(execute=True):
+            promotion.save()
+        response = self.query(CART_QUERY, op_name='Cart', variables={'id': str(self.cart.id)})
+        self.assertEqual(response.json()['data']['cart']['totalPrice'], '1001.000')
+
+
+class FakeRedis:
+    # The part of redis-py RedisCartStore uses. Keys expire on a clock moved
+    # by the tests, WATCH compares per key write counts
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+        self.clock = 0
+
+    def value(self, key):
+        if self.expires.get(key, self.clock + 1) <= self.clock:
+            self.delete(key)
+        return self.data.get(key)
+
+    def write(self, key, value=None, ex=None):
+        self.versions[key] = self.versions.get(key, 0) + 1
+        if value is not None:
+            self.data[key] = value
+        if ex is not None:
+            self.expires[key] = self.clock + ex
+        return self.data.get(key)
+
+    def exists(self, key):
+        return int(self.value(key) is not None)
+
+    def get(self, key):
+        return self.value(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self.exists(key):
+            return None
+        self.expires.pop(key, None)
+        self.write(key, str(value).encode(), ex)
+        return True
+
+    def incr(self, key):
+        self.write(key, str(int(self.value(key) or 0) + 1).encode())
+        return int(self.data[key])
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+            self.write(key)
+
+    def expire(self, key, seconds):
+        if self.exists(key):
+            self.write(key, ex=seconds)
+
+    def scan_iter(self, match, count=None):
+        prefix = match.rstrip('*')
+        return [key.encode() for key in list(self.data)
+                if key.startswith(prefix) and self.exists(key)]
+
+    def hgetall(self, key):
+        return dict(self.value(key) or {})
+
+    def hget(self, key, field):
+        return (self.value(key) or {}).get(field.encode())
+
+    def hmget(self, key, *fields):
+        return [self.hget(key, field) for field in fields]
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        values = dict(self.value(key) or {})
+        mapping = dict(mapping or {})
+        if field is not None:
+            mapping[field] = value
+        values.update({name.encode(): str(value).encode() for name, value in mapping.items()})
+        self.write(key, values)
+
+    def hdel(self, key, *fields):
+        values = {name: value for name, value in (self.value(key) or {}).items()
+                  if name.decode() not in fields}
+        if values:
+            self.write(key, values)
+        else:
+            self.delete(key)
+
+    def sadd(self, key, *members):
+        self.write(key, (self.value(key) or set()) | {str(member).encode() for member in members})
+
+    def srem(self, key, *members):
+        self.write(key, (self.value(key) or set()) - {str(member).encode() for member in members})
+
+    def spop(self, key, count):
+        members = sorted(self.value(key) or set())[:count]
+        self.srem(key, *[member.decode() for member in members])
+        return members
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+    def __getattr__(self, name):
+        if self.watched is not None and not self.queued:
+            return getattr(self.client, name)
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def reset(self):
+        self.commands = []
+        self.watched = None
+        self.queued = False
+
+    def watch(self, *keys):
+        self.watched = {key: self.client.versions.get(key, 0) for key in keys}
+
+    def unwatch(self):
+        self.reset()
+
+    def multi(self):
+        self.queued = True
+
+    def execute(self):
+        watched, commands = self.watched or {}, self.commands
+        self.reset()
+        if any(self.client.versions.get(key, 0) != version for key, version in watched.items()):
+            raise WatchError('Watched variable changed.')
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+@override_settings(CART_STORE_TTL=100)
+class RedisCartStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = create_catalog(3)
+        self.redis = FakeRedis()
+        self.store = RedisCartStore(self.redis)
+
+    def items(self, cart_id):
+        return [(item.product_id, item.quantity) for item in self.store.get_items(cart_id)]
+
+    def saved_items(self, cart_id):
+        return list(CartItem.objects
+                    .filter(cart_id=cart_id)
+                    .order_by('id')
+                    .values_list('product_id', 'quantity'))
+
+    def test_add_update_delete(self):
+        saved = Cart.objects.create()
+        last_id = CartItem.objects.create(cart=saved, product=self.products[0], quantity=1).id
+        cart = self.store.create_cart()
+        first = self.store.add_item(cart.id, self.products[0].id, 1)
+        again = self.store.add_item(cart.id, self.products[0].id, 2)
+        second = self.store.add_item(cart.id, self.products[1].id, 1)
+        self.assertEqual((first.id, again.id, again.quantity), (last_id + 1, last_id + 1, 3))
+        self.assertEqual(second.id, last_id + 2)
+
+        self.store.update_item(first.id, 5)
+        self.assertEqual(self.items(cart.id), [(self.products[0].id, 5), (self.products[1].id, 1)])
+        self.store.delete_item(first.id)
+        self.assertEqual(self.items(cart.id), [(self.products[1].id, 1)])
+        with self.assertRaises(CartItem.DoesNotExist):
+            self.store.update_item(first.id, 2)
+        self.assertFalse(Cart.objects.filter(pk=cart.id).exists())
+
+    def test_add_during_a_delete(self):
+        cart = self.store.create_cart()
+        item = self.store.add_item(cart.id, self.products[0].id, 1)
+        hmget = self.redis.hmget
+
+        def racing_hmget(*args):
+            values = hmget(*args)
+            if self.store.get_items(cart.id):
+                # Another request deletes the item before this one writes
+                self.store.delete_item(item.id)
+            return values
+
+        with mock.patch.object(self.redis, 'hmget', racing_hmget):
+            added = self.store.add_item(cart.id, self.products[0].id, 2)
+        self.assertNotEqual(added.id, item.id)
+        self.assertEqual([(stored.id, stored.quantity) for stored in self.store.get_items(cart.id)],
+                         [(added.id, 2)])
+
+    def test_item_ids_survive_a_lost_counter(self):
+        cart = self.store.create_cart()
+        item = self.store.add_item(cart.id, self.products[0].id, 1)
+        self.redis.delete(RedisCartStore.ITEM_IDS_KEY)
+        self.assertEqual(self.store.add_item(cart.id, self.products[1].id, 1).id, item.id + 1)
+
+    def test_orphaned_fields_are_skipped(self):
+        cart = self.store.create_cart()
+        item = self.store.add_item(cart.id, self.products[0].id, 1)
+        self.redis.hset(self.store.cart_key(cart.id), f'q:{self.products[1].id}', 4)
+        self.redis.hdel(self.store.cart_key(cart.id), 'created_at')
+        self.assertEqual([stored.id for stored in self.store.get_items(cart.id)], [item.id])
+
+    def test_write_behind_flush(self):
+        cart = self.store.create_cart()
+        item = self.store.add_item(cart.id, self.products[0].id, 1)
+        self.store.add_item(cart.id, self.products[1].id, 2)
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(self.saved_items(cart.id),
+                         [(self.products[0].id, 1), (self.products[1].id, 2)])
+        self.assertEqual(self.store.flush(), 0)
+
+        self.store.update_item(item.id, 3)
+        with mock.patch.object(self.store, 'save', side_effect=DatabaseError), \
+                self.assertLogs('store.carts', 'ERROR'):
+            self.assertEqual(self.store.flush(), 0)
+        self.store.delete_item(item.id)
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(self.saved_items(cart.id), [(self.products[1].id, 2)])
+
+    def test_persist_then_checkout(self):
+        customer = get_user_model().objects.create_user(
+            'buyer', 'buyer@pcstore.tn', 'password').customer
+        cart = self.store.create_cart()
+        self.store.add_item(cart.id, self.products[0].id, 2)
+        self.store.persist(cart.id)
+        self.assertIsNone(self.store.read(cart.id))
+        self.assertEqual(self.saved_items(cart.id), [(self.products[0].id, 2)])
+
+        # Changed again after persist, loaded back from the database
+        self.store.add_item(cart.id, self.products[1].id, 1)
+        self.store.persist(cart.id)
+        order = place_order(customer.id, cart.id)
+        self.assertEqual(
+            sorted(order.orderitem_set.values_list('product_id', 'quantity')),
+            [(self.products[0].id, 2), (self.products[1].id, 1)])
+        self.assertFalse(Cart.objects.filter(pk=cart.id).exists())
+
+    def test_expiry(self):
+        active = self.store.create_cart()
+        item = self.store.add_item(active.id, self.products[0].id, 1)
+        idle = self.store.create_cart()
+        self.store.add_item(idle.id, self.products[0].id, 1)
+        self.store.flush()
+        self.redis.clock += 60
+        self.store.add_item(active.id, self.products[1].id, 1)
+        self.redis.clock += 60
+
+        # Only the cart changed within the TTL is left in Redis, the
+        # other one is read from its last flush
+        self.assertIsNotNone(self.store.read(active.id))
+        self.assertIsNone(self.store.read(idle.id))
+        self.assertEqual(self.items(idle.id), [(self.products[0].id, 1)])
+        self.redis.clock += 100
+        self.assertIsNone(self.store.read(active.id))
+        self.assertEqual(self.items(active.id), [(self.products[0].id, 1)])
+        self.assertEqual(self.store.get_item(item.id).quantity, 1)
+        self.assertEqual(self.store.add_item(active.id, self.products[0].id, 1).quantity, 2)
+
+
+class OrderQueriesTest(GraphQLBudgetTestCase):
+    def test_orders_within_budget(self):
+        products = create_catalog(10)
+        user = get_user_model().objects.create_user(
+            'staff', 'staff@pcstore.tn', 'password', is_staff=True)
+        for _ in range(5):
+            order = Order.objects.create(customer=user.customer)
+            for product in products:
+                OrderItem.objects.create(
+                    order=order, product=product, quantity=1, unit_price=product.price)
+        self.client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+
+        data = self.assertOperationWithinBudget(ORDERS_QUERY, 'Orders')
+        self.assertEqual(len(data['orders']), 5)
+        self.assertEqual(len(data['orders'][0]['items']), 10)
+
+
+class PlaceOrderTest(GraphQLBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(3)
+        self.user = get_user_model().objects.create_user('buyer', 'buyer@pcstore.tn', 'password')
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.cart = Cart.objects.create()
+        for product, quantity in zip(self.products, (1, 4, 10)):
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def create_order(self):
+        return self.query(CREATE_ORDER_MUTATION, op_name='CreateOrder', variables={
+            'customerId': self.user.customer.id, 'cartId': str(self.cart.id)})
+
+    def test_order_decrements_inventory(self):
+        response = self.create_order()
+        self.assertResponseNoErrors(response)
+        items = response.json()['data']['createOrder']['order']['items']
+        self.assertEqual(sorted(item['quantity'] for item in items), [1, 4, 10])
+        self.assertEqual(
+            [product.inventory for product in Product.objects.order_by('id')], [9, 6, 0])
+        self.assertFalse(Cart.objects.filter(pk=self.cart.pk).exists())
+
+    def test_order_charges_effective_prices(self):
+        self.assertResponseNoErrors(self.create_order())
+        self.assertEqual(
+            list(OrderItem.objects.order_by('product_id').values_list('unit_price', flat=True)),
+            [Decimal('950.000'), Decimal('1001.000'), Decimal('1002.000')])
+
+    def test_out_of_stock_items_are_reported(self):
+        Product.objects.filter(pk=self.products[1].pk).update(inventory=2)
+        response = self.create_order()
+        self.assertResponseHasErrors(response)
+        error = response.json()['errors'][0]
+        self.assertEqual(error['extensions']['code'], 'OUT_OF_STOCK')
+        self.assertEqual(error['extensions']['items'], [{
+            'productId': self.products[1].id,
+            'title': 'Laptop 1',
+            'requested': 4,
+            'available': 2,
+        }])
+        self.assertEqual(
+            [product.inventory for product in Product.objects.order_by('id')], [10, 2, 10])
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(Cart.objects.filter(pk=self.cart.pk).exists())
+
+    @override_settings(ORDER_QUEUE_ENABLED=True)
+    def test_queued_order_is_placed_by_worker(self):
+        response = self.create_order()
+        self.assertResponseNoErrors(response)
+        created = response.json()['data']['createOrder']
+        self.assertIsNone(created['order'])
+        self.assertEqual(created['queuedOrder']['status'], 'Q')
+        self.assertEqual(Product.objects.get(pk=self.products[2].pk).inventory, 10)
+
+        self.assertEqual(
+            [queued_order.status for queued_order in process_order_queue()],
+            [QueuedOrder.STATUS_PLACED])
+        self.assertEqual(process_order_queue(), [])
+        queued_order = QueuedOrder.objects.get(pk=created['queuedOrder']['id'])
+        self.assertEqual(queued_order.order.orderitem_set.count(), 3)
+        self.assertEqual(Product.objects.get(pk=self.products[2].pk).inventory, 0)
+
+    @override_settings(ORDER_QUEUE_ENABLED=True)
+    def test_cart_is_queued_once(self):
+        self.assertResponseNoErrors(self.create_order())
+        response = self.create_order()
+        self.assertResponseHasErrors(response)
+        self.assertEqual(
+            response.json()['errors'][0]['message'], 'This cart is already being ordered !!!')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            QueuedOrder.objects.create(customer=self.user.customer, cart_id=self.cart.id)
+        self.assertEqual(QueuedOrder.objects.count(), 1)
+
+    @override_settings(ORDER_QUEUE_MAX_ATTEMPTS=2)
+    def test_unexpected_errors_are_retried(self):
+        queued_order = enqueue_order(self.user.customer.id, self.cart.id)
+        with mock.patch('store.orders.place_order', side_effect=RuntimeError('boom')), \
+                self.assertLogs('store.orders', 'ERROR'):
+            self.assertEqual(
+                [(order.status, order.attempts, order.error) for order in process_order_queue()],
+                [(QueuedOrder.STATUS_QUEUED, 1, 'RuntimeError: boom')])
+            self.assertEqual(
+                [(order.status, order.attempts) for order in process_order_queue()],
+                [(QueuedOrder.STATUS_FAILED, 2)])
+        self.assertEqual(process_order_queue(), [])
+        queued_order.refresh_from_db()
+        self.assertIsNone(queued_order.order)
+        self.assertTrue(Cart.objects.filter(pk=self.cart.pk).exists())
+
+    @override_settings(ORDER_QUEUE_MAX_ATTEMPTS=2)
+    def test_abandoned_claims_run_out_of_attempts(self):
+        queued_order = enqueue_order(self.user.customer.id, self.cart.id)
+        QueuedOrder.objects.filter(pk=queued_order.pk).update(
+            status=QueuedOrder.STATUS_PROCESSING, attempts=2,
+            claimed_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(
+            [(order.status, order.error) for order in process_order_queue()],
+            [(QueuedOrder.STATUS_FAILED, 'Gave up after 2 attempts')])
+        self.assertFalse(Order.objects.exists())
+        # The cart can be checked out again
+        self.assertEqual(enqueue_order(self.user.customer.id, self.cart.id).status,
+                         QueuedOrder.STATUS_QUEUED)
+
+
+class PricingTest(TestCase):
+    def test_stacking_rules(self):
+        price = Decimal('999.999')
+        self.assertEqual(effective_price(price, []), price)
+        with override_settings(PROMOTION_STACKING='best'):
+            self.assertEqual(effective_price(price, [10, 20]), Decimal('799.999'))
+        with override_settings(PROMOTION_STACKING='compound'):
+            self.assertEqual(effective_price(price, [10, 20]), Decimal('719.999'))
+        with override_settings(PROMOTION_STACKING='additive'):
+            self.assertEqual(effective_price(price, [10, 20]), Decimal('699.999'))
+        with override_settings(PROMOTION_STACKING='additive', PROMOTION_MAX_DISCOUNT=25):
+            self.assertEqual(effective_price(price, [10, 20]), Decimal('749.999'))
+        self.assertEqual(effective_price(Decimal('0.005'), [10]), Decimal('0.005'))
+        self.assertEqual(effective_price(Decimal('0.015'), [50]), Decimal('0.008'))
+
+    def test_effective_prices_in_one_query(self):
+        products = create_catalog(6)
+        with self.assertNumQueries(1):
+            prices = get_effective_prices([product.id for product in products])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_effective_prices([product.id for product in products]), prices)
+        self.assertEqual(
+            [prices[product.id]['effective_price'] for product in products],
+            [Decimal('950.000'), Decimal('1001.000'), Decimal('1002.000'),
+             Decimal('902.700'), Decimal('1004.000'), Decimal('1005.000')])
+
+
+class ImportCatalogTest(TestCase):
+    def import_feed(self, rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8') as feed:
+            feed.write(''.join(json.dumps(row) + '\n' for row in rows))
+            feed.flush()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_catalog', feed.name, stdout=StringIO(), stderr=StringIO())
+
+    def row(self, index, **fields):
+        return {'title': f'Laptop {index}', 'slug': f'laptop-{index}', 'price': '1000',
+                'inventory': 10, 'collection': 'Laptop', 'description': {'brand': 'HP'},
+                'images': ['laptop.jpg'], **fields}
+
+    def test_import_drops_cached_tags(self):
+        self.import_feed([self.row(index, tags=[]) for index in range(3)])
+        product_type = ContentType.objects.get_for_model(Product)
+        keys = [tags_cache_key(product_type.id, product.id) for product in Product.objects.all()]
+        self.assertEqual(len(keys), 3)
+        cache.set_many({key: [] for key in keys})
+
+        self.import_feed([self.row(index, tags=['gaming']) for index in range(3)])
+        self.assertEqual(cache.get_many(keys), {})
+
+    def test_tag_import_refreshes_listings_once(self):
+        self.import_feed([self.row(index, tags=['gaming', 'office']) for index in range(3)])
+        with mock.patch('store.management.commands.import_catalog.refresh_product_listings',
+                        wraps=refresh_product_listings) as refresh, \
+                mock.patch('store.signals.handlers.refresh_product_listings') as signal_refresh:
+            self.import_feed([self.row(index, tags=['gaming']) for index in range(3)])
+        self.assertEqual(refresh.call_count, 1)
+        signal_refresh.assert_not_called()
+        self.assertEqual(
+            [[label for _, label in listing.tags]
+             for listing in ProductListing.objects.order_by('product_id')],
+            [['gaming']] * 3)
+
+    def test_import_invalidates_imported_products_only(self):
+        cache.clear()
+        products = create_catalog(2)
+        get_effective_prices([product.id for product in products])
+        self.import_feed([self.row(0, price='900')])
+        self.assertIsNone(cache.get(effective_price_key(products[0].id)))
+        self.assertIsNotNone(cache.get(effective_price_key(products[1].id)))
+        self.assertEqual(get_effective_prices([products[0].id])[products[0].id]['effective_price'],
+                         Decimal('855.000'))
+
+
+class SweepCartsTest(TestCase):
+    def test_expired_carts_are_deleted(self):
+        products = create_catalog(2)
+        for age in (1, 40, 50):
+            cart = Cart.objects.create()
+            CartItem.objects.create(cart=cart, product=products[0], quantity=1)
+            Cart.objects.filter(pk=cart.pk).update(created_at=timezone.now() - timedelta(days=age))
+
+        expired = list(Cart.objects.filter(created_at__lt=timezone.now() - timedelta(days=30)))
+        for cart in expired:
+            cache.set(cart_summary_key(cart.id), {})
+
+        call_command('sweep_carts', '--max-age', '30', '--dry-run', stdout=StringIO())
+        self.assertEqual(Cart.objects.count(), 3)
+        output = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('sweep_carts', '--max-age', '30', '--chunk-size', '1', '--pause', '0',
+                         stdout=output)
+        self.assertIn('2 carts and 2 items deleted in 2 chunks', output.getvalue())
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(CartItem.objects.count(), 1)
+        for cart in expired:
+            self.assertIsNone(cache.get(cart_summary_key(cart.id)))
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        search_index.reset()
+        self.products = create_catalog(6)
+
+    def search(self, query):
+        return [product.title for product in search_products(Product.objects.all(), query)]
+
+    def test_ranked_search(self):
+        Product.objects.filter(pk=self.products[3].pk).update(title='Laptop 3 Gaming Gaming')
+        self.assertEqual(self.search('gaming'), ['Laptop 3 Gaming Gaming'])
+        self.assertEqual(self.search('laptop 3')[0], 'Laptop 3 Gaming Gaming')
+        # Accents are folded and the last word is a prefix
+        self.assertEqual(self.search('Lénov'), ['Laptop 0', 'Laptop 2', 'Laptop 4'])
+        self.assertEqual(self.search('lenov '), [])
+        self.assertEqual(self.search('chromebook'), [])
+        self.assertEqual(len(self.search('  ')), 6)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.search('laptop')
+        product = self.products[1]
+        product.title = 'Zenbook 14'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.search('zenbook'), ['Zenbook 14'])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.search('zenbook'), [])
+
+    def test_refresh_reads_late_commits(self):
+        self.search('laptop')
+        # Saved by another process, committed after the newest row the
+        # index has seen although its last_update is older
+        Product.objects.filter(pk=self.products[2].pk).update(
+            title='Zenbook 14', last_update=search_index.updated_until - timedelta(seconds=10))
+        cache.incr(SEARCH_VERSION_KEY)
+        self.assertEqual(self.search('zenbook'), ['Zenbook 14'])
+
+
+class ProductSpecFilter(SpecFilterSet):
+    class Meta:
+        model = Product
+        fields = []
+
+
+class FacetsTest(GraphQLBudgetTestCase):
+    QUERY = '''
+        query FacetedProducts($brand: String, $memory: String) {
+            products(first: 10, brand: $brand, memory: $memory, orderBy: "title") {
+                facets { key values { value count } }
+                edges { node { title } }
+            }
+        }
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.products = create_catalog(6)
+        product = self.products[5]
+        product.description = {'brand': 'Dell', 'memory': ' 16 Go ', 'gpu_chipset': ''}
+        product.save()
+
+    def facets(self, data):
+        return {
+            facet['key']: [(value['value'], value['count']) for value in facet['values']]
+            for facet in data['products']['facets']
+        }
+
+    def test_specs_follow_descriptions(self):
+        self.assertEqual(
+            sorted(ProductSpec.objects.filter(product=self.products[5]).values_list('key', 'value')),
+            [('brand', 'Dell'), ('memory', '16 Go')])
+        self.assertEqual(extract_specs('not a dict'), {})
+        self.assertEqual(extract_specs({'brand': 'x' * 300, 'model': 'ignored'}), {'brand': 'x' * 255})
+
+    def test_facet_counts(self):
+        response = self.query(self.QUERY, op_name='FacetedProducts')
+        self.assertResponseNoErrors(response)
+        facets = self.facets(response.json()['data'])
+        self.assertEqual(facets['brand'], [('LENOVO', 3), ('HP', 2), ('Dell', 1)])
+        self.assertEqual(facets['memory'], [('8 Go', 5), ('16 Go', 1)])
+        self.assertEqual(facets['gpu_chipset'], [])
+
+    def test_spec_filters(self):
+        # Values of a facet are OR-ed, facets are AND-ed
+        response = self.query(
+            self.QUERY, op_name='FacetedProducts', variables={'brand': 'HP, Dell', 'memory': '8 Go'})
+        self.assertResponseNoErrors(response)
+        data = response.json()['data']
+        self.assertEqual(
+            [edge['node']['title'] for edge in data['products']['edges']], ['Laptop 1', 'Laptop 3'])
+        self.assertEqual(self.facets(data)['brand'], [('HP', 2)])
+
+        queryset = ProductSpecFilter({'brand': 'Dell,LENOVO'}, Product.objects.order_by('id')).qs
+        self.assertEqual([product.title for product in queryset],
+                         ['Laptop 0', 'Laptop 2', 'Laptop 4', 'Laptop 5'])
 
-# Create your tests here.
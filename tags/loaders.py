@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from promise.dataloader import DataLoader
+from core.concurrency import resolve_blocking
+from .models import TaggedItem
+
+
+def tags_cache_key(content_type_id, object_id):
+    return f'tags:{content_type_id}:{object_id}'
+
+
+class TagsLoader(DataLoader):
+    # Tags of a page of objects in one query keyed on
+    # (content_type, object_id), subclasses set the tagged model
+    model = None
+
+    def batch_load_fn(self, keys):
+        return resolve_blocking(self.load_batch, keys)
+
+    def load_batch(self, keys):
+        content_type = ContentType.objects.get_for_model(self.model)
+        object_ids = set(keys)
+        tags = {}
+
+        if settings.TAGS_CACHE_TTL:
+            cache_keys = {
+                tags_cache_key(content_type.id, object_id): object_id
+                for object_id in object_ids}
+            for cache_key, value in cache.get_many(list(cache_keys)).items():
+                tags[cache_keys[cache_key]] = value
+
+        missing = object_ids - set(tags)
+        if missing:
+            loaded = {object_id: [] for object_id in missing}
+            for item in TaggedItem.objects.get_tags_for_many(self.model, missing):
+                loaded[item.object_id].append(item.tag)
+            if settings.TAGS_CACHE_TTL:
+                cache.set_many({
+                    tags_cache_key(content_type.id, object_id): value
+                    for object_id, value in loaded.items()
+                }, settings.TAGS_CACHE_TTL)
+            tags.update(loaded)
+
+        return [tags[key] for key in keys]
@@ -0,0 +1,33 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core.cache_tags import invalidate_tags_on_commit, object_tags
+from tags.loaders import tags_cache_key
+from tags.models import Tag, TaggedItem
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def invalidate_object_tags(sender, instance, **kwargs):
+    key = tags_cache_key(instance.content_type_id, instance.object_id)
+    transaction.on_commit(lambda: cache.delete(key))
+    model = ContentType.objects.get_for_id(instance.content_type_id).model_class()
+    if model is not None:
+        # Tags show up wherever the tagged object does
+        invalidate_tags_on_commit(*object_tags(model, instance.object_id))
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_tag_labels(sender, instance, created, **kwargs):
+    if created:
+        return
+    invalidate_tags_on_commit(*object_tags(Tag, instance.pk))
+    keys = [
+        tags_cache_key(content_type_id, object_id)
+        for content_type_id, object_id in TaggedItem.objects
+        .filter(tag=instance)
+        .values_list('content_type_id', 'object_id')
+    ]
+    transaction.on_commit(lambda: cache.delete_many(keys))